@@ -0,0 +1,85 @@
+"""
+Recall and latency of MEMORY_STORE_QUANTIZATION=int8 against exact float32 search.
+
+    python -m rag_mcp_server.benchmark_quantization --rows 200000
+    python -m rag_mcp_server.benchmark_quantization --vectors embeddings.npy
+
+Without --vectors, rows are drawn from an anisotropic Gaussian mixture so the
+per-dimension scales actually differ, and queries are noisy copies of held-out
+rows. Real embeddings (an (n, dim) .npy file) give the more honest number.
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from .infra.quantized_matrix import QuantizedVectorMatrix
+
+
+def synthetic(rows: int, queries: int, dim: int, clusters: int, seed: int):
+    rng = np.random.default_rng(seed)
+    spread = np.exp(rng.normal(0.0, 0.5, dim)).astype(np.float32)
+    centers = rng.normal(0.0, 1.0, (clusters, dim)).astype(np.float32) * spread
+    data = np.empty((rows + queries, dim), dtype=np.float32)
+    for start in range(0, len(data), 65536):
+        end = min(start + 65536, len(data))
+        labels = rng.integers(0, clusters, end - start)
+        data[start:end] = centers[labels] + rng.normal(0.0, 0.6, (end - start, dim)).astype(np.float32) * spread
+    query_rows = data[rows:] + rng.normal(0.0, 0.3, (queries, dim)).astype(np.float32) * spread
+    return data[:rows], query_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", default="10,64,128,256,512",
+                        help="comma separated QUANTIZED_RERANK_CANDIDATES values to try")
+    parser.add_argument("--vectors", help=".npy file of real embeddings; the last --queries rows become queries")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.vectors:
+        data = np.load(args.vectors, mmap_mode="r").astype(np.float32)
+        corpus, queries = data[:-args.queries], data[-args.queries:]
+    else:
+        corpus, queries = synthetic(args.rows, args.queries, args.dim, args.clusters, args.seed)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        matrix = QuantizedVectorMatrix(directory, initial_capacity=len(corpus))
+        started = time.perf_counter()
+        for start in range(0, len(corpus), 8192):
+            matrix.append(corpus[start:start + 8192])
+        build = time.perf_counter() - started
+
+        vectors, mask = matrix.vectors, matrix.alive
+        codes, scales = matrix.snapshot()
+        k = args.k
+
+        started = time.perf_counter()
+        truth = []
+        for q in queries:
+            scores = vectors @ q
+            top = np.argpartition(-scores, k - 1)[:k]
+            truth.append(set(top.tolist()))
+        exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+        print(f"rows={len(corpus)} dim={matrix.dim} queries={len(queries)} k={k} (built in {build:.1f}s)")
+        print(f"resident scan data: float32 {vectors.nbytes / 2**20:.0f} MiB, int8 {codes.nbytes / 2**20:.0f} MiB")
+        print(f"exact float32: {exact_ms:.2f} ms/query")
+        print(f"{'candidates':>10}  {'recall@' + str(k):>10}  {'ms/query':>9}")
+        for candidates in [int(c) for c in args.candidates.split(",") if c.strip()]:
+            hits = 0
+            started = time.perf_counter()
+            for q, expected in zip(queries, truth):
+                rows, _ = QuantizedVectorMatrix.top_k(q, vectors, codes, scales, mask, None, k, candidates)
+                hits += len(expected.intersection(rows.tolist()))
+            ms = (time.perf_counter() - started) * 1000 / len(queries)
+            print(f"{candidates:>10}  {hits / (k * len(queries)):>10.4f}  {ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+import asyncio
+import numpy as np
+from typing import Dict, List, Optional
 from .models import Document, Chunk, SearchResult
 
 class DocumentProcessor(ABC):
@@ -10,32 +12,70 @@ class DocumentProcessor(ABC):
 
 class Embedder(ABC):
     @abstractmethod
-    async def embed_query(self, text: str) -> List[float]:
-        """Generate embedding for a query string."""
+    async def embed_query(self, text: str) -> np.ndarray:
+        """Generate a 1-D float32 embedding for a query string (empty on failure)."""
         pass
 
     @abstractmethod
-    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Generate embeddings for a list of document chunks."""
+    async def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """Generate a (len(texts), dim) float32 matrix; rows that failed are NaN."""
         pass
 
 class VectorStore(ABC):
+    # Incremented on every add/delete so caches keyed on it go stale automatically
+    generation: int = 0
+    # Whether stored chunks survive a restart; state derived from them should only be persisted if so
+    persistent: bool = True
+
+    def _bump_generation(self):
+        self.generation += 1
+
     @abstractmethod
     async def add_chunks(self, chunks: List[Chunk]):
         """Add chunks to the store."""
         pass
 
     @abstractmethod
-    async def search(self, query_embedding: List[float], limit: int = 5, filters: Optional[dict] = None) -> List[SearchResult]:
-        """Search for similar chunks."""
+    async def search(self, query_embedding: np.ndarray, limit: int = 5, filters: Optional[dict] = None,
+                     with_embeddings: bool = False, **search_params) -> List[SearchResult]:
+        """
+        Search for similar chunks. with_embeddings attaches each hit's stored vector.
+        search_params are index knobs (nprobe, ef_search); stores ignore the ones they lack.
+        """
         pass
 
+    async def search_batch(self, query_embeddings: np.ndarray, limit: int = 5, filters: Optional[dict] = None,
+                           with_embeddings: bool = False, **search_params) -> List[List[SearchResult]]:
+        """
+        search() for each row of a (Q, dim) matrix, results in query order.
+        Stores that can score many queries in one pass override this.
+        """
+        return list(await asyncio.gather(*(
+            self.search(q, limit=limit, filters=filters, with_embeddings=with_embeddings, **search_params)
+            for q in query_embeddings
+        )))
+
     @abstractmethod
-    async def delete_document(self, document_id: str):
-        """Delete all chunks associated with a document ID."""
+    async def delete_document(self, document_id: str, chunk_ids: Optional[List[str]] = None):
+        """Delete all chunks associated with a document ID. chunk_ids, when known, spares a lookup."""
         pass
         
     @abstractmethod
     async def get_document(self, document_id: str) -> Optional[Document]:
         """Retrieve full document text if stored (or reconstructed)."""
         pass
+
+    async def warm_up(self):
+        """Open connections or load state ahead of the first request. Default: nothing to do."""
+        pass
+
+    async def get_chunk_texts(self, chunk_ids: List[str]) -> Optional[Dict[str, str]]:
+        """Text of the given chunks by id, or None if the store cannot fetch chunks by id."""
+        return None
+
+    async def get_embeddings(self, chunk_ids: List[str]) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Stored vectors of the given chunks by id (ids not found are left out),
+        or None if the store cannot fetch vectors by id.
+        """
+        return None
@@ -1,6 +1,7 @@
 from typing import List, Dict, Optional, Any, Union
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from enum import Enum
+import numpy as np
 import time
 
 # --- Domain Models (RAG) ---
@@ -18,18 +19,56 @@ class Document(BaseModel):
     metadata: DocumentMetadata
 
 class Chunk(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     id: str
     document_id: str
     text: str
-    embedding: Optional[List[float]] = None
+    # float32 row, usually a view into the embedder's batch matrix; never serialized
+    embedding: Optional[np.ndarray] = Field(default=None, exclude=True)
+    token_count: Optional[int] = None  # cl100k tokens, set by token-aware chunkers
+    # Character span in the source text, when the chunker can tell
+    char_start: Optional[int] = None
+    char_end: Optional[int] = None
     metadata: DocumentMetadata
 
+class ChunkRecord:
+    """
+    What in-process stores keep per chunk: plain slots, no validation and
+    no embedding (the store's matrix or index holds the vector). Reads the
+    same as a Chunk for everything stores and search results need.
+    """
+    __slots__ = ("id", "document_id", "text", "token_count", "metadata")
+
+    def __init__(self, id: str, document_id: str, text: str, token_count: Optional[int],
+                 metadata: DocumentMetadata):
+        self.id = id
+        self.document_id = document_id
+        self.text = text
+        self.token_count = token_count
+        self.metadata = metadata
+
+    @classmethod
+    def from_chunk(cls, chunk: "Chunk") -> "ChunkRecord":
+        return cls(chunk.id, chunk.document_id, chunk.text, chunk.token_count, chunk.metadata)
+
+    def __getstate__(self):
+        return (self.id, self.document_id, self.text, self.token_count, self.metadata)
+
+    def __setstate__(self, state):
+        self.id, self.document_id, self.text, self.token_count, self.metadata = state
+
 class SearchResult(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     chunk_id: str
     document_id: str
     text: str
     score: float
     metadata: Dict[str, Any]
+    token_count: Optional[int] = None  # recorded at ingest; lets context packing skip re-encoding
+    # Stored float32 vector, only when requested (search(..., with_embeddings=True)); never serialized
+    embedding: Optional[np.ndarray] = Field(default=None, exclude=True)
 
 # --- MCP Protocol Models ---
 
@@ -1,15 +1,21 @@
 import asyncio
 import logging
 from functools import wraps
+from typing import Tuple, Type
 from ..config import get_settings
 
 logger = logging.getLogger(__name__)
 
-def with_retry(func):
+def with_retry(func=None, *, no_retry: Tuple[Type[BaseException], ...] = ()):
     """
     Decorator to retry async functions with exponential backoff.
     Reads API_MAX_RETRIES from settings.
+    Exceptions listed in no_retry propagate immediately so the caller can
+    handle them itself (e.g. split a batch on a rate limit).
     """
+    if func is None:
+        return lambda f: with_retry(f, no_retry=no_retry)
+
     @wraps(func)
     async def wrapper(*args, **kwargs):
         settings = get_settings()
@@ -19,6 +25,8 @@ def with_retry(func):
         for attempt in range(max_retries + 1):
             try:
                 return await func(*args, **kwargs)
+            except no_retry:
+                raise
             except Exception as e:
                 # In production, check for specific exceptions (e.g. RateLimitError, 503)
                 if attempt == max_retries:
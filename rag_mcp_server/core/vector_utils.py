@@ -0,0 +1,47 @@
+import base64
+import numpy as np
+from typing import Iterable, List, Optional, Sequence
+from .models import Chunk
+
+# Embeddings travel as float32 numpy buffers from the embedder to the vector
+# store; Python lists only appear where a client library or wire format asks
+# for them.
+
+
+def to_matrix(vectors: Iterable[Optional[Sequence[float]]], count: Optional[int] = None) -> np.ndarray:
+    """
+    Stack vectors into one (n, dim) float32 matrix. Missing or empty vectors
+    (provider failures) become NaN rows; if none succeeded the matrix has dim 0.
+    """
+    vectors = list(vectors)
+    n = len(vectors) if count is None else count
+    dim = next((len(v) for v in vectors if v is not None and len(v)), 0)
+    matrix = np.full((n, dim), np.nan, dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        if vector is not None and len(vector) == dim and dim:
+            matrix[i] = vector
+    return matrix
+
+
+def decode_base64(data: str) -> np.ndarray:
+    """float32 vector from the base64 encoding_format of OpenAI-compatible APIs."""
+    return np.frombuffer(base64.b64decode(data), dtype="<f4")
+
+
+def valid_rows(matrix: np.ndarray) -> np.ndarray:
+    """Boolean mask of rows holding a usable embedding."""
+    if matrix.ndim != 2 or matrix.shape[1] == 0:
+        return np.zeros(len(matrix), dtype=bool)
+    return np.isfinite(matrix).all(axis=1)
+
+
+def attach_embeddings(chunks: List[Chunk], matrix: np.ndarray):
+    """Point each chunk at its row of the embedder's matrix (no copy); failed rows leave None."""
+    ok = valid_rows(matrix)
+    for i, chunk in enumerate(chunks):
+        chunk.embedding = matrix[i] if ok[i] else None
+
+
+def stack_embeddings(chunks: List[Chunk]) -> np.ndarray:
+    """(n, dim) float32 matrix of the chunks' embeddings, for a store's bulk insert."""
+    return np.stack([np.asarray(c.embedding, dtype=np.float32) for c in chunks])
@@ -1,24 +1,47 @@
+import asyncio
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from typing import List, Optional, Dict
 import chromadb
 from chromadb.utils import embedding_functions
 from ..core.interfaces import VectorStore
 from ..core.models import Chunk, SearchResult, Document
+from ..core.vector_utils import stack_embeddings
 from ..config import get_settings
 import uuid
 
+@lru_cache()
+def _shared_client(path: str):
+    # One client per process and directory; Chroma's own state isn't meant to be opened twice
+    return chromadb.PersistentClient(path=path)
+
+@lru_cache()
+def _executor(threads: int) -> ThreadPoolExecutor:
+    # Chroma's client is synchronous; its calls run here so they never block the event loop
+    return ThreadPoolExecutor(max_workers=threads, thread_name_prefix="chroma")
+
 class ChromaVectorStore(VectorStore):
     def __init__(self):
         settings = get_settings()
         # Using persistent client
-        self.client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
+        self.client = _shared_client(settings.CHROMA_PERSIST_DIRECTORY)
         self.collection = self.client.get_or_create_collection(name="rag_documents")
+        self._executor = _executor(settings.CHROMA_EXECUTOR_THREADS)
+        self._batch_size = settings.VECTOR_DB_UPSERT_BATCH_SIZE
+        self._concurrency = settings.VECTOR_DB_UPSERT_CONCURRENCY
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
         
     async def add_chunks(self, chunks: List[Chunk]):
+        chunks = [c for c in chunks if c.embedding is not None]
         if not chunks:
             return
             
         ids = [c.id for c in chunks]
-        embeddings = [c.embedding for c in chunks] # Chroma handles None? No, we need embeddings.
+        embeddings = stack_embeddings(chunks) # Chroma accepts the float32 matrix as is
         documents = [c.text for c in chunks]
         metadatas = []
         
@@ -29,67 +52,115 @@ class ChromaVectorStore(VectorStore):
                 "filename": c.metadata.filename,
                 "created_at": c.metadata.created_at,
             }
+            if c.token_count is not None:
+                meta["token_count"] = c.token_count
             if c.metadata.extra:
                 for k, v in c.metadata.extra.items():
                     meta[k] = str(v) # Ensure primitive types
             metadatas.append(meta)
 
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            documents=documents,
-            metadatas=metadatas
-        )
+        # Size-bounded batches, a few in flight at once
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def upsert(start: int):
+            end = start + self._batch_size
+            async with semaphore:
+                await self._run(
+                    self.collection.upsert,
+                    ids=ids[start:end],
+                    embeddings=embeddings[start:end],
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end]
+                )
+
+        await asyncio.gather(*(upsert(start) for start in range(0, len(ids), self._batch_size)))
+        self._bump_generation()
 
-    async def search(self, query_embedding: List[float], limit: int = 5, filters: Optional[dict] = None) -> List[SearchResult]:
+    async def search(self, query_embedding: np.ndarray, limit: int = 5, filters: Optional[dict] = None,
+                     with_embeddings: bool = False, **search_params) -> List[SearchResult]:
+        queries = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+        return (await self.search_batch(queries, limit, filters, with_embeddings))[0]
+
+    async def search_batch(self, query_embeddings: np.ndarray, limit: int = 5, filters: Optional[dict] = None,
+                           with_embeddings: bool = False, **search_params) -> List[List[SearchResult]]:
+        if len(query_embeddings) == 0:
+            return []
         # Translate filters to Chroma format
         # Chroma filter: {"metadata_field": "value"} or {"metadata_field": {"$eq": "value"}}
         chroma_filter = filters if filters else None
-        
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
+
+        results = await self._run(
+            self.collection.query,
+            query_embeddings=np.asarray(query_embeddings, dtype=np.float32),
             n_results=limit,
-            where=chroma_filter
+            where=chroma_filter,
+            include=["documents", "metadatas", "distances", *(["embeddings"] if with_embeddings else [])]
         )
-        
+
         # Parse results
-        search_results = []
         if not results['ids']:
-            return []
-            
-        count = len(results['ids'][0])
-        for i in range(count):
-            meta = results['metadatas'][0][i]
-            search_results.append(SearchResult(
-                chunk_id=results['ids'][0][i],
-                document_id=meta.get("document_id"),
-                text=results['documents'][0][i],
-                # Chroma distance is not cosine similarity score directly, often L2 or Cosine Distance
-                # For this generic interface, we just pass the distance/score. 
-                score=results['distances'][0][i] if results['distances'] else 0.0,
-                metadata=meta
-            ))
-            
-        return search_results
+            return [[] for _ in range(len(query_embeddings))]
 
-    async def delete_document(self, document_id: str):
-        self.collection.delete(
-            where={"document_id": document_id}
-        )
+        batches = []
+        for q, ids in enumerate(results['ids']):
+            search_results = []
+            for i in range(len(ids)):
+                meta = results['metadatas'][q][i]
+                search_results.append(SearchResult(
+                    chunk_id=ids[i],
+                    document_id=meta.get("document_id"),
+                    text=results['documents'][q][i],
+                    # Chroma distance is not cosine similarity score directly, often L2 or Cosine Distance
+                    # For this generic interface, we just pass the distance/score.
+                    score=results['distances'][q][i] if results['distances'] else 0.0,
+                    token_count=meta.pop("token_count", None),
+                    embedding=np.asarray(results['embeddings'][q][i], dtype=np.float32) if with_embeddings else None,
+                    metadata=meta
+                ))
+            batches.append(search_results)
+
+        return batches
+
+    async def delete_document(self, document_id: str, chunk_ids: Optional[List[str]] = None):
+        if chunk_ids is not None:
+            await self._run(self.collection.delete, ids=chunk_ids)
+        else:
+            await self._run(
+                self.collection.delete,
+                where={"document_id": document_id}
+            )
+        self._bump_generation()
+
+    async def get_chunk_texts(self, chunk_ids: List[str]) -> Dict[str, str]:
+        if not chunk_ids:
+            return {}
+        results = await self._run(self.collection.get, ids=chunk_ids, include=["documents"])
+        return dict(zip(results['ids'], results['documents']))
+
+    async def get_embeddings(self, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        if not chunk_ids:
+            return {}
+        results = await self._run(self.collection.get, ids=chunk_ids, include=["embeddings"])
+        return {cid: np.asarray(vector, dtype=np.float32) for cid, vector in zip(results['ids'], results['embeddings'])}
 
     async def get_document(self, document_id: str) -> Optional[Document]:
         # Retrieve all chunks for doc
-        results = self.collection.get(
+        results = await self._run(
+            self.collection.get,
             where={"document_id": document_id}
         )
         
         if not results['ids']:
             return None
             
-        # Reconstruct text
-        full_text = "\n\n".join(results['documents'])
+        # Reconstruct text in chunk order (extra metadata is stored as strings)
+        ordered = sorted(
+            zip(results['documents'], results['metadatas']),
+            key=lambda item: int(item[1].get("chunk_index", 0))
+        )
+        full_text = "\n\n".join(text for text, _ in ordered)
         # Taking metadata from first chunk
-        meta = results['metadatas'][0]
+        meta = ordered[0][1]
         
         from ..core.models import DocumentMetadata
         
@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+from ..core.models import Chunk, DocumentMetadata
+
+# (chunk id, char start, char end) in document order; offsets may be None
+ChunkEntry = Tuple[str, Optional[int], Optional[int]]
+
+
+class DocumentRegistry:
+    """
+    document_id -> ordered chunk ids, character offsets and source metadata.
+
+    Kept beside the vector store (in SQLite, in memory unless a path is
+    given) so document reads and deletes cost O(chunks in the document)
+    whatever the backend, and reconstruction follows ingest order instead
+    of whatever order the store returns chunks in. Near-duplicate chunks
+    that were linked instead of stored are registered too.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self._db_lock = threading.Lock()
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                document_id TEXT PRIMARY KEY,
+                metadata TEXT NOT NULL,
+                chunk_count INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                document_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL,
+                char_start INTEGER,
+                char_end INTEGER,
+                PRIMARY KEY (document_id, position)
+            );
+        """)
+        self._db.commit()
+
+    def add(self, chunks: List[Chunk]):
+        """Register documents from their complete, ordered chunk lists (blocking)."""
+        documents: Dict[str, List[Chunk]] = {}
+        for chunk in chunks:
+            documents.setdefault(chunk.document_id, []).append(chunk)
+        with self._db_lock:
+            for document_id, doc_chunks in documents.items():
+                # Re-ingesting under the same id replaces the previous layout
+                self._db.execute("DELETE FROM document_chunks WHERE document_id = ?", (document_id,))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO documents (document_id, metadata, chunk_count) VALUES (?, ?, ?)",
+                    (document_id, doc_chunks[0].metadata.model_dump_json(), len(doc_chunks))
+                )
+                self._db.executemany(
+                    "INSERT INTO document_chunks (document_id, position, chunk_id, char_start, char_end) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(document_id, i, c.id, c.char_start, c.char_end) for i, c in enumerate(doc_chunks)]
+                )
+            self._db.commit()
+
+    def get(self, document_id: str) -> Optional[Tuple[DocumentMetadata, List[ChunkEntry]]]:
+        """(metadata, chunk entries in order), or None if the document is not registered (blocking)."""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT metadata FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            entries = self._db.execute(
+                "SELECT chunk_id, char_start, char_end FROM document_chunks WHERE document_id = ? ORDER BY position",
+                (document_id,)
+            ).fetchall()
+        return DocumentMetadata.model_validate_json(row[0]), entries
+
+    def remove(self, document_id: str):
+        with self._db_lock:
+            self._db.execute("DELETE FROM document_chunks WHERE document_id = ?", (document_id,))
+            self._db.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+            self._db.commit()
+
+    def count(self) -> int:
+        with self._db_lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    @staticmethod
+    def assemble(entries: List[ChunkEntry], texts: Dict[str, str]) -> str:
+        """
+        Document text from its chunks in order. Where offsets show two chunks
+        overlapping, the repeated prefix is dropped; gaps (separators the
+        chunker stripped) become a blank line, as do chunks without offsets.
+        """
+        parts: List[str] = []
+        previous_end: Optional[int] = None
+        for chunk_id, start, end in entries:
+            text = texts.get(chunk_id)
+            if text is None:
+                continue
+            separator = "\n\n" if parts else ""
+            if previous_end is not None and start is not None:
+                if start < previous_end:
+                    text = text[previous_end - start:]
+                    separator = ""
+                elif start == previous_end:
+                    separator = ""
+            parts.append(separator + text)
+            previous_end = end
+        return "".join(parts)
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import numpy as np
+import tiktoken
+from typing import Awaitable, Callable, List
+from openai import RateLimitError
+from ..core.retry_utils import with_retry
+from ..core.vector_utils import to_matrix
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBatcher:
+    """
+    Splits an embedding call into requests bounded by total tokens and input
+    count, runs them concurrently under a semaphore and writes the vectors,
+    in the original order, into one float32 matrix.
+
+    A rate limit (429) on a multi-input request splits it in half instead of
+    retrying the whole request; single inputs fall back to with_retry backoff.
+    """
+    def __init__(self, request_fn: Callable[[List[str]], Awaitable[np.ndarray]],
+                 max_tokens_per_request: int, max_inputs_per_request: int,
+                 max_tokens_per_input: int, max_concurrency: int):
+        self._request = with_retry(request_fn, no_retry=(RateLimitError,))
+        self._request_with_backoff = with_retry(request_fn)
+        self.max_tokens_per_request = max_tokens_per_request
+        self.max_inputs_per_request = max_inputs_per_request
+        self.max_tokens_per_input = max_tokens_per_input
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._encoding = tiktoken.get_encoding("cl100k_base")
+
+    def _pack(self, texts: List[str]) -> List[List[int]]:
+        """Greedy, order-preserving packing of text indices into requests."""
+        token_lists = self._encoding.encode_ordinary_batch(texts)
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        for i, tokens in enumerate(token_lists):
+            n_tokens = len(tokens)
+            if n_tokens > self.max_tokens_per_input:
+                logger.warning(f"Truncating embedding input {i} from {n_tokens} to {self.max_tokens_per_input} tokens")
+                texts[i] = self._encoding.decode(tokens[:self.max_tokens_per_input])
+                n_tokens = self.max_tokens_per_input
+            if current and (current_tokens + n_tokens > self.max_tokens_per_request
+                            or len(current) >= self.max_inputs_per_request):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += n_tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _run(self, texts: List[str]) -> np.ndarray:
+        try:
+            async with self._semaphore:
+                return await self._request(texts)
+        except RateLimitError:
+            if len(texts) == 1:
+                async with self._semaphore:
+                    return await self._request_with_backoff(texts)
+            mid = len(texts) // 2
+            logger.warning(f"Rate limited on {len(texts)} inputs, splitting request")
+            left, right = await asyncio.gather(self._run(texts[:mid]), self._run(texts[mid:]))
+            return to_matrix([*left, *right])
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        texts = list(texts)
+        batches = self._pack(texts)
+        results = await asyncio.gather(*[self._run([texts[i] for i in batch]) for batch in batches])
+
+        dim = max(vectors.shape[1] for vectors in results)
+        embeddings = np.full((len(texts), dim), np.nan, dtype=np.float32)
+        for batch, vectors in zip(batches, results):
+            if vectors.shape[1] == dim:
+                embeddings[batch] = vectors
+        return embeddings
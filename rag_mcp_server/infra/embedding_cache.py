@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from ..core.interfaces import Embedder
+from ..core.vector_utils import to_matrix, valid_rows
+
+logger = logging.getLogger(__name__)
+
+class CachingEmbedder(Embedder):
+    """
+    Embedder decorator keyed by (model, sha256(text)).
+
+    Lookups go to an in-process LRU first, then an optional SQLite table of
+    float32 blobs; only texts missing from both reach the wrapped embedder,
+    and duplicates within one call are embedded once.
+    """
+    def __init__(self, inner: Embedder, model: str, max_items: int = 50000, db_path: Optional[str] = None):
+        self.inner = inner
+        self.model = model
+        self.max_items = max_items
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lru_lock = threading.Lock()
+
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+            """)
+            self._db.commit()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    # --- Memory tier ---
+
+    def _lru_get(self, key: str) -> Optional[np.ndarray]:
+        with self._lru_lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+            return vec
+
+    def _lru_put(self, key: str, vec: np.ndarray):
+        with self._lru_lock:
+            self._lru[key] = vec
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_items:
+                self._lru.popitem(last=False)
+
+    # --- Disk tier (blocking; run in executor) ---
+
+    def _db_get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._db_lock:
+            # Stay below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._db.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model, *batch]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def _db_put_many(self, items: Dict[str, np.ndarray]):
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(self.model, key, vec.tobytes()) for key, vec in items.items()]
+            )
+            self._db.commit()
+
+    async def _lookup(self, texts: List[str], query: bool = False) -> List[Optional[np.ndarray]]:
+        keys = [self._hash(t) for t in texts]
+        vectors = [self._lru_get(k) for k in keys]
+        self.memory_hits += sum(v is not None for v in vectors)
+
+        missing = list({k for k, v in zip(keys, vectors) if v is None})
+        if missing and self._db is not None:
+            loop = asyncio.get_event_loop()
+            found = await loop.run_in_executor(None, self._db_get_many, missing)
+            for i, key in enumerate(keys):
+                if vectors[i] is None and key in found:
+                    vectors[i] = found[key]
+                    self.disk_hits += 1
+            for key, vec in found.items():
+                self._lru_put(key, vec)
+
+        missing_idx = [i for i, v in enumerate(vectors) if v is None]
+        self.misses += len(missing_idx)
+        if not missing_idx:
+            return vectors
+
+        # Embed each distinct missing text once
+        unique: Dict[str, str] = {}
+        for i in missing_idx:
+            unique.setdefault(keys[i], texts[i])
+        if query:
+            embedded = to_matrix([await self.inner.embed_query(texts[0])])
+        else:
+            embedded = await self.inner.embed_documents(list(unique.values()))
+
+        fresh: Dict[str, np.ndarray] = {}
+        # Providers signal failures with empty or NaN vectors; never cache those
+        ok = valid_rows(embedded)
+        for i, key in enumerate(unique.keys()):
+            if ok[i]:
+                # Own copy, so cached rows don't pin the whole batch matrix
+                fresh[key] = embedded[i].copy()
+                self._lru_put(key, fresh[key])
+        if fresh and self._db is not None:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._db_put_many, fresh)
+
+        for i in missing_idx:
+            vectors[i] = fresh.get(keys[i])
+        return vectors
+
+    async def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return to_matrix(await self._lookup(texts))
+
+    async def embed_query(self, text: str) -> np.ndarray:
+        vec = (await self._lookup([text], query=True))[0]
+        return vec if vec is not None else np.empty(0, dtype=np.float32)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "model": self.model,
+            "lookups": lookups,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self._lru),
+        }
@@ -1,27 +1,29 @@
+import importlib
 from ..core.interfaces import VectorStore
 from ..config import get_settings
-from .vector_store import InMemoryVectorStore
-from .chroma_vector_store import ChromaVectorStore
-from .qdrant_vector_store import QdrantVectorStore
-from .pg_vector_store import PgVectorStore
 import logging
 
 logger = logging.getLogger(__name__)
 
+# VECTOR_STORE_TYPE -> (module in this package, class). Only the selected
+# backend is imported, so e.g. the memory store never loads chromadb,
+# qdrant_client, asyncpg or faiss.
+_VECTOR_STORES = {
+    "memory": ("vector_store", "InMemoryVectorStore"),
+    "chroma": ("chroma_vector_store", "ChromaVectorStore"),
+    "qdrant": ("qdrant_vector_store", "QdrantVectorStore"),
+    "postgres": ("pg_vector_store", "PgVectorStore"),
+    "faiss": ("faiss_vector_store", "FaissVectorStore"),
+}
+
 def get_vector_store() -> VectorStore:
     settings = get_settings()
     store_type = settings.VECTOR_STORE_TYPE.lower()
-    
+
     logger.info(f"Initializing Vector Store: {store_type}")
-    
-    if store_type == "chroma":
-        return ChromaVectorStore()
-    elif store_type == "qdrant":
-        return QdrantVectorStore()
-    elif store_type == "postgres":
-        return PgVectorStore()
-    elif store_type == "memory" or store_type == "faiss": # Keeping faiss config mapping to memory/simple implementation for now
-        return InMemoryVectorStore()
-    else:
+
+    if store_type not in _VECTOR_STORES:
         logger.warning(f"Unknown vector store type '{store_type}', defaulting to InMemory")
-        return InMemoryVectorStore()
+        store_type = "memory"
+    module, name = _VECTOR_STORES[store_type]
+    return getattr(importlib.import_module(f".{module}", __package__), name)()
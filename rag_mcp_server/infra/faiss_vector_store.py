@@ -2,133 +2,509 @@ import faiss
 import numpy as np
 import pickle
 import os
-from typing import List, Optional
-from ..core.interfaces import VectorStore, Document
-from ..core.models import SearchResult
+import threading
+import logging
+from collections import defaultdict
+from typing import List, Optional, Dict, Set
+from ..core.interfaces import VectorStore
+from ..core.models import Chunk, ChunkRecord, SearchResult, Document
+from ..core.vector_utils import stack_embeddings
 from ..config import get_settings
+from .metadata_index import MetadataIndex
+
+logger = logging.getLogger(__name__)
+
+IVF_KINDS = ("ivf_flat", "ivf_pq")
 
 class FaissVectorStore(VectorStore):
-    def __init__(self, index_file: str = "faiss_index.bin", doc_store_file: str = "doc_store.pkl", dimension: int = 1536):
+    """
+    FAISS store keyed by chunk. Vectors live in an IndexIDMap2 so deletes use
+    remove_ids instead of a rebuild. Every add/delete is appended to a
+    write-ahead log; the full index and chunk table are only rewritten every
+    FAISS_SNAPSHOT_INTERVAL operations.
+
+    FAISS_INDEX_TYPE selects exact search (flat) or an ANN index. IVF modes
+    stay flat until FAISS_TRAIN_THRESHOLD chunks exist, then train in the
+    background and retrain whenever the corpus grows FAISS_RETRAIN_GROWTH
+    times. HNSW can't remove vectors, so deletes are tombstoned and the graph
+    is rebuilt once VECTOR_STORE_COMPACTION_RATIO of it is dead.
+
+    PQ codes only approximate the vectors, so with ivf_pq every vector is also
+    written as float32 to faiss_vectors.f32 (row = int id) and retraining
+    reads those rows instead of reconstructing from the codes.
+    """
+    def __init__(self, index_file: str = "faiss_index.bin", doc_store_file: str = "doc_store.pkl", wal_file: str = "faiss_wal.log", dimension: int = 1536,
+                 vectors_file: str = "faiss_vectors.f32"):
         settings = get_settings()
         self.storage_dir = settings.STORAGE_DIR
         if not os.path.exists(self.storage_dir):
             os.makedirs(self.storage_dir)
-            
+
         self.index_path = os.path.join(self.storage_dir, index_file)
         self.doc_path = os.path.join(self.storage_dir, doc_store_file)
+        self.wal_path = os.path.join(self.storage_dir, wal_file)
+        self.vectors_path = os.path.join(self.storage_dir, vectors_file)
         self.dimension = dimension
-        
-        self.docs = {} # id -> Document
-        self.id_map = {} # int_id -> str_uuid
-        
+        self.snapshot_interval = settings.FAISS_SNAPSHOT_INTERVAL
+        self.index_type = settings.FAISS_INDEX_TYPE.lower()
+
+        self.chunks: Dict[str, ChunkRecord] = {} # chunk_id -> record (embedding lives in the index)
+        self.id_map: Dict[int, str] = {} # int_id -> chunk_id
+        self.chunk_ids: Dict[str, int] = {} # chunk_id -> int_id
+        self._document_chunks: Dict[str, Set[str]] = defaultdict(set) # document_id -> chunk_ids
+        self._metadata_index = MetadataIndex() # keyed by int_id
+        self._next_id = 0
+        self._seq = 0 # last WAL sequence number applied
+        self._ops_since_snapshot = 0
+        self._index_kind = "flat" # what self.index currently is
+        self._trained_size = 0 # chunks present when the IVF index was last trained
+        self._deleted: Set[int] = set() # HNSW tombstones, excluded at search time
+        self._rebuild_ops: Optional[list] = None # index ops made while a rebuild runs
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        # Original float32 rows (ivf_pq only); ids below _raw_from predate the file
+        self._raw_fd: Optional[int] = None
+        self._raw_from = 0
+        self._raw_warned = False
+        if self.index_type == "ivf_pq":
+            self._raw_fd = os.open(self.vectors_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        self._wal = open(self.wal_path, "ab")
         self._load()
+        self._maybe_rebuild()
+
+    def _new_index(self, dimension: int):
+        return self._build_index("flat", dimension)
+
+    # --- Index construction ---
+
+    def _build_index(self, kind: str, dimension: int, train_vectors: Optional[np.ndarray] = None):
+        settings = get_settings()
+        if kind == "hnsw":
+            hnsw = faiss.IndexHNSWFlat(dimension, settings.FAISS_HNSW_M)
+            hnsw.hnsw.efConstruction = settings.FAISS_HNSW_EF_CONSTRUCTION
+            hnsw.hnsw.efSearch = settings.FAISS_HNSW_EF_SEARCH
+            return faiss.IndexIDMap2(hnsw)
+
+        if kind in IVF_KINDS:
+            n = len(train_vectors)
+            nlist = settings.FAISS_NLIST or int(4 * np.sqrt(n))
+            nlist = max(1, min(nlist, n))
+            quantizer = faiss.IndexFlatL2(dimension)
+            if kind == "ivf_pq":
+                # Sub-quantizer count must divide the dimension
+                m = max(d for d in range(1, min(settings.FAISS_PQ_M, dimension) + 1) if dimension % d == 0)
+                index = faiss.IndexIVFPQ(quantizer, dimension, nlist, m, settings.FAISS_PQ_NBITS)
+            else:
+                index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+            sample = train_vectors
+            if n > nlist * 256:
+                sample = train_vectors[np.random.default_rng(0).choice(n, nlist * 256, replace=False)]
+            index.train(sample)
+            index.nprobe = settings.FAISS_NPROBE
+            # A hashtable direct map keeps remove_ids/reconstruct working with our int ids
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+            return index
+
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+
+    def _target_kind(self) -> str:
+        if self.index_type in IVF_KINDS and len(self.id_map) < get_settings().FAISS_TRAIN_THRESHOLD:
+            return "flat"
+        if self.index_type in IVF_KINDS or self.index_type == "hnsw":
+            return self.index_type
+        return "flat"
+
+    def _maybe_rebuild(self):
+        # Called with the lock held (or from __init__)
+        if self._rebuilding or not self.id_map:
+            return
+        settings = get_settings()
+        target = self._target_kind()
+        live = len(self.id_map)
+        if target != self._index_kind:
+            reason = f"switching {self._index_kind} -> {target}"
+        elif target in IVF_KINDS and live >= self._trained_size * settings.FAISS_RETRAIN_GROWTH:
+            reason = f"corpus grew from {self._trained_size} to {live} since training"
+        elif target == "hnsw" and len(self._deleted) > live * settings.VECTOR_STORE_COMPACTION_RATIO:
+            reason = f"{len(self._deleted)} tombstoned vectors"
+        else:
+            return
+
+        ids = np.fromiter(self.id_map.keys(), dtype=np.int64, count=live)
+        if self._index_kind == "ivf_pq":
+            # Retraining on PQ reconstructions would compound the quantization error
+            if self._raw_fd is None or int(ids.min()) < self._raw_from:
+                if not self._raw_warned:
+                    logger.warning(f"Not rebuilding FAISS ivf_pq index ({reason}): original vectors of chunks "
+                                   f"added before {self.vectors_path} existed are unavailable; re-ingest to retrain")
+                    self._raw_warned = True
+                return
+            vectors = self._read_raw(ids)
+        else:
+            vectors = self.index.reconstruct_batch(ids)
+            if self._raw_fd is not None and self._raw_from > 0:
+                # The current index is exact, so older rows can still be recovered
+                self._backfill_raw(ids, vectors)
+        logger.info(f"Rebuilding FAISS index in background: {reason}")
+        self._rebuilding = True
+        self._rebuild_ops = []
+        threading.Thread(target=self._rebuild, args=(target, ids, vectors), name="faiss-rebuild", daemon=True).start()
+
+    def _rebuild(self, kind: str, ids: np.ndarray, vectors: np.ndarray):
+        try:
+            # Training and bulk insertion happen without the lock; only the
+            # ops that raced with us are replayed while holding it.
+            index = self._build_index(kind, self.dimension, vectors)
+            index.add_with_ids(vectors, ids)
+            with self._lock:
+                deleted: Set[int] = set()
+                for op, op_vectors, op_ids in self._rebuild_ops:
+                    if op == "add":
+                        index.add_with_ids(op_vectors, op_ids)
+                    elif kind == "hnsw":
+                        deleted.update(op_ids.tolist())
+                    else:
+                        index.remove_ids(op_ids)
+                self.index, self._index_kind, self._deleted = index, kind, deleted
+                self._trained_size = len(ids) if kind in IVF_KINDS else 0
+                self._snapshot()
+            logger.info(f"FAISS index rebuilt as {kind} with {index.ntotal} vectors")
+        except Exception as e:
+            logger.error(f"FAISS index rebuild failed: {e}")
+        finally:
+            with self._lock:
+                self._rebuild_ops = None
+                self._rebuilding = False
+
+    def _write_raw(self, vectors: np.ndarray, first_id: int):
+        # Positional, so replaying a WAL record rewrites the same rows
+        row = np.ascontiguousarray(vectors, dtype=np.float32)
+        os.pwrite(self._raw_fd, row.tobytes(), first_id * self.dimension * 4)
+
+    def _backfill_raw(self, ids: np.ndarray, vectors: np.ndarray):
+        os.ftruncate(self._raw_fd, max(os.fstat(self._raw_fd).st_size, self._next_id * self.dimension * 4))
+        rows = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self._next_id, self.dimension))
+        rows[ids] = vectors
+        rows.flush()
+        self._raw_from = 0
+
+    def _read_raw(self, ids: np.ndarray) -> np.ndarray:
+        rows = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._next_id, self.dimension))
+        return np.ascontiguousarray(rows[ids])
+
+    def _index_add(self, vectors: np.ndarray, int_ids: np.ndarray):
+        self.index.add_with_ids(vectors, int_ids)
+        if self._rebuild_ops is not None:
+            self._rebuild_ops.append(("add", vectors, int_ids))
+
+    def _index_remove(self, int_ids: np.ndarray):
+        if self._index_kind == "hnsw":
+            self._deleted.update(int_ids.tolist())
+        else:
+            self.index.remove_ids(int_ids)
+        if self._rebuild_ops is not None:
+            self._rebuild_ops.append(("remove", None, int_ids))
+
+    # --- Persistence ---
 
     def _load(self):
+        self.index = self._new_index(self.dimension)
+        snapshot_seq = 0
         if os.path.exists(self.index_path) and os.path.exists(self.doc_path):
             try:
-                self.index = faiss.read_index(self.index_path)
                 with open(self.doc_path, "rb") as f:
                     data = pickle.load(f)
-                    self.docs = data.get("docs", {})
-                    self.id_map = data.get("id_map", {})
+                if "chunks" in data:
+                    self.index = faiss.read_index(self.index_path)
+                    self.dimension = self.index.d
+                    self._next_id = data["next_id"]
+                    self._index_kind = data.get("index_kind", "flat")
+                    self._trained_size = data.get("trained_size", 0)
+                    self._deleted = set(data.get("deleted", ()))
+                    # Snapshots without raw_from were taken while no raw rows were kept
+                    raw_from = data.get("raw_from")
+                    self._raw_from = data["next_id"] if raw_from is None else raw_from
+                    snapshot_seq = data["seq"]
+                    for int_id, chunk in data["chunks"].items():
+                        self._register(int_id, chunk)
+                else:
+                    self._migrate_legacy(data)
             except Exception as e:
-                print(f"Error loading FAISS index: {e}. creating new one.")
-                self.index = faiss.IndexFlatL2(self.dimension)
-        else:
-            self.index = faiss.IndexFlatL2(self.dimension)
+                logger.error(f"Error loading FAISS index: {e}. creating new one.")
+                self.index = self._new_index(self.dimension)
+        self._seq = snapshot_seq
+        self._replay_wal(snapshot_seq)
 
-    def _save(self):
-        faiss.write_index(self.index, self.index_path)
-        with open(self.doc_path, "wb") as f:
-            pickle.dump({"docs": self.docs, "id_map": self.id_map}, f)
+    def _migrate_legacy(self, data: dict):
+        # Older snapshots held one chunk per document in a plain IndexFlatL2;
+        # re-add whatever survived into the ID-mapped layout.
+        legacy = [c for c in data.get("docs", {}).values() if c.embedding is not None]
+        logger.warning(f"Migrating legacy FAISS doc store ({len(legacy)} chunks)")
+        if legacy:
+            vectors = np.array([c.embedding for c in legacy], dtype=np.float32)
+            self._apply_add([ChunkRecord.from_chunk(c) for c in legacy], vectors)
+        self._snapshot()
 
-    async def add_documents(self, documents: List[Document]):
-        # Just an alias for add_chunks really
-        await self.add_chunks(documents)
-
-    async def add_chunks(self, chunks: List[Document]):
-        if not chunks:
+    def _replay_wal(self, snapshot_seq: int):
+        if not os.path.exists(self.wal_path):
             return
+        replayed = 0
+        with open(self.wal_path, "rb") as f:
+            while True:
+                try:
+                    seq, op, payload = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception as e:
+                    # A torn record at the tail means the process died mid-write
+                    logger.warning(f"Stopping FAISS WAL replay at damaged record: {e}")
+                    break
+                if seq <= snapshot_seq:
+                    continue
+                if op == "add":
+                    chunks, vectors = payload
+                    self._apply_add(chunks, vectors)
+                elif op == "delete":
+                    self._apply_delete(payload)
+                self._seq = seq
+                replayed += 1
+        self._ops_since_snapshot = replayed
+        if replayed:
+            logger.info(f"Replayed {replayed} FAISS WAL records")
 
-        vectors = [c.embedding for c in chunks]
-        
-        # Ensure vectors are numpy arrays of float32
-        vectors_np = np.array(vectors).astype('float32')
-        
-        # FAISS dimensions check
-        if vectors_np.shape[1] != self.dimension:
+    def _log(self, op: str, payload):
+        self._seq += 1
+        pickle.dump((self._seq, op, payload), self._wal, protocol=pickle.HIGHEST_PROTOCOL)
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+        self._ops_since_snapshot += 1
+        if self._ops_since_snapshot >= self.snapshot_interval:
+            self._snapshot()
+
+    def _snapshot(self):
+        if self._raw_fd is not None:
+            # Rows behind the snapshot are not in the WAL any more
+            os.fsync(self._raw_fd)
+        index_tmp = self.index_path + ".tmp"
+        doc_tmp = self.doc_path + ".tmp"
+        faiss.write_index(self.index, index_tmp)
+        with open(doc_tmp, "wb") as f:
+            pickle.dump({
+                "chunks": {int_id: self.chunks[cid] for int_id, cid in self.id_map.items()},
+                "next_id": self._next_id,
+                "seq": self._seq,
+                "index_kind": self._index_kind,
+                "trained_size": self._trained_size,
+                "deleted": list(self._deleted),
+                "raw_from": self._raw_from if self._raw_fd is not None else None,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(index_tmp, self.index_path)
+        os.replace(doc_tmp, self.doc_path)
+        # Records up to self._seq are now in the snapshot and skipped on replay,
+        # so truncating is safe even if we crash right before it.
+        self._wal.truncate(0)
+        self._ops_since_snapshot = 0
+
+    # --- In-memory state ---
+
+    def _register(self, int_id: int, chunk: ChunkRecord):
+        if isinstance(chunk, Chunk):
+            # Snapshots and WAL records written before ChunkRecord
+            chunk = ChunkRecord.from_chunk(chunk)
+        self.chunks[chunk.id] = chunk
+        self.id_map[int_id] = chunk.id
+        self.chunk_ids[chunk.id] = int_id
+        self._document_chunks[chunk.document_id].add(chunk.id)
+        self._metadata_index.add(int_id, chunk.metadata)
+
+    def _apply_add(self, chunks: List[ChunkRecord], vectors: np.ndarray):
+        if vectors.shape[1] != self.dimension:
             # Recreate index if dimension mismatch (simple handling)
             # In proper production you'd migrate or warn
             if self.index.ntotal == 0:
-                 self.dimension = vectors_np.shape[1]
-                 self.index = faiss.IndexFlatL2(self.dimension)
+                self.dimension = vectors.shape[1]
+                self.index = self._new_index(self.dimension)
+                self._index_kind = "flat"
+                if self._raw_fd is not None:
+                    os.ftruncate(self._raw_fd, 0)
+                    self._raw_from = self._next_id
             else:
-                 raise ValueError(f"Dimension mismatch: Index={self.dimension}, New={vectors_np.shape[1]}")
-
-        start_id = self.index.ntotal
-        self.index.add(vectors_np)
-        
-        for i, chunk in enumerate(chunks):
-            int_id = start_id + i
-            self.docs[chunk.document_id] = chunk
-            self.id_map[int_id] = chunk.document_id
-            
-        self._save()
-
-    async def search(self, query_vector: List[float], limit: int = 5) -> List[SearchResult]:
-        if self.index.ntotal == 0:
-            return []
-            
-        q_vec = np.array([query_vector]).astype('float32')
-        D, I = self.index.search(q_vec, limit)
-        
+                raise ValueError(f"Dimension mismatch: Index={self.dimension}, New={vectors.shape[1]}")
+
+        # Re-added chunk ids replace their previous vector
+        self._apply_delete([c.id for c in chunks if c.id in self.chunk_ids])
+
+        int_ids = np.arange(self._next_id, self._next_id + len(chunks), dtype=np.int64)
+        self._next_id += len(chunks)
+        if self._raw_fd is not None:
+            self._write_raw(vectors, int(int_ids[0]))
+        self._index_add(vectors, int_ids)
+        for int_id, chunk in zip(int_ids.tolist(), chunks):
+            self._register(int_id, chunk)
+
+    def _apply_delete(self, chunk_ids: List[str]):
+        int_ids = [self.chunk_ids.pop(cid) for cid in chunk_ids if cid in self.chunk_ids]
+        if not int_ids:
+            return
+        self._index_remove(np.array(int_ids, dtype=np.int64))
+        for int_id in int_ids:
+            chunk = self.chunks.pop(self.id_map.pop(int_id))
+            self._metadata_index.remove(int_id, chunk.metadata)
+            ids = self._document_chunks[chunk.document_id]
+            ids.discard(chunk.id)
+            if not ids:
+                del self._document_chunks[chunk.document_id]
+
+    # --- VectorStore ---
+
+    async def add_documents(self, documents: List[Chunk]):
+        # Just an alias for add_chunks really
+        await self.add_chunks(documents)
+
+    async def add_chunks(self, chunks: List[Chunk]):
+        chunks = [c for c in chunks if c.embedding is not None]
+        if not chunks:
+            return
+
+        vectors_np = stack_embeddings(chunks)
+        # The index owns the vectors; keep only text and metadata per chunk
+        stripped = [ChunkRecord.from_chunk(c) for c in chunks]
+
+        with self._lock:
+            self._apply_add(stripped, vectors_np)
+            self._log("add", (stripped, vectors_np))
+            self._bump_generation()
+            self._maybe_rebuild()
+
+    async def search(self, query_embedding: np.ndarray, limit: int = 5, filters: Optional[dict] = None,
+                     nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                     with_embeddings: bool = False, **search_params) -> List[SearchResult]:
+        """
+        nprobe (IVF) and ef_search (HNSW) override the configured defaults for
+        this query only, trading latency for recall.
+        """
+        queries = np.asarray(query_embedding, dtype=np.float32)[None, :]
+        return (await self.search_batch(queries, limit, filters, with_embeddings, nprobe, ef_search))[0]
+
+    async def search_batch(self, query_embeddings: np.ndarray, limit: int = 5, filters: Optional[dict] = None,
+                           with_embeddings: bool = False, nprobe: Optional[int] = None,
+                           ef_search: Optional[int] = None, **search_params) -> List[List[SearchResult]]:
+        """All queries go to the index in one search() call, which FAISS parallelizes across queries."""
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        empty = [[] for _ in range(len(queries))]
+        with self._lock:
+            index, kind = self.index, self._index_kind
+            deleted = list(self._deleted)
+            allowed = None
+            if filters:
+                allowed = np.flatnonzero(self._metadata_index.mask(filters, self._next_id))
+        if index.ntotal == 0 or len(queries) == 0:
+            return empty
+
+        selector = None
+        if allowed is not None:
+            if deleted:
+                allowed = np.setdiff1d(allowed, deleted)
+            if allowed.size == 0:
+                return empty
+            selector = faiss.IDSelectorBatch(allowed.astype(np.int64))
+        elif deleted:
+            excluded = faiss.IDSelectorBatch(np.array(deleted, dtype=np.int64))
+            selector = faiss.IDSelectorNot(excluded)
+
+        settings = get_settings()
+        if kind in IVF_KINDS:
+            params = faiss.SearchParametersIVF(nprobe=nprobe or settings.FAISS_NPROBE)
+        elif kind == "hnsw":
+            params = faiss.SearchParametersHNSW(efSearch=ef_search or settings.FAISS_HNSW_EF_SEARCH)
+        else:
+            params = faiss.SearchParameters()
+        if selector is not None:
+            params.sel = selector
+
+        D, I = index.search(queries, limit, params=params)
+
+        vectors = {}
+        if with_embeddings:
+            hit_ids = np.unique(I[I != -1]).astype(np.int64)
+            try:
+                vectors = dict(zip(hit_ids.tolist(), index.reconstruct_batch(hit_ids)))
+            except RuntimeError as e:
+                logger.warning(f"FAISS index cannot reconstruct vectors: {e}")
+
+        return [self._collect(distances, ids, vectors) for distances, ids in zip(D, I)]
+
+    def _collect(self, distances: np.ndarray, ids: np.ndarray, vectors: Dict[int, np.ndarray]) -> List[SearchResult]:
         results = []
-        for i, idx in enumerate(I[0]):
+        for distance, idx in zip(distances, ids):
             if idx == -1: continue
-            doc_id = self.id_map.get(idx)
-            if doc_id and doc_id in self.docs:
-                doc = self.docs[doc_id]
-                # FAISS L2 distance: Lower is better. 
-                # To make it a "score" (higher better), we can invert or normalize.
-                # Common trick: 1 / (1 + distance)
-                distance = D[0][i]
-                score = 1 / (1 + distance)
-                
-                results.append(SearchResult(
-                    text=doc.text,
-                    metadata=doc.metadata,
-                    score=float(score)
-                ))
-        
+            chunk_id = self.id_map.get(int(idx))
+            chunk = self.chunks.get(chunk_id) if chunk_id else None
+            if chunk is None:
+                continue
+            # FAISS L2 distance: Lower is better.
+            # To make it a "score" (higher better), we can invert or normalize.
+            # Common trick: 1 / (1 + distance)
+            score = 1 / (1 + distance)
+
+            results.append(SearchResult(
+                chunk_id=chunk.id,
+                document_id=chunk.document_id,
+                text=chunk.text,
+                score=float(score),
+                token_count=chunk.token_count,
+                embedding=vectors.get(int(idx)),
+                metadata={
+                    "filename": chunk.metadata.filename,
+                    "created_at": chunk.metadata.created_at,
+                    **chunk.metadata.extra
+                }
+            ))
+
         return results
 
-    async def delete_document(self, document_id: str):
-        # FAISS is append-only mostly for Flat index unless using IDMap, 
-        # but pure delete is hard without rebuilding.
-        # Simple Logic: Remove from doc store, rebuild index (EXPENSIVE but safe for simple use)
-        
-        if document_id in self.docs:
-            del self.docs[document_id]
-            
-            # Rebuild necessary
-            # Filter out deleted ID from id_map logic? 
-            # Actually easier to just rebuild from remaining docs
-            
-            new_index = faiss.IndexFlatL2(self.dimension)
-            new_id_map = {}
-            new_docs_list = list(self.docs.values())
-            
-            if new_docs_list:
-                vectors = [d.embedding for d in new_docs_list]
-                vectors_np = np.array(vectors).astype('float32')
-                new_index.add(vectors_np)
-                
-                for i, doc in enumerate(new_docs_list):
-                    new_id_map[i] = doc.document_id
-            
-            self.index = new_index
-            self.id_map = new_id_map
-            self._save()
+    async def delete_document(self, document_id: str, chunk_ids: Optional[List[str]] = None):
+        with self._lock:
+            if chunk_ids is not None:
+                chunk_ids = [cid for cid in chunk_ids if cid in self.chunks]
+            else:
+                chunk_ids = list(self._document_chunks.get(document_id, ()))
+            if not chunk_ids:
+                return
+            self._apply_delete(chunk_ids)
+            self._log("delete", chunk_ids)
+            self._bump_generation()
+            self._maybe_rebuild()
+
+    async def get_chunk_texts(self, chunk_ids: List[str]) -> Dict[str, str]:
+        return {cid: self.chunks[cid].text for cid in chunk_ids if cid in self.chunks}
+
+    async def get_embeddings(self, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        with self._lock:
+            found = [(cid, self.chunk_ids[cid]) for cid in chunk_ids if cid in self.chunk_ids]
+            pq = self._index_kind == "ivf_pq"
+            if pq:
+                # PQ codes only approximate the vectors; rows before the raw file are left out
+                found = [(cid, int_id) for cid, int_id in found if int_id >= self._raw_from]
+            if not found:
+                return {}
+            int_ids = np.array([int_id for _, int_id in found], dtype=np.int64)
+            try:
+                vectors = self._read_raw(int_ids) if pq else self.index.reconstruct_batch(int_ids)
+            except RuntimeError as e:
+                logger.warning(f"FAISS index cannot reconstruct vectors: {e}")
+                return {}
+        return {cid: vector for (cid, _), vector in zip(found, vectors)}
 
     async def get_document(self, document_id: str) -> Optional[Document]:
-        return self.docs.get(document_id)
+        with self._lock:
+            chunks = [self.chunks[cid] for cid in self._document_chunks.get(document_id, ())]
+        if not chunks:
+            return None
+        chunks.sort(key=lambda c: c.metadata.extra.get("chunk_index", 0))
+        return Document(
+            id=document_id,
+            content="\n\n".join(c.text for c in chunks),
+            metadata=chunks[0].metadata
+        )
@@ -0,0 +1,244 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+_COLUMNS = ("id, status, stage, stages, file_path, filename, metadata, content_hash, duplicate_of, "
+            "chunks, result, error, created_at, started_at, finished_at")
+# Back to a fresh queued job; it is hashed again when next claimed
+_REQUEUE = ("UPDATE jobs SET status = 'queued', stage = 'queued', stages = json_object('queued', created_at), "
+            "content_hash = NULL, started_at = NULL, owner = NULL, lease_until = NULL")
+
+
+class JobStore:
+    """
+    Ingestion jobs in SQLite (in memory unless a path is given).
+
+    status: queued -> running -> succeeded | failed | duplicate
+    stage:  queued -> hashing -> extracting -> chunking -> embedding -> storing -> done
+    Each stage's start time is kept so callers can see where a job spends
+    its time. source_key (path, size, mtime, and a hash of filename and
+    metadata) catches the same submission being repeated while an earlier
+    job for it is still pending.
+
+    Several server processes may share one database. claim() records the
+    claiming process as the job's owner with a lease it must renew();
+    requeue_expired() only takes back running jobs whose lease has run out,
+    so a process starting up never steals work a live one is doing.
+    """
+    def __init__(self, db_path: Optional[str] = None):
+        self._db_lock = threading.Lock()
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Progress updates are frequent and a lost one is harmless
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                source_key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                stages TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                content_hash TEXT,
+                duplicate_of TEXT,
+                chunks INTEGER,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner TEXT,
+                lease_until REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_source ON jobs (source_key);
+            CREATE INDEX IF NOT EXISTS idx_jobs_hash ON jobs (content_hash);
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                # Databases created before leases; their running jobs have none and count as expired
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.commit()
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        (job_id, status, stage, stages, file_path, filename, metadata, content_hash, duplicate_of,
+         chunks, result, error, created_at, started_at, finished_at) = row
+        starts = sorted(json.loads(stages).items(), key=lambda item: item[1])
+        ends = [t for _, t in starts[1:]] + [finished_at or time.time()]
+        return {
+            "job_id": job_id,
+            "status": status,
+            "stage": stage,
+            "stage_seconds": {name: round(end - start, 3) for (name, start), end in zip(starts, ends)},
+            "file_path": file_path,
+            "filename": filename,
+            "metadata": json.loads(metadata),
+            "content_hash": content_hash,
+            "duplicate_of": duplicate_of,
+            "chunks": chunks,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+
+    def add(self, job_id: str, source_key: str, file_path: str, filename: str, metadata: dict,
+            max_queued: int = 0) -> Optional[dict]:
+        """
+        Queue a job (blocking). Returns the new job, the pending job already
+        queued or running for the same source_key, or None if max_queued
+        jobs are already waiting.
+        """
+        now = time.time()
+        with self._db_lock:
+            row = self._db.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE source_key = ? AND status IN ('queued', 'running') "
+                "ORDER BY created_at LIMIT 1", (source_key,)
+            ).fetchone()
+            if row is not None:
+                return self._to_dict(row)
+            if max_queued:
+                queued = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if queued >= max_queued:
+                    return None
+            self._db.execute(
+                "INSERT INTO jobs (id, source_key, status, stage, stages, file_path, filename, metadata, created_at) "
+                "VALUES (?, ?, 'queued', 'queued', ?, ?, ?, ?, ?)",
+                (job_id, source_key, json.dumps({"queued": now}), file_path, filename, json.dumps(metadata, sort_keys=True), now)
+            )
+            self._db.commit()
+            row = self._db.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._db_lock:
+            row = self._db.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def claim(self, job_id: str, owner: str, lease_seconds: float) -> Optional[dict]:
+        """Move a queued job to running under owner's lease; None if it is not queued (blocking)."""
+        now = time.time()
+        with self._db_lock:
+            updated = self._db.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, owner = ?, lease_until = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (now, owner, now + lease_seconds, job_id)
+            ).rowcount
+            self._db.commit()
+        if not updated:
+            return None
+        self.set_stage(job_id, "hashing")
+        return self.get(job_id)
+
+    def set_stage(self, job_id: str, stage: str, chunks: Optional[int] = None):
+        with self._db_lock:
+            row = self._db.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            stages = json.loads(row[0])
+            stages[stage] = time.time()
+            self._db.execute(
+                "UPDATE jobs SET stage = ?, stages = ?, chunks = COALESCE(?, chunks) WHERE id = ?",
+                (stage, json.dumps(stages), chunks, job_id)
+            )
+            self._db.commit()
+
+    def set_hash(self, job_id: str, content_hash: str):
+        with self._db_lock:
+            self._db.execute("UPDATE jobs SET content_hash = ? WHERE id = ?", (content_hash, job_id))
+            self._db.commit()
+
+    def find_by_hash(self, content_hash: str, exclude_id: str = "", filename: Optional[str] = None,
+                     metadata: Optional[dict] = None) -> Optional[dict]:
+        """
+        Latest job that ingested (or is ingesting) this content, other than
+        exclude_id, under filename and metadata when given (blocking).
+        """
+        where, args = "content_hash = ? AND id != ?", [content_hash, exclude_id]
+        if filename is not None:
+            where += " AND filename = ?"
+            args.append(filename)
+        if metadata is not None:
+            where += " AND metadata = ?"
+            args.append(json.dumps(metadata, sort_keys=True))
+        with self._db_lock:
+            row = self._db.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE {where} "
+                "AND status IN ('running', 'succeeded') ORDER BY created_at DESC LIMIT 1", args
+            ).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def finish(self, job_id: str, status: str, result: Optional[dict] = None, error: Optional[str] = None,
+               duplicate_of: Optional[str] = None):
+        if status == "succeeded":
+            self.set_stage(job_id, "done")
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, duplicate_of = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, duplicate_of, time.time(), job_id)
+            )
+            self._db.commit()
+
+    def renew(self, owner: str, job_ids: List[str], lease_seconds: float):
+        """Extend the lease on owner's running jobs among job_ids (blocking)."""
+        if not job_ids:
+            return
+        with self._db_lock:
+            self._db.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = 'running' "
+                f"AND id IN ({', '.join('?' * len(job_ids))})",
+                (time.time() + lease_seconds, owner, *job_ids)
+            )
+            self._db.commit()
+
+    def requeue_expired(self) -> List[str]:
+        """
+        Put running jobs whose owner stopped renewing their lease (the
+        process died or was stopped) back in the queue. Returns their ids,
+        oldest first (blocking).
+        """
+        expired_clause = "status = 'running' AND (lease_until IS NULL OR lease_until < ?)"
+        now = time.time()
+        with self._db_lock:
+            expired = [row[0] for row in self._db.execute(
+                f"SELECT id FROM jobs WHERE {expired_clause} ORDER BY created_at", (now,)
+            )]
+            if not expired:
+                return []
+            placeholders = ", ".join("?" * len(expired))
+            # The lease is checked again: another process may have renewed it since the SELECT
+            self._db.execute(
+                f"{_REQUEUE} WHERE {expired_clause} AND id IN ({placeholders})", (now, *expired)
+            )
+            self._db.commit()
+            requeued = {row[0] for row in self._db.execute(
+                f"SELECT id FROM jobs WHERE status = 'queued' AND id IN ({placeholders})", expired
+            )}
+        return [job_id for job_id in expired if job_id in requeued]
+
+    def release(self, owner: str):
+        """Requeue owner's running jobs now rather than when their lease expires (blocking)."""
+        with self._db_lock:
+            self._db.execute(f"{_REQUEUE} WHERE status = 'running' AND owner = ?", (owner,))
+            self._db.commit()
+
+    def queued(self) -> List[str]:
+        """Every queued job id, oldest first (blocking)."""
+        with self._db_lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            )]
+
+    def counts(self) -> dict:
+        with self._db_lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
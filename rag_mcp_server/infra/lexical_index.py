@@ -0,0 +1,132 @@
+import math
+import re
+import numpy as np
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Words, plus identifiers joined by - _ . / : # (e.g. "POL-2024-0042",
+# "ERR_TIMEOUT", "4.2.1"). Compound identifiers are indexed whole and by part.
+_TOKEN_RE = re.compile(r"[^\W_]+(?:[-_./:#][^\W_]+)*")
+_SEPARATOR_RE = re.compile(r"[-_./:#]")
+
+_MAX_TF = np.iinfo(np.uint16).max
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if _SEPARATOR_RE.search(token):
+            tokens.extend(_SEPARATOR_RE.split(token))
+    return tokens
+
+
+class _Postings:
+    """Growable (row, term frequency) arrays for one term, in row order."""
+    __slots__ = ("rows", "tfs", "size")
+
+    def __init__(self, capacity: int = 4):
+        self.rows = np.empty(capacity, dtype=np.int32)
+        self.tfs = np.empty(capacity, dtype=np.uint16)
+        self.size = 0
+
+    def append(self, row: int, tf: int):
+        if self.size == len(self.rows):
+            # Readers may hold views of the old arrays; never write into them
+            self.rows = np.concatenate([self.rows, np.empty(len(self.rows), dtype=np.int32)])
+            self.tfs = np.concatenate([self.tfs, np.empty(len(self.tfs), dtype=np.uint16)])
+        self.rows[self.size] = row
+        self.tfs[self.size] = min(tf, _MAX_TF)
+        self.size += 1
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.rows[:self.size], self.tfs[:self.size]
+
+
+class LexicalIndex:
+    """
+    Incremental BM25 inverted index over matrix rows.
+
+    Like MetadataIndex, deleted rows stay in the postings until remap() runs
+    after compaction; callers mask them out. Document frequencies therefore
+    include tombstoned rows until then, which only nudges idf.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, _Postings] = {}
+        self._doc_len = np.zeros(1024, dtype=np.float32)
+        self._live_docs = 0
+        self._total_len = 0.0
+
+    def add(self, row: int, text: str):
+        tokens = tokenize(text)
+        if row >= len(self._doc_len):
+            grown = np.zeros(max(row + 1, 2 * len(self._doc_len)), dtype=np.float32)
+            grown[:len(self._doc_len)] = self._doc_len
+            self._doc_len = grown
+        self._doc_len[row] = len(tokens)
+        self._live_docs += 1
+        self._total_len += len(tokens)
+        for term, tf in Counter(tokens).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = _Postings()
+            postings.append(row, tf)
+
+    def remove(self, rows: Iterable[int]):
+        """Account for deleted rows in corpus statistics."""
+        for row in rows:
+            if row < len(self._doc_len):
+                self._live_docs -= 1
+                self._total_len -= float(self._doc_len[row])
+
+    def remap(self, remap: np.ndarray):
+        """Apply an old-row -> new-row mapping, dropping rows mapped to -1."""
+        for term, postings in list(self._postings.items()):
+            rows, tfs = postings.view()
+            new_rows = remap[rows]
+            keep = new_rows >= 0
+            if not keep.any():
+                del self._postings[term]
+                continue
+            postings.rows = new_rows[keep].astype(np.int32)
+            postings.tfs = tfs[keep].copy()
+            postings.size = len(postings.rows)
+
+        old = np.zeros(len(remap), dtype=np.float32)
+        n = min(len(remap), len(self._doc_len))
+        old[:n] = self._doc_len[:n]
+        keep = np.flatnonzero(remap >= 0)
+        doc_len = np.zeros(max(1024, len(keep)), dtype=np.float32)
+        doc_len[:len(keep)] = old[keep]
+        self._doc_len = doc_len
+
+    def snapshot(self, terms: List[str]):
+        """
+        Views needed to score a query; cheap enough to take under the store
+        lock, and stable while scoring runs outside it.
+        """
+        postings = {t: self._postings[t].view() for t in set(terms) if t in self._postings}
+        return postings, self._doc_len, self._live_docs, self._total_len
+
+    def score(self, snapshot, size: int) -> Optional[np.ndarray]:
+        """Dense BM25 scores over rows [0, size), or None if no term matches."""
+        postings, doc_len, live_docs, total_len = snapshot
+        if not postings or live_docs <= 0:
+            return None
+        avgdl = max(total_len / live_docs, 1.0)
+        all_rows, all_scores = [], []
+        for rows, tfs in postings.values():
+            df = len(rows)
+            idf = math.log(1.0 + (live_docs - df + 0.5) / (df + 0.5))
+            tf = tfs.astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * doc_len[rows] / avgdl)
+            all_rows.append(rows)
+            all_scores.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+        rows = np.concatenate(all_rows)
+        scores = np.concatenate(all_scores)
+        in_range = rows < size
+        return np.bincount(rows[in_range], weights=scores[in_range], minlength=size)
@@ -1,65 +1,94 @@
 from typing import List
+import asyncio
 import os
-from openai import AsyncOpenAI
 from ..core.interfaces import Embedder
 from ..config import get_settings
 from ..core.retry_utils import with_retry
+from .embedding_cache import CachingEmbedder
+from ..core.vector_utils import decode_base64, to_matrix
 import numpy as np
 
+# Provider SDKs (openai, sentence_transformers) are imported by the embedder
+# that needs them, so startup only pays for the configured provider.
+
+def _make_batcher(request_fn):
+    from .embedding_batcher import EmbeddingBatcher
+    settings = get_settings()
+    return EmbeddingBatcher(
+        request_fn,
+        max_tokens_per_request=settings.EMBEDDING_BATCH_MAX_TOKENS,
+        max_inputs_per_request=settings.EMBEDDING_BATCH_MAX_INPUTS,
+        max_tokens_per_input=settings.EMBEDDING_MAX_INPUT_TOKENS,
+        max_concurrency=settings.EMBEDDING_MAX_CONCURRENCY
+    )
+
 class OpenAIEmbedder(Embedder):
     def __init__(self):
+        from openai import AsyncOpenAI
         settings = get_settings()
         self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
         self.model = settings.EMBEDDING_MODEL
+        self.batcher = _make_batcher(self._create)
 
-    @with_retry
-    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    async def _create(self, texts: List[str]) -> np.ndarray:
+        # base64 is decoded straight into float32 instead of parsing JSON floats
         response = await self.client.embeddings.create(
             input=texts,
-            model=self.model
+            model=self.model,
+            encoding_format="base64"
         )
-        return [data.embedding for data in response.data]
+        return np.stack([decode_base64(data.embedding) for data in response.data])
+
+    async def embed_documents(self, texts: List[str]) -> np.ndarray:
+        # Token-packed, concurrent requests; retries happen per request
+        return await self.batcher.embed(texts)
 
     @with_retry
-    async def embed_query(self, text: str) -> List[float]:
+    async def embed_query(self, text: str) -> np.ndarray:
         response = await self.client.embeddings.create(
             input=text,
-            model=self.model
+            model=self.model,
+            encoding_format="base64"
         )
-        return response.data[0].embedding
+        return decode_base64(response.data[0].embedding)
 
 class OllamaEmbedder(Embedder):
     def __init__(self):
+        from openai import AsyncOpenAI
         settings = get_settings()
         self.client = AsyncOpenAI(
             base_url=settings.OLLAMA_BASE_URL,
             api_key="ollama" 
         )
         self.model = settings.EMBEDDING_MODEL
+        self.batcher = _make_batcher(self._create)
 
-    @with_retry
-    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    async def _create(self, texts: List[str]) -> np.ndarray:
+        # Ollama's OpenAI-compatible endpoint only returns float lists
+        response = await self.client.embeddings.create(
+            input=texts,
+            model=self.model
+        )
+        return to_matrix(data.embedding for data in response.data)
+
+    async def embed_documents(self, texts: List[str]) -> np.ndarray:
         try:
-            response = await self.client.embeddings.create(
-                input=texts,
-                model=self.model
-            )
-            return [data.embedding for data in response.data]
+            return await self.batcher.embed(texts)
         except Exception as e:
             print(f"Ollama embedding error: {e}")
-            return [[] for _ in texts]
+            return np.empty((len(texts), 0), dtype=np.float32)
 
     @with_retry
-    async def embed_query(self, text: str) -> List[float]:
+    async def embed_query(self, text: str) -> np.ndarray:
         try:
             response = await self.client.embeddings.create(
                 input=text,
                 model=self.model
             )
-            return response.data[0].embedding
+            return np.asarray(response.data[0].embedding, dtype=np.float32)
         except Exception as e:
             print(f"Ollama embedding error: {e}")
-            return []
+            return np.empty(0, dtype=np.float32)
 
 class SentenceTransformerEmbedder(Embedder):
     def __init__(self):
@@ -71,34 +100,30 @@ class SentenceTransformerEmbedder(Embedder):
         except ImportError:
             raise ImportError("sentence-transformers not installed. Please pip install sentence-transformers")
 
-    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    async def embed_documents(self, texts: List[str]) -> np.ndarray:
         # Run in executor to avoid blocking event loop (model inference is CPU intensive)
         loop = asyncio.get_event_loop()
         embeddings = await loop.run_in_executor(None, self.model.encode, texts)
-        return embeddings.tolist()
+        return np.asarray(embeddings, dtype=np.float32)
 
-    async def embed_query(self, text: str) -> List[float]:
+    async def embed_query(self, text: str) -> np.ndarray:
         loop = asyncio.get_event_loop()
         embedding = await loop.run_in_executor(None, self.model.encode, text)
-        return embedding.tolist()
+        return np.asarray(embedding, dtype=np.float32)
 
 class MockEmbedder(Embedder):
     """Generates random embeddings for testing without API keys."""
     def __init__(self, dim: int = 1536):
         self.dim = dim
-        import random
-        self.rng = random.Random(42)
+        self.rng = np.random.default_rng(42)
 
-    async def embed_query(self, text: str) -> List[float]:
-        return [self.rng.random() for _ in range(self.dim)]
+    async def embed_query(self, text: str) -> np.ndarray:
+        return self.rng.random(self.dim, dtype=np.float32)
 
-    async def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return [[self.rng.random() for _ in range(self.dim)] for _ in texts]
+    async def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return self.rng.random((len(texts), self.dim), dtype=np.float32)
 
-def get_embedder() -> Embedder:
-    settings = get_settings()
-    provider = settings.EMBEDDING_PROVIDER.lower()
-    
+def _create_embedder(provider: str) -> Embedder:
     if provider == "openai":
         return OpenAIEmbedder()
     elif provider == "ollama":
@@ -107,3 +132,20 @@ def get_embedder() -> Embedder:
         return SentenceTransformerEmbedder()
     else:
         return MockEmbedder()
+
+def get_embedder() -> Embedder:
+    settings = get_settings()
+    provider = settings.EMBEDDING_PROVIDER.lower()
+    embedder = _create_embedder(provider)
+    
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return embedder
+    db_path = None
+    if settings.EMBEDDING_CACHE_PERSIST:
+        db_path = os.path.join(settings.STORAGE_DIR, "embedding_cache.sqlite3")
+    return CachingEmbedder(
+        embedder,
+        model=f"{provider}:{settings.EMBEDDING_MODEL}",
+        max_items=settings.EMBEDDING_CACHE_MEMORY_ITEMS,
+        db_path=db_path
+    )
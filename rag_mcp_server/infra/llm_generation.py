@@ -1,6 +1,5 @@
 from abc import ABC, abstractmethod
 from typing import AsyncGenerator, Optional
-from openai import AsyncOpenAI
 import logging
 from ..config import get_settings
 from ..core.retry_utils import with_retry
@@ -13,20 +12,31 @@ class LLMGenerator(ABC):
         """Generate a complete text response."""
         pass
 
+    async def generate_stream(self, prompt: str, system_prompt: str = None) -> AsyncGenerator[str, None]:
+        """Yield the response in pieces. Defaults to a single piece."""
+        yield await self.generate_response(prompt, system_prompt)
+
 class OpenAICompatibleGenerator(LLMGenerator):
     def __init__(self, provider: str = "openai"):
         settings = get_settings()
         self.provider = provider
-        
-        if provider == "ollama":
-            self.client = AsyncOpenAI(
-                base_url=settings.OLLAMA_BASE_URL,
-                api_key="ollama"
-            )
-            self.model = settings.LLM_MODEL
-        else: # default openai
-            self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-            self.model = settings.LLM_MODEL
+        self.model = settings.LLM_MODEL
+        self._client = None
+
+    @property
+    def client(self):
+        # Created (and the openai SDK imported) on the first generation, not at startup
+        if self._client is None:
+            from openai import AsyncOpenAI
+            settings = get_settings()
+            if self.provider == "ollama":
+                self._client = AsyncOpenAI(
+                    base_url=settings.OLLAMA_BASE_URL,
+                    api_key="ollama"
+                )
+            else: # default openai
+                self._client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        return self._client
 
     @with_retry
     async def generate_response(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> str:
@@ -46,6 +56,36 @@ class OpenAICompatibleGenerator(LLMGenerator):
             logger.error(f"LLM generation failed ({self.provider}): {e}")
             return f"Error generating response: {str(e)}"
 
+    @with_retry
+    async def _open_stream(self, messages: list):
+        return await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=0.7,
+            stream=True
+        )
+
+    async def generate_stream(self, prompt: str, system_prompt: str = "You are a helpful assistant.") -> AsyncGenerator[str, None]:
+        """
+        Yield content deltas as they arrive. Closing the generator (e.g. the
+        client disconnected) closes the upstream HTTP response.
+        """
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+
+        stream = await self._open_stream(messages)
+        try:
+            async for event in stream:
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            await stream.close()
+
 def get_llm_generator() -> LLMGenerator:
     settings = get_settings()
     provider = settings.LLM_PROVIDER.lower()
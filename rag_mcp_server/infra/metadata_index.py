@@ -0,0 +1,85 @@
+import json
+import numpy as np
+from collections import defaultdict
+from typing import Any, Dict, Optional, Set
+from ..core.models import DocumentMetadata
+
+# Top-level DocumentMetadata fields take precedence over 'extra' keys of the
+# same name, matching how filters were resolved before the index existed.
+_TOP_LEVEL_FIELDS = [f for f in DocumentMetadata.model_fields if f != "extra"]
+
+
+def _value_key(value: Any):
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        # Lists/dicts in 'extra' are indexed by their canonical JSON form
+        return json.dumps(value, sort_keys=True, default=str)
+
+
+class MetadataIndex:
+    """
+    Per-field inverted index (field -> value -> rows) over chunk metadata.
+
+    Callers that tombstone rows either remove() them or AND the result with
+    their alive mask and call remap() after compaction.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Any, Set[int]]] = defaultdict(lambda: defaultdict(set))
+
+    @staticmethod
+    def _entries(metadata: DocumentMetadata):
+        for field in _TOP_LEVEL_FIELDS:
+            yield field, _value_key(getattr(metadata, field))
+        for key, value in metadata.extra.items():
+            if key in DocumentMetadata.model_fields:
+                continue
+            yield key, _value_key(value)
+
+    def add(self, row: int, metadata: DocumentMetadata):
+        for field, value in self._entries(metadata):
+            self._postings[field][value].add(row)
+
+    def remove(self, row: int, metadata: DocumentMetadata):
+        """Drop a row added with this metadata, and any posting left empty."""
+        for field, value in self._entries(metadata):
+            values = self._postings.get(field)
+            rows = values.get(value) if values is not None else None
+            if rows is None:
+                continue
+            rows.discard(row)
+            if not rows:
+                del values[value]
+                if not values:
+                    del self._postings[field]
+
+    def mask(self, filters: dict, size: int) -> np.ndarray:
+        """Boolean mask over rows [0, size) matching every filter exactly."""
+        postings = []
+        for key, value in filters.items():
+            rows = self._postings.get(key, {}).get(_value_key(value))
+            if not rows:
+                return np.zeros(size, dtype=bool)
+            postings.append(rows)
+
+        mask: Optional[np.ndarray] = None
+        # Most selective field first keeps the intermediate masks sparse
+        for rows in sorted(postings, key=len):
+            field_mask = np.zeros(size, dtype=bool)
+            arr = np.fromiter(rows, dtype=np.int64, count=len(rows))
+            field_mask[arr[arr < size]] = True
+            mask = field_mask if mask is None else mask & field_mask
+        return mask
+
+    def remap(self, remap: np.ndarray):
+        """Apply an old-row -> new-row mapping, dropping rows mapped to -1."""
+        for values in self._postings.values():
+            for value, rows in list(values.items()):
+                arr = remap[np.fromiter(rows, dtype=np.int64, count=len(rows))]
+                arr = arr[arr >= 0]
+                if arr.size:
+                    values[value] = set(arr.tolist())
+                else:
+                    del values[value]
@@ -1,126 +1,171 @@
 from typing import List, Optional, Dict
 import asyncpg
 import json
+import logging
+import numpy as np
 import uuid
 import asyncio
+from pgvector.asyncpg import register_vector
 from ..core.interfaces import VectorStore
 from ..core.models import Chunk, SearchResult, Document
 from ..config import get_settings
 
+logger = logging.getLogger(__name__)
+
+# pgvector can only build an HNSW index on vector columns up to this width
+_HNSW_MAX_DIMENSIONS = 2000
+
+_COLUMNS = ("id", "document_id", "text", "embedding", "metadata", "created_at")
+
 class PgVectorStore(VectorStore):
     def __init__(self):
         self.settings = get_settings()
         self.pool = None
-        self._initialized = False
+        self.dimensions: Optional[int] = None  # None until rag_chunks exists
+        self._init_lock = asyncio.Lock()
 
     async def _init_db(self):
-        if self._initialized:
-            return
-            
-        self.pool = await asyncpg.create_pool(self.settings.POSTGRES_URL)
-        
-        async with self.pool.acquire() as conn:
-            # Enable pgvector extension
-            await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
-            
-            # Create table
-            # Assuming 1536 dim for now, but in prod we might want dynamic dim or text-embedding-3-small default
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS rag_chunks (
-                    id UUID PRIMARY KEY,
-                    document_id UUID,
-                    text TEXT,
-                    embedding vector(1536),
-                    metadata JSONB,
-                    created_at FLOAT
-                )
-            """)
-            # Create HNSW index for performance
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_rag_chunks_embedding 
-                ON rag_chunks USING hnsw (embedding vector_cosine_ops)
-            """)
-            
-        self._initialized = True
+        async with self._init_lock:
+            if self.pool:
+                return
+            # The extension has to exist before the pool's connections register its codec
+            conn = await asyncpg.connect(self.settings.POSTGRES_URL)
+            try:
+                await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            finally:
+                await conn.close()
+            self.pool = await asyncpg.create_pool(
+                self.settings.POSTGRES_URL,
+                # Vectors travel in pgvector's binary format as float32 numpy arrays
+                init=register_vector,
+                # A session default, so the pool's RESET ALL on release keeps it
+                server_settings={"hnsw.ef_search": str(self.settings.PGVECTOR_HNSW_EF_SEARCH)}
+            )
+
+            async with self.pool.acquire() as conn:
+                # A vector column's typmod is its dimension
+                self.dimensions = await conn.fetchval("""
+                    SELECT atttypmod FROM pg_attribute
+                    WHERE attrelid = to_regclass('rag_chunks') AND attname = 'embedding'
+                """)
 
     async def _ensure_conn(self):
         if not self.pool:
             await self._init_db()
 
+    async def warm_up(self):
+        await self._ensure_conn()
+
+    async def _create_table(self, dimensions: int):
+        """Size the table from the embedder's output on first insert."""
+        async with self._init_lock:
+            if self.dimensions is not None:
+                return
+            async with self.pool.acquire() as conn:
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS rag_chunks (
+                        id UUID PRIMARY KEY,
+                        document_id UUID,
+                        text TEXT,
+                        embedding vector({int(dimensions)}),
+                        metadata JSONB,
+                        created_at FLOAT
+                    )
+                """)
+                if dimensions <= _HNSW_MAX_DIMENSIONS:
+                    # Create HNSW index for performance
+                    await conn.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_rag_chunks_embedding
+                        ON rag_chunks USING hnsw (embedding vector_cosine_ops)
+                    """)
+                else:
+                    logger.warning(f"pgvector cannot HNSW-index {dimensions}-dim vectors; searches will scan exactly")
+                await conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_rag_chunks_document ON rag_chunks (document_id)"
+                )
+            self.dimensions = dimensions
+
     async def add_chunks(self, chunks: List[Chunk]):
         await self._ensure_conn()
-        
+
+        chunks = [c for c in chunks if c.embedding is not None]
         if not chunks:
             return
 
+        dimensions = len(chunks[0].embedding)
+        if self.dimensions is None:
+            await self._create_table(dimensions)
+        if dimensions != self.dimensions:
+            raise ValueError(
+                f"rag_chunks stores {self.dimensions}-dim vectors but the embedder produced {dimensions}; "
+                "changing embedding models needs a fresh table"
+            )
+
+        # Last write wins for ids repeated in one batch; the merge may touch each row once
+        records = {}
+        for c in chunks:
+            records[c.id] = (
+                uuid.UUID(c.id),
+                uuid.UUID(c.document_id),
+                c.text,
+                c.embedding,
+                json.dumps({
+                    "filename": c.metadata.filename,
+                    **c.metadata.extra,
+                    **({"token_count": c.token_count} if c.token_count is not None else {})
+                }),
+                c.metadata.created_at
+            )
+
+        # COPY into a per-connection staging table, then merge with one statement
         async with self.pool.acquire() as conn:
-            records = []
-            for c in chunks:
-                records.append((
-                    uuid.UUID(c.id),
-                    uuid.UUID(c.document_id),
-                    c.text,
-                    c.embedding, # asyncpg-pgvector handles list[float] mapping if registered, or string format
-                    json.dumps({
-                        "filename": c.metadata.filename, 
-                        **c.metadata.extra
-                    }),
-                    c.metadata.created_at
-                ))
-            
-            # Use executemany for bulk insert
-            # Note: Explicit array text format for vector might be needed if not auto-handled
-            # But recent asyncpg env usually handles it if pgvector types registered.
-            # For robustness, we'll try standard executemany.
-            await conn.executemany("""
-                INSERT INTO rag_chunks (id, document_id, text, embedding, metadata, created_at)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                ON CONFLICT (id) DO UPDATE 
-                SET text = EXCLUDED.text, embedding = EXCLUDED.embedding, metadata = EXCLUDED.metadata
-            """, records)
-
-    async def search(self, query_embedding: List[float], limit: int = 5, filters: Optional[dict] = None) -> List[SearchResult]:
+            async with conn.transaction():
+                await conn.execute(
+                    "CREATE TEMP TABLE IF NOT EXISTS rag_chunks_staging (LIKE rag_chunks) ON COMMIT DELETE ROWS"
+                )
+                await conn.copy_records_to_table("rag_chunks_staging", records=records.values(), columns=_COLUMNS)
+                await conn.execute("""
+                    INSERT INTO rag_chunks (id, document_id, text, embedding, metadata, created_at)
+                    SELECT id, document_id, text, embedding, metadata, created_at FROM rag_chunks_staging
+                    ON CONFLICT (id) DO UPDATE
+                    SET text = EXCLUDED.text, embedding = EXCLUDED.embedding, metadata = EXCLUDED.metadata
+                """)
+        self._bump_generation()
+
+    async def search(self, query_embedding: np.ndarray, limit: int = 5, filters: Optional[dict] = None,
+                     ef_search: Optional[int] = None, with_embeddings: bool = False,
+                     **search_params) -> List[SearchResult]:
+        """ef_search overrides PGVECTOR_HNSW_EF_SEARCH for this query only."""
         await self._ensure_conn()
-        
-        # Build query
-        # Standard cosine distance is <=> operator in pgvector
-        # 1 - (embedding <=> query) is cosine similarity IF normalized? 
-        # Actually <=> is cosine distance. 
-        # ORDER BY embedding <=> $1 LIMIT $2
-        
+        if self.dimensions is None:
+            return []
+
+        # <=> is cosine distance. Filters are one JSONB containment test, so
+        # there are only a handful of distinct statements and asyncpg's
+        # per-connection statement cache prepares each once.
+        args = [np.asarray(query_embedding, dtype=np.float32), limit]
         filter_clause = ""
-        args = [json.dumps(query_embedding), limit] # $1, $2
-        param_idx = 3
-        
         if filters:
-            conditions = []
-            for k, v in filters.items():
-                # JSONB containment or key access
-                # Simple containment: metadata @> '{"key": "value"}'
-                conditions.append(f"metadata @> ${param_idx}")
-                args.append(json.dumps({k: v}))
-                param_idx += 1
-            if conditions:
-                filter_clause = "WHERE " + " AND ".join(conditions)
+            filter_clause = "WHERE metadata @> $3"
+            args.append(json.dumps(filters))
 
         sql = f"""
             SELECT id, document_id, text, metadata, created_at, 1 - (embedding <=> $1) as score
+                   {", embedding" if with_embeddings else ""}
             FROM rag_chunks
             {filter_clause}
             ORDER BY embedding <=> $1
             LIMIT $2
         """
-        
-        # Correction: asyncpg binding for vector needs to be compatible. 
-        # Often it expects a string "[1,2,3...]" if type codec isn't set, or list if it is.
-        # We'll rely on list.
-        # ARGS correction: $1 is query_embedding (list)
-        
+
         async with self.pool.acquire() as conn:
-            # We might need to register type, but let's try raw text for vector literal if needed
-            # For now passing list.
-            rows = await conn.fetch(sql, *args)
-            
+            if ef_search:
+                async with conn.transaction():
+                    await conn.execute(f"SET LOCAL hnsw.ef_search = {int(ef_search)}")
+                    rows = await conn.fetch(sql, *args)
+            else:
+                rows = await conn.fetch(sql, *args)
+
         results = []
         for row in rows:
             meta = json.loads(row['metadata'])
@@ -130,20 +175,53 @@ class PgVectorStore(VectorStore):
                 document_id=str(row['document_id']),
                 text=row['text'],
                 score=float(row['score']),
+                token_count=meta.pop('token_count', None),
+                embedding=row['embedding'] if with_embeddings else None,
                 metadata=meta
             ))
-            
+
         return results
 
-    async def delete_document(self, document_id: str):
+    async def delete_document(self, document_id: str, chunk_ids: Optional[List[str]] = None):
+        await self._ensure_conn()
+        if self.dimensions is None:
+            return
+        async with self.pool.acquire() as conn:
+            if chunk_ids is not None:
+                await conn.execute("DELETE FROM rag_chunks WHERE id = ANY($1::uuid[])",
+                                   [uuid.UUID(cid) for cid in chunk_ids])
+            else:
+                await conn.execute("DELETE FROM rag_chunks WHERE document_id = $1", uuid.UUID(document_id))
+        self._bump_generation()
+
+    async def get_chunk_texts(self, chunk_ids: List[str]) -> Dict[str, str]:
         await self._ensure_conn()
+        if self.dimensions is None:
+            return {}
         async with self.pool.acquire() as conn:
-            await conn.execute("DELETE FROM rag_chunks WHERE document_id = $1", uuid.UUID(document_id))
+            rows = await conn.fetch("SELECT id, text FROM rag_chunks WHERE id = ANY($1::uuid[])",
+                                    [uuid.UUID(cid) for cid in chunk_ids])
+        return {str(r['id']): r['text'] for r in rows}
+
+    async def get_embeddings(self, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        await self._ensure_conn()
+        if self.dimensions is None:
+            return {}
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT id, embedding FROM rag_chunks WHERE id = ANY($1::uuid[])",
+                                    [uuid.UUID(cid) for cid in chunk_ids])
+        return {str(r['id']): np.asarray(r['embedding'], dtype=np.float32) for r in rows}
 
     async def get_document(self, document_id: str) -> Optional[Document]:
         await self._ensure_conn()
+        if self.dimensions is None:
+            return None
         async with self.pool.acquire() as conn:
-            rows = await conn.fetch("SELECT text, metadata FROM rag_chunks WHERE document_id = $1", uuid.UUID(document_id))
+            rows = await conn.fetch(
+                "SELECT text, metadata FROM rag_chunks WHERE document_id = $1 "
+                "ORDER BY COALESCE((metadata->>'chunk_index')::int, 0), created_at",
+                uuid.UUID(document_id)
+            )
             
         if not rows:
             return None
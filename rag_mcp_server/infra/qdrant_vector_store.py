@@ -1,34 +1,85 @@
+import asyncio
+import numpy as np
+from functools import lru_cache
 from typing import List, Optional, Dict
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http import models as rest
+from qdrant_client.http.exceptions import UnexpectedResponse
 from ..core.interfaces import VectorStore
 from ..core.models import Chunk, SearchResult, Document
 from ..config import get_settings
 import uuid
 
+@lru_cache()
+def _shared_client(url: str, api_key: Optional[str]) -> AsyncQdrantClient:
+    # One client (and HTTP connection pool) per process
+    return AsyncQdrantClient(url=url, api_key=api_key)
+
 class QdrantVectorStore(VectorStore):
     def __init__(self):
         settings = get_settings()
-        self.client = QdrantClient(
-            url=settings.QDRANT_URL,
-            api_key=settings.QDRANT_API_KEY if settings.QDRANT_API_KEY else None
+        self.client = _shared_client(
+            settings.QDRANT_URL,
+            settings.QDRANT_API_KEY if settings.QDRANT_API_KEY else None
         )
         self.collection_name = "rag_documents"
-        
-        # Ensure collection exists
-        try:
-            self.client.get_collection(self.collection_name)
-        except Exception:
-            # Create collection with default vector size (OpenAI small = 1536)
-            # In production, vector size should be configurable
-            self.client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=rest.VectorParams(size=1536, distance=rest.Distance.COSINE)
-            )
+        self._batch_size = settings.VECTOR_DB_UPSERT_BATCH_SIZE
+        self._concurrency = settings.VECTOR_DB_UPSERT_CONCURRENCY
+        self.dimensions: Optional[int] = None  # None until the collection exists
+        self._collection_checked = False
+        self._collection_lock = asyncio.Lock()
+
+    async def _ensure_collection(self):
+        """Look up the collection's vector size; a missing collection is created on first insert."""
+        if self._collection_checked:
+            return
+        async with self._collection_lock:
+            if self._collection_checked:
+                return
+            try:
+                info = await self.client.get_collection(self.collection_name)
+            except UnexpectedResponse as e:
+                if e.status_code != 404:
+                    raise
+            else:
+                self.dimensions = info.config.params.vectors.size
+            self._collection_checked = True
+
+    async def _create_collection(self, dimensions: int):
+        """Size the collection from the embedder's output on first insert."""
+        async with self._collection_lock:
+            if self.dimensions is not None:
+                return
+            try:
+                await self.client.create_collection(
+                    collection_name=self.collection_name,
+                    vectors_config=rest.VectorParams(size=dimensions, distance=rest.Distance.COSINE)
+                )
+            except UnexpectedResponse:
+                # Another process may have created it first; its size wins
+                if not await self.client.collection_exists(self.collection_name):
+                    raise
+                info = await self.client.get_collection(self.collection_name)
+                dimensions = info.config.params.vectors.size
+            self.dimensions = dimensions
+
+    async def warm_up(self):
+        await self._ensure_collection()
 
     async def add_chunks(self, chunks: List[Chunk]):
+        chunks = [c for c in chunks if c.embedding is not None]
         if not chunks:
             return
+        await self._ensure_collection()
+
+        dimensions = len(chunks[0].embedding)
+        if self.dimensions is None:
+            await self._create_collection(dimensions)
+        if dimensions != self.dimensions:
+            raise ValueError(
+                f"{self.collection_name} stores {self.dimensions}-dim vectors but the embedder produced {dimensions}; "
+                "changing embedding models needs a fresh collection"
+            )
 
         points = []
         for c in chunks:
@@ -39,39 +90,46 @@ class QdrantVectorStore(VectorStore):
                 "created_at": c.metadata.created_at,
                 **c.metadata.extra
             }
+            if c.token_count is not None:
+                payload["token_count"] = c.token_count
             
             points.append(rest.PointStruct(
                 id=str(uuid.UUID(c.id)), # Qdrant prefers UUID objects or ints
-                vector=c.embedding,
+                vector=c.embedding.tolist(), # wire format
                 payload=payload
             ))
-            
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=points
-        )
 
-    async def search(self, query_embedding: List[float], limit: int = 5, filters: Optional[dict] = None) -> List[SearchResult]:
-        # Build filter
-        query_filter = None
-        if filters:
-            conditions = []
-            for k, v in filters.items():
-                conditions.append(
-                    rest.FieldCondition(
-                        key=k,
-                        match=rest.MatchValue(value=v)
-                    )
+        # Size-bounded batches, a few requests in flight at once
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def upsert(batch: List[rest.PointStruct]):
+            async with semaphore:
+                await self.client.upsert(
+                    collection_name=self.collection_name,
+                    points=batch
                 )
-            query_filter = rest.Filter(must=conditions)
 
-        hits = self.client.search(
-            collection_name=self.collection_name,
-            query_vector=query_embedding,
-            limit=limit,
-            query_filter=query_filter
-        )
-        
+        await asyncio.gather(*(
+            upsert(points[start:start + self._batch_size]) for start in range(0, len(points), self._batch_size)
+        ))
+        self._bump_generation()
+
+    @staticmethod
+    def _filter(filters: Optional[dict]) -> Optional[rest.Filter]:
+        if not filters:
+            return None
+        conditions = []
+        for k, v in filters.items():
+            conditions.append(
+                rest.FieldCondition(
+                    key=k,
+                    match=rest.MatchValue(value=v)
+                )
+            )
+        return rest.Filter(must=conditions)
+
+    @staticmethod
+    def _to_results(hits, with_embeddings: bool) -> List[SearchResult]:
         results = []
         for hit in hits:
             results.append(SearchResult(
@@ -79,15 +137,56 @@ class QdrantVectorStore(VectorStore):
                 document_id=hit.payload.get("document_id"),
                 text=hit.payload.get("text"),
                 score=hit.score,
+                token_count=hit.payload.pop("token_count", None),
+                embedding=np.asarray(hit.vector, dtype=np.float32) if with_embeddings else None,
                 metadata=hit.payload
             ))
-            
         return results
 
-    async def delete_document(self, document_id: str):
-        self.client.delete(
+    async def search(self, query_embedding: np.ndarray, limit: int = 5, filters: Optional[dict] = None,
+                     with_embeddings: bool = False, **search_params) -> List[SearchResult]:
+        await self._ensure_collection()
+        if self.dimensions is None:
+            return []
+        response = await self.client.query_points(
             collection_name=self.collection_name,
-            points_selector=rest.FilterSelector(
+            query=np.asarray(query_embedding, dtype=np.float32).tolist(),
+            limit=limit,
+            query_filter=self._filter(filters),
+            with_payload=True,
+            with_vectors=with_embeddings
+        )
+        return self._to_results(response.points, with_embeddings)
+
+    async def search_batch(self, query_embeddings: np.ndarray, limit: int = 5, filters: Optional[dict] = None,
+                           with_embeddings: bool = False, **search_params) -> List[List[SearchResult]]:
+        """One batch query request for all queries instead of a round trip each."""
+        if len(query_embeddings) == 0:
+            return []
+        await self._ensure_collection()
+        if self.dimensions is None:
+            return [[] for _ in range(len(query_embeddings))]
+        query_filter = self._filter(filters)
+        responses = await self.client.query_batch_points(
+            collection_name=self.collection_name,
+            requests=[
+                rest.QueryRequest(
+                    query=q.tolist(),  # wire format
+                    limit=limit,
+                    filter=query_filter,
+                    with_payload=True,
+                    with_vector=with_embeddings
+                )
+                for q in np.asarray(query_embeddings, dtype=np.float32)
+            ]
+        )
+        return [self._to_results(response.points, with_embeddings) for response in responses]
+
+    async def delete_document(self, document_id: str, chunk_ids: Optional[List[str]] = None):
+        if chunk_ids is not None:
+            selector = rest.PointIdsList(points=[str(uuid.UUID(cid)) for cid in chunk_ids])
+        else:
+            selector = rest.FilterSelector(
                 filter=rest.Filter(
                     must=[
                         rest.FieldCondition(
@@ -97,12 +196,50 @@ class QdrantVectorStore(VectorStore):
                     ]
                 )
             )
+        await self._ensure_collection()
+        if self.dimensions is None:
+            return
+        await self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=selector
+        )
+        self._bump_generation()
+
+    async def get_chunk_texts(self, chunk_ids: List[str]) -> Dict[str, str]:
+        if not chunk_ids:
+            return {}
+        await self._ensure_collection()
+        if self.dimensions is None:
+            return {}
+        points = await self.client.retrieve(
+            collection_name=self.collection_name,
+            ids=[str(uuid.UUID(cid)) for cid in chunk_ids],
+            with_payload=["text"],
+            with_vectors=False
         )
+        return {str(p.id): p.payload.get("text", "") for p in points}
+
+    async def get_embeddings(self, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        if not chunk_ids:
+            return {}
+        await self._ensure_collection()
+        if self.dimensions is None:
+            return {}
+        points = await self.client.retrieve(
+            collection_name=self.collection_name,
+            ids=[str(uuid.UUID(cid)) for cid in chunk_ids],
+            with_payload=False,
+            with_vectors=True
+        )
+        return {str(p.id): np.asarray(p.vector, dtype=np.float32) for p in points}
 
     async def get_document(self, document_id: str) -> Optional[Document]:
         # Qdrant scroll/search to get all chunks
         # This can be heavy for large docs, but OK for POC
-        hits, _ = self.client.scroll(
+        await self._ensure_collection()
+        if self.dimensions is None:
+            return None
+        hits, _ = await self.client.scroll(
             collection_name=self.collection_name,
             scroll_filter=rest.Filter(
                 must=[
@@ -118,6 +255,7 @@ class QdrantVectorStore(VectorStore):
         if not hits:
             return None
             
+        hits = sorted(hits, key=lambda h: h.payload.get("chunk_index", 0))
         full_text = "\n\n".join([h.payload.get("text", "") for h in hits])
         meta = hits[0].payload
         from ..core.models import DocumentMetadata
@@ -0,0 +1,199 @@
+import json
+import os
+import numpy as np
+from typing import Optional, Tuple
+from .segment_store import MemmapVectorMatrix, _create_memmap, _write_json_atomic
+
+# Scales are recalibrated (and every code rewritten) each time the matrix
+# doubles, until this many rows have been seen; after that only compaction
+# recalibrates. Re-encoding reads the float32 file once, so the cost is
+# amortized O(1) per row.
+_CALIBRATION_ROWS = 65536
+_SCORE_BLOCK_ROWS = 8192
+
+
+class QuantizedVectorMatrix(MemmapVectorMatrix):
+    """
+    MemmapVectorMatrix plus an int8 code per value for scanning.
+
+    Dimension d is stored as round(x_d / scales[d] * 127), where scales[d]
+    is the largest |x_d| seen at calibration; values beyond it are clipped.
+    top_k() scores every candidate row with integer dot products against
+    the codes (1 byte per dimension, the part that has to stay in RAM) and
+    re-ranks only the best few hundred against the float32 rows, which stay
+    in the memory-mapped file and are paged in on demand.
+
+    On-disk additions to the MemmapVectorMatrix layout:
+      codes.i8        int8 matrix, capacity x dim
+      quantizer.json  {"scales", "calibrated_rows"}
+    """
+
+    def __init__(self, directory: str, initial_capacity: int = 1024, read_only: bool = False):
+        self._codes_path = os.path.join(directory, "codes.i8")
+        self._quantizer_path = os.path.join(directory, "quantizer.json")
+        self._codes: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        self._calibrated_rows = 0
+        super().__init__(directory, initial_capacity, read_only)
+
+        if self._data is None:
+            return
+        if os.path.exists(self._quantizer_path) and os.path.exists(self._codes_path):
+            with open(self._quantizer_path) as f:
+                header = json.load(f)
+            self.scales = np.asarray(header["scales"], dtype=np.float32)
+            self._calibrated_rows = header["calibrated_rows"]
+            mode = "r" if read_only else "r+"
+            self._codes = np.memmap(self._codes_path, dtype=np.int8, mode=mode, shape=(self._capacity, self.dim))
+        elif read_only:
+            # Until the writer quantizes the segment, encode it in RAM
+            self.scales = self._calibrate(self._data, self.size)
+            self._calibrated_rows = self.size
+            self._codes = np.zeros((self._capacity, self.dim), dtype=np.int8)
+            for start in range(0, self.size, _SCORE_BLOCK_ROWS):
+                end = min(start + _SCORE_BLOCK_ROWS, self.size)
+                self._codes[start:end] = self._encode(self._data[start:end])
+        else:
+            # A float32-only segment written before quantization was enabled
+            self._recalibrate()
+
+    @property
+    def codes(self) -> np.ndarray:
+        """int8 rows [0, size). Tombstoned rows are still present."""
+        if self._codes is None:
+            return np.empty((0, self.dim or 0), dtype=np.int8)
+        return self._codes[:self.size]
+
+    def _encode(self, block: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+        scales = self.scales if scales is None else scales
+        return np.clip(np.rint(block / scales * 127.0), -127, 127).astype(np.int8)
+
+    def _write_codes(self, capacity: int, reencode: bool = True):
+        """Fresh codes file of the given capacity holding rows [0, size)."""
+        codes = _create_memmap(self._codes_path + ".tmp", np.int8, (capacity, self.dim))
+        for start in range(0, self.size, _SCORE_BLOCK_ROWS):
+            end = min(start + _SCORE_BLOCK_ROWS, self.size)
+            codes[start:end] = self._encode(self._data[start:end]) if reencode else self._codes[start:end]
+        codes.flush()
+        os.replace(self._codes_path + ".tmp", self._codes_path)
+        self._codes = codes
+
+    @staticmethod
+    def _calibrate(data: np.ndarray, size: int) -> np.ndarray:
+        scales = np.zeros(data.shape[1], dtype=np.float32)
+        for start in range(0, size, _SCORE_BLOCK_ROWS):
+            block = data[start:min(start + _SCORE_BLOCK_ROWS, size)]
+            np.maximum(scales, np.abs(block).max(axis=0), out=scales)
+        return np.maximum(scales, 1e-6)
+
+    def _recalibrate(self):
+        self.scales = self._calibrate(self._data, self.size)
+        self._calibrated_rows = self.size
+        self._write_codes(self._capacity)
+        self._write_quantizer()
+
+    def _write_quantizer(self):
+        _write_json_atomic(self._quantizer_path, {
+            "version": 1,
+            "scales": self.scales.tolist(),
+            "calibrated_rows": self._calibrated_rows,
+        })
+
+    def _reserve(self, rows: int):
+        capacity = self._capacity
+        super()._reserve(rows)
+        if self._capacity != capacity and self.scales is not None:
+            self._write_codes(self._capacity, reencode=False)
+
+    def append(self, vectors) -> np.ndarray:
+        rows = super().append(vectors)
+        if self.scales is None or (self._calibrated_rows < _CALIBRATION_ROWS
+                                   and self.size >= 2 * self._calibrated_rows):
+            self._recalibrate()
+        else:
+            self._codes[rows[0]:rows[-1] + 1] = self._encode(self._data[rows[0]:rows[-1] + 1])
+        return rows
+
+    def compaction_copy(self, state: dict):
+        # Recalibrate on the kept rows and encode them here, off the lock;
+        # finish only encodes the rows appended meanwhile.
+        super().compaction_copy(state)
+        if state["buffers"] is None:
+            return
+        data, _, capacity, _ = state["buffers"]
+        kept = len(state["keep"])
+        scales = self._calibrate(data, kept)
+        codes = _create_memmap(self._codes_path + ".compact", np.int8, (capacity, self.dim))
+        for start in range(0, kept, _SCORE_BLOCK_ROWS):
+            end = min(start + _SCORE_BLOCK_ROWS, kept)
+            codes[start:end] = self._encode(data[start:end], scales)
+        state["codes"], state["scales"] = codes, scales
+
+    def compaction_finish(self, state: dict) -> np.ndarray:
+        remap = super().compaction_finish(state)
+        if state["buffers"] is None:
+            return remap
+        codes, kept = state["codes"], len(state["keep"])
+        self.scales = state["scales"]
+        self._calibrated_rows = kept
+        if self._capacity != len(codes):
+            # The copy had to grow; the codes follow
+            grown = _create_memmap(self._codes_path + ".tmp", np.int8, (self._capacity, self.dim))
+            grown[:kept] = codes[:kept]
+            codes.flush()
+            os.remove(self._codes_path + ".compact")
+            codes, suffix = grown, ".tmp"
+        else:
+            suffix = ".compact"
+        for start in range(kept, self.size, _SCORE_BLOCK_ROWS):
+            end = min(start + _SCORE_BLOCK_ROWS, self.size)
+            codes[start:end] = self._encode(self._data[start:end])
+        codes.flush()
+        os.replace(self._codes_path + suffix, self._codes_path)
+        self._codes = codes
+        self._write_quantizer()
+        return remap
+
+    def flush(self):
+        super().flush()
+        if self._codes is not None and not self.read_only:
+            self._codes.flush()
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(codes, scales) consistent with .vectors at the same moment; take under the store lock."""
+        return self.codes, self.scales
+
+    @staticmethod
+    def top_k(query: np.ndarray, vectors: np.ndarray, codes: np.ndarray, scales: np.ndarray,
+              mask: np.ndarray, rows: Optional[np.ndarray], k: int, candidates: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (rows, float32 scores) of the best k rows for a normalized query.
+        rows restricts the scan (filters); otherwise dead rows are masked.
+        """
+        # x.q ~= sum_d codes[d] * scales[d] * q[d] / 127; fold the scales into
+        # the query and quantize it too, so the scan is int8 x int8 -> int32.
+        folded = query * scales
+        step = float(np.abs(folded).max()) / 127.0 or 1.0
+        q_codes = np.rint(folded / step).astype(np.int8)
+
+        scan = codes if rows is None else codes[rows]
+        approx = np.empty(len(scan), dtype=np.int32)
+        for start in range(0, len(scan), _SCORE_BLOCK_ROWS):
+            block = scan[start:start + _SCORE_BLOCK_ROWS]
+            approx[start:start + len(block)] = np.einsum("ij,j->i", block, q_codes, dtype=np.int32)
+        if rows is None:
+            approx[~mask] = np.iinfo(np.int32).min
+            live = int(np.count_nonzero(mask))
+        else:
+            live = len(rows)
+        if live == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        n = min(live, max(k, candidates))
+        shortlist = np.argpartition(-approx.astype(np.int64), n - 1)[:n]
+        shortlist = shortlist if rows is None else rows[shortlist]
+        # Exact re-rank reads only the shortlisted float32 rows from disk
+        shortlist = np.sort(shortlist)
+        exact = vectors[shortlist] @ query
+        order = np.argsort(-exact)[:k]
+        return shortlist[order], exact[order]
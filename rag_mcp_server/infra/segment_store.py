@@ -0,0 +1,342 @@
+import json
+import os
+import threading
+import numpy as np
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Tuple
+from ..core.models import Chunk
+from .vector_matrix import VectorMatrix
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: nothing stops a second writer, so run one process
+    fcntl = None
+
+# On-disk layout of a persisted memory store (all under one directory):
+#   vectors.f32  raw float32 matrix, capacity x dim, opened with np.memmap
+#   alive.u8     one byte per matrix row (1 = live)
+#   matrix.json  {"dim", "size"} - the only thing parsed on open
+#   chunks.idx   fixed-width records (CHUNK_RECORD_DTYPE), one per stored chunk
+#   chunks.bin   append-only chunk JSON (text + metadata, no embedding)
+#   chunks.json  {"count", "text_bytes"}
+#   writer.lock  flock()ed by the one process allowed to write the segment
+#
+# A segment has a single writer. Other processes that open the directory
+# (e.g. further uvicorn workers) map it read-only: they share the page cache
+# and serve searches from the segment as it was when they opened it, but
+# cannot add or delete chunks, so ingestion has to go to the writer.
+CHUNK_RECORD_DTYPE = np.dtype([
+    ("id", "S64"),
+    ("document_id", "S64"),
+    ("row", "<i8"),        # matrix row, -1 if the chunk has no embedding
+    ("offset", "<u8"),     # byte offset into chunks.bin
+    ("length", "<u4"),
+    ("live", "u1"),
+])
+
+
+def _write_json_atomic(path: str, payload: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, path)
+
+
+def _create_memmap(path: str, dtype, shape) -> np.memmap:
+    return np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+
+
+def acquire_writer_lock(directory: str):
+    """
+    Take the segment's writer lock without blocking. Returns the lock file,
+    which must stay open for as long as the process writes, or None if
+    another process holds the lock.
+    """
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(os.path.join(directory, "writer.lock"), "a")
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _check_writable(read_only: bool):
+    if read_only:
+        raise RuntimeError("Segment is opened read-only: another process holds its writer lock")
+
+
+def _encode_id(value: str) -> bytes:
+    encoded = value.encode("utf-8")
+    if len(encoded) > CHUNK_RECORD_DTYPE["id"].itemsize:
+        raise ValueError(f"ID too long for segment record: {value}")
+    return encoded
+
+
+class MemmapVectorMatrix(VectorMatrix):
+    """
+    VectorMatrix whose rows live in a memory-mapped file.
+
+    Opening an existing matrix maps the file without reading it, so restarts
+    are O(1) and every worker process shares the same OS page cache.
+    read_only maps it for a process that does not hold the writer lock.
+    """
+
+    def __init__(self, directory: str, initial_capacity: int = 1024, read_only: bool = False):
+        super().__init__(initial_capacity)
+        os.makedirs(directory, exist_ok=True)
+        self.read_only = read_only
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._alive_path = os.path.join(directory, "alive.u8")
+        self._header_path = os.path.join(directory, "matrix.json")
+
+        if os.path.exists(self._header_path):
+            with open(self._header_path) as f:
+                header = json.load(f)
+            self.dim = header["dim"]
+            capacity = os.path.getsize(self._vectors_path) // (self.dim * 4)
+            mode = "r" if read_only else "r+"
+            self._data = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(capacity, self.dim))
+            self._alive = np.memmap(self._alive_path, dtype=bool, mode=mode, shape=(capacity,))
+            self._capacity = capacity
+            self.size = min(header["size"], capacity)
+            self.tombstones = self.size - int(np.count_nonzero(self._alive[:self.size]))
+
+    def _allocate(self, capacity: int, dim: int, suffix: str = ".tmp") -> Tuple[np.ndarray, np.ndarray]:
+        _check_writable(self.read_only)
+        data = _create_memmap(self._vectors_path + suffix, np.float32, (capacity, dim))
+        alive = _create_memmap(self._alive_path + suffix, bool, (capacity,))
+        return data, alive
+
+    def _install(self, data: np.ndarray, alive: np.ndarray, capacity: int, suffix: str = ".tmp"):
+        data.flush()
+        alive.flush()
+        # Readers holding the previous mapping keep the old inode alive
+        os.replace(self._vectors_path + suffix, self._vectors_path)
+        os.replace(self._alive_path + suffix, self._alive_path)
+        super()._install(data, alive, capacity, suffix)
+        self.flush()
+
+    def _discard(self, suffix: str):
+        for path in (self._vectors_path + suffix, self._alive_path + suffix):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def delete(self, rows) -> int:
+        _check_writable(self.read_only)
+        return super().delete(rows)
+
+    def flush(self):
+        if self._data is None or self.read_only:
+            return
+        self._data.flush()
+        self._alive.flush()
+        _write_json_atomic(self._header_path, {"version": 1, "dim": self.dim, "size": self.size})
+
+
+class SegmentChunkStore(MutableMapping):
+    """
+    Persisted chunk-id -> Chunk mapping backed by a fixed-width id/offset table
+    and an append-only text file. Records are decoded lazily on access, so
+    opening the store only maps the table. read_only opens it for a process
+    that does not hold the writer lock: nothing is written or truncated.
+    """
+
+    def __init__(self, directory: str, initial_capacity: int = 1024, read_only: bool = False):
+        os.makedirs(directory, exist_ok=True)
+        self.read_only = read_only
+        self._idx_path = os.path.join(directory, "chunks.idx")
+        self._text_path = os.path.join(directory, "chunks.bin")
+        self._header_path = os.path.join(directory, "chunks.json")
+        self._initial_capacity = max(1, initial_capacity)
+        self._lock = threading.RLock()
+
+        self._count = 0
+        self._text_bytes = 0
+        if os.path.exists(self._header_path):
+            with open(self._header_path) as f:
+                header = json.load(f)
+            self._count = header["count"]
+            self._text_bytes = header["text_bytes"]
+            capacity = os.path.getsize(self._idx_path) // CHUNK_RECORD_DTYPE.itemsize
+            mode = "r" if read_only else "r+"
+            self._records = np.memmap(self._idx_path, dtype=CHUNK_RECORD_DTYPE, mode=mode, shape=(capacity,))
+        elif read_only:
+            self._records = np.zeros(0, dtype=CHUNK_RECORD_DTYPE)
+        else:
+            self._records = _create_memmap(self._idx_path, CHUNK_RECORD_DTYPE, (self._initial_capacity,))
+
+        if read_only:
+            # Bytes past text_bytes may be the writer's uncommitted appends
+            self._text = open(self._text_path, "rb") if self._count else None
+        else:
+            self._text = open(self._text_path, "a+b")
+            # Drop any bytes written after the last committed header (e.g. crash mid-ingest)
+            self._text.truncate(self._text_bytes)
+
+        records = self._records[:self._count]
+        live = np.flatnonzero(records["live"])
+        ids = [raw.decode("utf-8") for raw in records["id"][live].tolist()]
+        self._slots: Dict[str, int] = dict(zip(ids, live.tolist()))
+
+    # --- MutableMapping ---
+
+    def __getitem__(self, chunk_id: str) -> Chunk:
+        with self._lock:
+            slot = self._slots[chunk_id]
+            record = self._records[slot]
+            raw = os.pread(self._text.fileno(), int(record["length"]), int(record["offset"]))
+        return Chunk.model_validate_json(raw)
+
+    def __setitem__(self, chunk_id: str, chunk: Chunk):
+        self.put_many([chunk], [-1])
+
+    def __delitem__(self, chunk_id: str):
+        _check_writable(self.read_only)
+        with self._lock:
+            slot = self._slots.pop(chunk_id)
+            self._records["live"][slot] = 0
+
+    def __contains__(self, chunk_id) -> bool:
+        return chunk_id in self._slots
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._slots))
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    # --- Segment specific ---
+
+    def _reserve(self, count: int):
+        capacity = len(self._records)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        self._records.flush()
+        with open(self._idx_path, "r+b") as f:
+            f.truncate(capacity * CHUNK_RECORD_DTYPE.itemsize)
+        self._records = np.memmap(self._idx_path, dtype=CHUNK_RECORD_DTYPE, mode="r+", shape=(capacity,))
+
+    def put_many(self, chunks: List[Chunk], rows: List[int]):
+        """Append chunks with their matrix rows (-1 when not embedded)."""
+        _check_writable(self.read_only)
+        with self._lock:
+            for chunk in chunks:
+                if chunk.id in self._slots:
+                    del self[chunk.id]
+
+            self._reserve(self._count + len(chunks))
+            payload = bytearray()
+            for chunk, row in zip(chunks, rows):
+                raw = chunk.model_dump_json(exclude={"embedding"}).encode("utf-8")
+                slot = self._count
+                self._records[slot] = (
+                    _encode_id(chunk.id), _encode_id(chunk.document_id),
+                    row, self._text_bytes + len(payload), len(raw), 1
+                )
+                payload += raw
+                self._slots[chunk.id] = slot
+                self._count += 1
+
+            self._text.seek(0, os.SEEK_END)
+            self._text.write(payload)
+            self._text_bytes += len(payload)
+
+    def rows(self) -> List[Tuple[str, int]]:
+        """(chunk id, matrix row) for every live chunk."""
+        with self._lock:
+            return [(cid, int(self._records["row"][slot])) for cid, slot in self._slots.items()]
+
+    def ids_for_document(self, document_id: str) -> List[str]:
+        with self._lock:
+            records = self._records[:self._count]
+            match = np.flatnonzero(
+                (records["document_id"] == _encode_id(document_id)) & (records["live"] == 1)
+            )
+            return [raw.decode("utf-8") for raw in records["id"][match].tolist()]
+
+    def compact(self, row_remap: np.ndarray):
+        """Rewrite the table and text file without dead records, remapping matrix rows."""
+        state = self.compaction_start()
+        self.compaction_copy(state)
+        self.compaction_finish(state, row_remap)
+
+    def compaction_start(self) -> dict:
+        """Live records as of now. Like VectorMatrix.compaction_start(), take under the caller's lock."""
+        _check_writable(self.read_only)
+        with self._lock:
+            self._text.flush()  # the copy reads chunks.bin through the fd
+            records = self._records[:self._count]
+            live = np.flatnonzero(records["live"])
+            return {"count": self._count, "text_bytes": self._text_bytes,
+                    "live": live, "records": np.array(records[live])}
+
+    def compaction_copy(self, state: dict):
+        """Copy the live records' text into a fresh file. Needs no lock: chunks.bin is append-only."""
+        records = state["records"]
+        offset = 0
+        with open(self._text_path + ".tmp", "wb") as out:
+            for i in range(len(records)):
+                length = int(records["length"][i])
+                out.write(os.pread(self._text.fileno(), length, int(records["offset"][i])))
+                records["offset"][i] = offset
+                offset += length
+        state["copied_bytes"] = offset
+
+    def compaction_finish(self, state: dict, row_remap: np.ndarray):
+        """
+        Add the records written since compaction_start(), drop those deleted
+        since, remap matrix rows and install the rewritten files.
+        """
+        with self._lock:
+            self._text.flush()
+            count, text_bytes = state["count"], state["text_bytes"]
+            current = self._records[:self._count]
+            copied = state["records"][current["live"][state["live"]] == 1]
+
+            appended = np.array(current[count:])
+            appended = appended[appended["live"] == 1]
+            tail = self._text_bytes - text_bytes
+            appended["offset"] -= np.uint64(text_bytes)
+            appended["offset"] += np.uint64(state["copied_bytes"])
+            tmp_text = self._text_path + ".tmp"
+            if tail:
+                with open(tmp_text, "ab") as out:
+                    out.write(os.pread(self._text.fileno(), tail, text_bytes))
+
+            new_records = np.concatenate([copied, appended])
+            has_row = new_records["row"] >= 0
+            new_records["row"][has_row] = row_remap[new_records["row"][has_row]]
+
+            capacity = self._initial_capacity
+            while capacity < len(new_records):
+                capacity *= 2
+            tmp_idx = self._idx_path + ".tmp"
+            table = _create_memmap(tmp_idx, CHUNK_RECORD_DTYPE, (capacity,))
+            table[:len(new_records)] = new_records
+            table.flush()
+
+            os.replace(tmp_idx, self._idx_path)
+            os.replace(tmp_text, self._text_path)
+            self._text.close()
+            self._text = open(self._text_path, "a+b")
+            self._records = table
+            self._count = len(new_records)
+            self._text_bytes = state["copied_bytes"] + tail
+            ids = [raw.decode("utf-8") for raw in new_records["id"].tolist()]
+            self._slots = dict(zip(ids, range(len(ids))))
+            self.flush()
+
+    def flush(self):
+        if self.read_only:
+            return
+        with self._lock:
+            self._text.flush()
+            os.fsync(self._text.fileno())
+            self._records.flush()
+            _write_json_atomic(self._header_path, {"version": 1, "count": self._count, "text_bytes": self._text_bytes})
@@ -0,0 +1,253 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import numpy as np
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from ..core.models import Chunk
+from .lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+_BANDS = 4
+_BAND_BITS = 64 // _BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+_BIT_POSITIONS = np.arange(64, dtype=np.uint64)
+
+
+def simhash(text: str, shingle: int = 3) -> Optional[int]:
+    """64-bit SimHash over word shingles; None for text with no words."""
+    words = tokenize(text)
+    if not words:
+        return None
+    if len(words) < shingle:
+        features = [" ".join(words)]
+    else:
+        features = [" ".join(words[i:i + shingle]) for i in range(len(words) - shingle + 1)]
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "little") for f in features),
+        dtype=np.uint64, count=len(features)
+    )
+    # Majority vote per bit position
+    ones = ((hashes[:, None] >> _BIT_POSITIONS) & np.uint64(1)).sum(axis=0)
+    bits = (2 * ones > len(features)).astype(np.uint64)
+    return int((bits << _BIT_POSITIONS).sum())
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class SimHashIndex:
+    """
+    Near-duplicate lookup over chunk text.
+
+    Fingerprints are split into 4 bands of 16 bits; two fingerprints within
+    Hamming distance 3 must agree on at least one band, so candidates come
+    from exact band matches and are then checked bit by bit. Fingerprints and
+    duplicate -> canonical links are kept in SQLite (in memory unless a path
+    is given); the band tables are rebuilt in memory on open, and a deleted
+    document's entries are pruned from them.
+
+    Duplicates are stored like any other chunk, with their canonical chunk's
+    vector, so the link only records the embedding that was skipped. Links
+    written before duplicates were stored keep the chunk itself (without
+    embedding) so it can be re-ingested if its canonical chunk's document is
+    deleted.
+    """
+    def __init__(self, db_path: Optional[str] = None, max_distance: int = 3, min_tokens: int = 8):
+        self.max_distance = min(max_distance, _BANDS - 1)
+        self.min_tokens = min_tokens
+        self._bands: List[Dict[int, List[Tuple[int, str]]]] = [defaultdict(list) for _ in range(_BANDS)]
+        self._fingerprints: Dict[str, Tuple[int, str]] = {}  # chunk id -> (fingerprint, document id)
+        self._documents: Dict[str, Set[str]] = defaultdict(set)  # document id -> chunk ids
+        self._lock = threading.Lock()
+
+        self._db_lock = threading.Lock()
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(db_path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                chunk_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                fingerprint INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_fingerprints_document ON fingerprints (document_id);
+            CREATE TABLE IF NOT EXISTS duplicates (
+                chunk_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                canonical_chunk_id TEXT NOT NULL,
+                token_count INTEGER NOT NULL DEFAULT 0,
+                chunk TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_duplicates_canonical ON duplicates (canonical_chunk_id);
+            CREATE INDEX IF NOT EXISTS idx_duplicates_document ON duplicates (document_id);
+        """)
+        self._db.commit()
+        for chunk_id, document_id, fingerprint in self._db.execute(
+            "SELECT chunk_id, document_id, fingerprint FROM fingerprints"
+        ):
+            self._index(chunk_id, document_id, _to_unsigned(fingerprint))
+
+        self.duplicates_found = 0
+        self.tokens_avoided = 0
+
+    def _index(self, chunk_id: str, document_id: str, fingerprint: int):
+        self._unindex(chunk_id)
+        for band in range(_BANDS):
+            key = (fingerprint >> (band * _BAND_BITS)) & _BAND_MASK
+            self._bands[band][key].append((fingerprint, chunk_id))
+        self._fingerprints[chunk_id] = (fingerprint, document_id)
+        self._documents[document_id].add(chunk_id)
+
+    def _unindex(self, chunk_id: str):
+        entry = self._fingerprints.pop(chunk_id, None)
+        if entry is None:
+            return
+        fingerprint, document_id = entry
+        chunk_ids = self._documents.get(document_id)
+        if chunk_ids is not None:
+            chunk_ids.discard(chunk_id)
+            if not chunk_ids:
+                del self._documents[document_id]
+        for band in range(_BANDS):
+            key = (fingerprint >> (band * _BAND_BITS)) & _BAND_MASK
+            bucket = self._bands[band].get(key)
+            if bucket is None:
+                continue
+            bucket.remove((fingerprint, chunk_id))
+            if not bucket:
+                del self._bands[band][key]
+
+    def _nearest(self, fingerprint: int) -> Optional[str]:
+        for band in range(_BANDS):
+            key = (fingerprint >> (band * _BAND_BITS)) & _BAND_MASK
+            for other, chunk_id in self._bands[band].get(key, ()):
+                if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                    return chunk_id
+        return None
+
+    def find(self, chunks: List[Chunk]) -> Tuple[Dict[str, str], Dict[str, int]]:
+        """
+        Returns ({duplicate chunk id: canonical chunk id}, {chunk id: fingerprint}).
+        Chunks in the same batch are compared against each other too.
+        """
+        canonical: Dict[str, str] = {}
+        fingerprints: Dict[str, int] = {}
+        batch_bands: List[Dict[int, List[Tuple[int, str]]]] = [defaultdict(list) for _ in range(_BANDS)]
+        with self._lock:
+            for chunk in chunks:
+                if chunk.token_count is not None and chunk.token_count < self.min_tokens:
+                    continue
+                fingerprint = simhash(chunk.text)
+                if fingerprint is None:
+                    continue
+                match = self._nearest(fingerprint)
+                if match is None:
+                    for band in range(_BANDS):
+                        key = (fingerprint >> (band * _BAND_BITS)) & _BAND_MASK
+                        for other, chunk_id in batch_bands[band].get(key, ()):
+                            if bin(fingerprint ^ other).count("1") <= self.max_distance:
+                                match = chunk_id
+                                break
+                        if match:
+                            break
+                if match is not None:
+                    canonical[chunk.id] = match
+                    continue
+                fingerprints[chunk.id] = fingerprint
+                for band in range(_BANDS):
+                    key = (fingerprint >> (band * _BAND_BITS)) & _BAND_MASK
+                    batch_bands[band][key].append((fingerprint, chunk.id))
+        return canonical, fingerprints
+
+    def add(self, chunks: List[Chunk], fingerprints: Dict[str, int], duplicates: List[Tuple[Chunk, str]]):
+        """
+        Record stored chunks as canonical candidates and the duplicates linked to them (blocking).
+        Chunks without an embedding were never stored, so they are not fingerprinted, and
+        duplicates matched to one of them in the same batch (left without a vector too) are not linked.
+        """
+        failed = {c.id for c in chunks if c.embedding is None}
+        rows = [(c.id, c.document_id, fingerprints[c.id]) for c in chunks if c.id in fingerprints and c.id not in failed]
+        duplicates = [(c, canonical) for c, canonical in duplicates if canonical not in failed]
+        with self._lock:
+            for chunk_id, document_id, fingerprint in rows:
+                self._index(chunk_id, document_id, fingerprint)
+            self.duplicates_found += len(duplicates)
+            self.tokens_avoided += sum(c.token_count or 0 for c, _ in duplicates)
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO fingerprints (chunk_id, document_id, fingerprint) VALUES (?, ?, ?)",
+                [(cid, did, _to_signed(fp)) for cid, did, fp in rows]
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO duplicates (chunk_id, document_id, canonical_chunk_id, token_count, chunk) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (c.id, c.document_id, canonical, c.token_count or 0, "")
+                    for c, canonical in duplicates
+                ]
+            )
+            self._db.commit()
+
+    def canonical_links(self, document_id: str) -> Dict[str, str]:
+        """{duplicate chunk id: canonical chunk id} for one document (blocking)."""
+        with self._db_lock:
+            return dict(self._db.execute(
+                "SELECT chunk_id, canonical_chunk_id FROM duplicates WHERE document_id = ?", (document_id,)
+            ).fetchall())
+
+    def duplicate_texts(self, document_id: str) -> Dict[str, str]:
+        """{chunk id: text} of a document's duplicates linked but never stored (older links; blocking)."""
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT chunk_id, chunk FROM duplicates WHERE document_id = ? AND chunk != ''", (document_id,)
+            ).fetchall()
+        return {chunk_id: Chunk.model_validate_json(raw).text for chunk_id, raw in rows}
+
+    def remove_document(self, document_id: str) -> List[Chunk]:
+        """
+        Forget a deleted document's fingerprints and links (blocking).
+        Returns the unstored duplicates (older links) from other documents that
+        pointed at its chunks; they are unlinked and must be ingested again to
+        stay searchable.
+        """
+        with self._lock:
+            for chunk_id in list(self._documents.get(document_id, ())):
+                self._unindex(chunk_id)
+        with self._db_lock:
+            orphans = [
+                Chunk.model_validate_json(row[0]) for row in self._db.execute(
+                    "SELECT d.chunk FROM duplicates d JOIN fingerprints f ON d.canonical_chunk_id = f.chunk_id "
+                    "WHERE f.document_id = ? AND d.document_id != ? AND d.chunk != ''", (document_id, document_id)
+                )
+            ]
+            self._db.execute(
+                "DELETE FROM duplicates WHERE document_id = ? OR canonical_chunk_id IN "
+                "(SELECT chunk_id FROM fingerprints WHERE document_id = ?)", (document_id, document_id)
+            )
+            self._db.execute("DELETE FROM fingerprints WHERE document_id = ?", (document_id,))
+            self._db.commit()
+        return orphans
+
+    def stats(self) -> dict:
+        with self._db_lock:
+            linked, tokens = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(token_count), 0) FROM duplicates"
+            ).fetchone()
+        return {
+            "fingerprints": len(self._fingerprints),
+            "duplicates_found": self.duplicates_found,
+            "embedding_tokens_avoided": self.tokens_avoided,
+            "duplicates_linked": linked,
+            "embedding_tokens_linked": tokens,
+        }
@@ -0,0 +1,93 @@
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional
+
+_EXTENSION = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+
+class UploadStore:
+    """
+    Content-addressed upload storage under one directory.
+
+    A file's bytes live once at objects/<sha256[:2]>/<sha256><ext> (the
+    extension is kept because ingestion picks the extractor by it), so the
+    same content uploaded twice, or under two names, is stored once and
+    concurrent uploads of the same filename cannot overwrite each other.
+    manifest.sqlite3 maps each uploaded filename to the hashes sent under it.
+    """
+    def __init__(self, root: str):
+        self.root = root
+        self._objects = os.path.join(root, "objects")
+        self._incoming = os.path.join(root, "incoming")
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._incoming, exist_ok=True)
+
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "manifest.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                filename TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                uploaded_at REAL NOT NULL,
+                PRIMARY KEY (filename, content_hash)
+            );
+            CREATE INDEX IF NOT EXISTS idx_uploads_hash ON uploads (content_hash);
+        """)
+        self._db.commit()
+
+    def new_file(self) -> str:
+        """Path of an empty file to receive an upload in; pass it to commit() or delete it."""
+        fd, path = tempfile.mkstemp(dir=self._incoming)
+        os.close(fd)
+        return path
+
+    def commit(self, incoming_path: str, filename: str, content_hash: str, size: int) -> dict:
+        """Move a received file to its content address and record it under filename (blocking)."""
+        filename = os.path.basename(filename) or content_hash
+        extension = os.path.splitext(filename)[1].lower()
+        if not _EXTENSION.match(extension):
+            extension = ""
+        path = os.path.join(self._objects, content_hash[:2], content_hash + extension)
+        stored = not os.path.exists(path)
+        if stored:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(incoming_path, path)
+        else:
+            os.remove(incoming_path)
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO uploads (filename, content_hash, size, path, uploaded_at) VALUES (?, ?, ?, ?, ?)",
+                (filename, content_hash, size, path, time.time())
+            )
+            self._db.commit()
+        return {"file_path": path, "filename": filename, "content_hash": content_hash, "size": size, "stored": stored}
+
+    def latest(self, filename: str) -> Optional[dict]:
+        """Most recent upload under filename (blocking)."""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT content_hash, size, path, uploaded_at FROM uploads WHERE filename = ? "
+                "ORDER BY uploaded_at DESC LIMIT 1", (filename,)
+            ).fetchone()
+        if row is None:
+            return None
+        content_hash, size, path, uploaded_at = row
+        return {"file_path": path, "filename": filename, "content_hash": content_hash, "size": size,
+                "uploaded_at": uploaded_at}
+
+    def stats(self) -> dict:
+        with self._db_lock:
+            names, files = self._db.execute(
+                "SELECT COUNT(DISTINCT filename), COUNT(DISTINCT content_hash) FROM uploads"
+            ).fetchone()
+            stored = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT content_hash, size FROM uploads)"
+            ).fetchone()[0]
+        return {"filenames": names, "unique_files": files, "bytes_stored": stored}
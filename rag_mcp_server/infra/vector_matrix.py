@@ -0,0 +1,154 @@
+import numpy as np
+from typing import Optional, Tuple
+
+
+class VectorMatrix:
+    """
+    Growable, pre-normalized float32 matrix used by the in-memory store.
+
+    Rows are appended in O(batch) into preallocated capacity that doubles when
+    full, so existing rows are never re-normalized or copied on ingest.
+    Deletes only tombstone rows; compact() squeezes them out and returns the
+    old-row -> new-row mapping so callers can remap their own row references.
+
+    compact() also comes split in three for callers that must not hold their
+    lock for the copy: compaction_start() and compaction_finish() under it,
+    compaction_copy() in between without it. Rows below the start size are
+    never rewritten, only tombstoned, so the copy can read them while
+    appends and deletes go on; finish carries both over.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self.dim: Optional[int] = None
+        self.size = 0  # rows written, alive or tombstoned
+        self.tombstones = 0
+        self._initial_capacity = max(1, initial_capacity)
+        self._capacity = 0
+        self._data: Optional[np.ndarray] = None
+        self._alive = np.zeros(0, dtype=bool)
+
+    @property
+    def live_count(self) -> int:
+        return self.size - self.tombstones
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Normalized rows [0, size). Tombstoned rows are still present."""
+        if self._data is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._data[:self.size]
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self._alive[:self.size]
+
+    def _allocate(self, capacity: int, dim: int, suffix: str = ".tmp") -> Tuple[np.ndarray, np.ndarray]:
+        """Fresh (vectors, alive) buffers. Overridden for file-backed storage (suffix names the staging files)."""
+        return np.empty((capacity, dim), dtype=np.float32), np.zeros(capacity, dtype=bool)
+
+    def _install(self, data: np.ndarray, alive: np.ndarray, capacity: int, suffix: str = ".tmp"):
+        self._data, self._alive, self._capacity = data, alive, capacity
+
+    def _discard(self, suffix: str):
+        """Drop buffers allocated under suffix that will not be installed."""
+
+    def _capacity_for(self, rows: int) -> int:
+        capacity = self._initial_capacity
+        while capacity < rows:
+            capacity *= 2
+        return capacity
+
+    def _reserve(self, rows: int):
+        if rows <= self._capacity:
+            return
+        capacity = self._capacity_for(rows)
+        data, alive = self._allocate(capacity, self.dim)
+        if self.size:
+            data[:self.size] = self._data[:self.size]
+            alive[:self.size] = self._alive[:self.size]
+        self._install(data, alive, capacity)
+
+    def append(self, vectors) -> np.ndarray:
+        """Normalize and append vectors, returning the row index of each."""
+        vecs = np.asarray(vectors, dtype=np.float32)
+        if vecs.ndim == 1:
+            vecs = vecs.reshape(1, -1)
+        if self.dim is None:
+            self.dim = vecs.shape[1]
+        elif vecs.shape[1] != self.dim:
+            raise ValueError(f"Dimension mismatch: Index={self.dim}, New={vecs.shape[1]}")
+
+        start, end = self.size, self.size + len(vecs)
+        self._reserve(end)
+        block = self._data[start:end]
+        block[:] = vecs
+        # Normalize in place for cosine similarity
+        block /= np.linalg.norm(block, axis=1, keepdims=True) + 1e-10
+        self._alive[start:end] = True
+        self.size = end
+        return np.arange(start, end)
+
+    def delete(self, rows) -> int:
+        """Tombstone rows. Returns how many were alive."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0:
+            return 0
+        rows = rows[self._alive[rows]]
+        self._alive[rows] = False
+        self.tombstones += len(rows)
+        return len(rows)
+
+    def compact(self) -> np.ndarray:
+        """
+        Drop tombstoned rows. Returns an array mapping every old row to its
+        new index, or -1 if the row was dropped.
+        """
+        state = self.compaction_start()
+        self.compaction_copy(state)
+        return self.compaction_finish(state)
+
+    def compaction_start(self) -> dict:
+        """Rows to keep as of now; take under the same lock as append()/delete()."""
+        return {"base": self.size, "data": self._data, "keep": np.flatnonzero(self.alive), "buffers": None}
+
+    def compaction_copy(self, state: dict):
+        """Copy the kept rows into fresh buffers. Needs no lock."""
+        if self.dim is None:
+            return
+        keep = state["keep"]
+        capacity = self._capacity_for(len(keep))
+        data, alive = self._allocate(capacity, self.dim, ".compact")
+        data[:len(keep)] = state["data"][keep]
+        state["buffers"] = (data, alive, capacity, ".compact")
+
+    def compaction_finish(self, state: dict) -> np.ndarray:
+        """
+        Append the rows written since compaction_start(), keep rows deleted
+        since tombstoned, and install the new buffers. Returns the old-row ->
+        new-row mapping (-1 for rows dropped); take under the lock.
+        """
+        base, keep = state["base"], state["keep"]
+        kept, size = len(keep), self.size
+        new_size = kept + size - base
+        remap = np.full(size, -1, dtype=np.int64)
+        remap[keep] = np.arange(kept)
+        remap[base:] = np.arange(kept, new_size)
+
+        if state["buffers"] is None:  # nothing was ever appended
+            self.size, self.tombstones = new_size, 0
+            return remap
+        data, alive, capacity, suffix = state["buffers"]
+        if new_size > capacity:
+            # Appends outgrew the copy's headroom: grow it here, like _reserve() would
+            capacity = self._capacity_for(new_size)
+            grown, alive = self._allocate(capacity, self.dim, ".tmp")
+            grown[:kept] = data[:kept]
+            self._discard(suffix)
+            data, suffix = grown, ".tmp"
+        data[kept:new_size] = self._data[base:size]
+        alive[:kept] = self._alive[keep]
+        alive[kept:new_size] = self._alive[base:size]
+        self.size = new_size
+        self.tombstones = new_size - int(np.count_nonzero(alive[:new_size]))
+        self._install(data, alive, capacity, suffix)
+        return remap
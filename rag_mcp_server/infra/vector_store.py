@@ -1,124 +1,360 @@
 import numpy as np
-from typing import List, Optional, Dict
+from collections import defaultdict
+from typing import List, Optional, Dict, Set
+import logging
+import os
+import tempfile
 import threading
 from ..core.interfaces import VectorStore
-from ..core.models import Chunk, SearchResult, Document
+from ..core.models import Chunk, ChunkRecord, SearchResult, Document
+from ..core.vector_utils import stack_embeddings
 from ..config import get_settings
+from .vector_matrix import VectorMatrix
+from .metadata_index import MetadataIndex
+from .lexical_index import LexicalIndex, tokenize
+from .segment_store import MemmapVectorMatrix, SegmentChunkStore, acquire_writer_lock
+from .quantized_matrix import QuantizedVectorMatrix
+
+logger = logging.getLogger(__name__)
+
+_SCORE_BLOCK_VALUES = 1 << 24
 
 class InMemoryVectorStore(VectorStore):
     def __init__(self):
-        self.chunks: Dict[str, Chunk] = {}
-        self.vectors: Optional[np.ndarray] = None
-        self.ids: List[str] = []
+        settings = get_settings()
+        self.persistent = settings.MEMORY_STORE_PERSIST
+        self.quantized = settings.MEMORY_STORE_QUANTIZATION.lower() == "int8"
+        self._rerank_candidates = settings.QUANTIZED_RERANK_CANDIDATES
+        capacity = settings.VECTOR_STORE_INITIAL_CAPACITY
+        self.read_only = False
+        if self.persistent:
+            # Segment files are memory-mapped, so a restart only maps them
+            # instead of re-embedding or parsing the corpus. Only the process
+            # holding the writer lock may change them; any other maps them
+            # read-only (see segment_store.py).
+            directory = os.path.join(settings.STORAGE_DIR, "memory_store")
+            self._writer_lock = acquire_writer_lock(directory)
+            self.read_only = self._writer_lock is None
+            if self.read_only:
+                logger.warning(f"Memory store at {directory} is locked by another process; "
+                               f"opening it read-only, ingestion has to go to that process")
+            self.chunks = SegmentChunkStore(directory, capacity, self.read_only)
+            matrix_cls = QuantizedVectorMatrix if self.quantized else MemmapVectorMatrix
+            self._matrix = matrix_cls(directory, capacity, self.read_only)
+        else:
+            self.chunks: Dict[str, ChunkRecord] = {}  # vectors live only in the matrix
+            if self.quantized:
+                # float32 rows still go to disk so only the int8 codes need RAM
+                os.makedirs(settings.STORAGE_DIR, exist_ok=True)
+                self._scratch_dir = tempfile.TemporaryDirectory(prefix="memory_store-", dir=settings.STORAGE_DIR)
+                self._matrix = QuantizedVectorMatrix(self._scratch_dir.name, capacity)
+            else:
+                self._matrix = VectorMatrix(capacity)
+        # document_id -> chunk ids; a persisted segment answers this from chunks.idx instead
+        self._document_chunks: Dict[str, Set[str]] = defaultdict(set)
+        self._row_ids: List[Optional[str]] = []  # row -> chunk id, None once tombstoned
+        self._id_to_row: Dict[str, int] = {}
+        self._metadata_index = MetadataIndex()
+        self._lexical_index = LexicalIndex()
+        self._indexes_ready = True
+        self._compaction_ratio = settings.VECTOR_STORE_COMPACTION_RATIO
+        self._compacting = False
         self._lock = threading.Lock()
-        
-    def _update_index(self):
-        # Rebuild simple index
-        if not self.chunks:
-            self.vectors = None
-            self.ids = []
+        if self.persistent:
+            self._load_segment()
+
+    def _load_segment(self):
+        alive = self._matrix.alive
+        self._row_ids = [None] * self._matrix.size
+        for chunk_id, row in self.chunks.rows():
+            if 0 <= row < len(alive) and alive[row]:
+                self._row_ids[row] = chunk_id
+                self._id_to_row[chunk_id] = row
+        # Building the filter and lexical indexes means decoding every record,
+        # so it is deferred to the first search that needs them to keep
+        # startup O(1).
+        self._indexes_ready = not self._id_to_row
+
+    def _index_row(self, row: int, chunk: Chunk):
+        self._metadata_index.add(row, chunk.metadata)
+        self._lexical_index.add(row, chunk.text)
+
+    def _ensure_indexes(self):
+        # Called with the lock held
+        if self._indexes_ready:
             return
+        for chunk_id, row in sorted(self._id_to_row.items(), key=lambda item: item[1]):
+            self._index_row(row, self.chunks[chunk_id])
+        self._indexes_ready = True
 
-        # Sort chunks to ensure aligned order
-        sorted_ids = sorted(self.chunks.keys())
-        embeddings = [self.chunks[uid].embedding for uid in sorted_ids]
-        
-        # Check if any embedding is None
-        valid_embeddings = []
-        valid_ids = []
-        for uid, emb in zip(sorted_ids, embeddings):
-            if emb is not None:
-                valid_embeddings.append(emb)
-                valid_ids.append(uid)
-        
-        if valid_embeddings:
-            self.vectors = np.array(valid_embeddings, dtype=np.float32)
-            # Normalize for cosine similarity
-            norm = np.linalg.norm(self.vectors, axis=1, keepdims=True)
-            self.vectors = self.vectors / (norm + 1e-10)
-            self.ids = valid_ids
-        else:
-            self.vectors = None
-            self.ids = []
+    def _flush(self):
+        if self.persistent:
+            self._matrix.flush()
+            self.chunks.flush()
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("This process opened the memory store read-only; "
+                               "another process holds its writer lock and has to do the ingestion and deletes")
+
+    def _document_chunk_ids(self, document_id: str) -> List[str]:
+        if self.persistent:
+            return self.chunks.ids_for_document(document_id)
+        return list(self._document_chunks.get(document_id, ()))
+
+    def _drop_record(self, chunk_id: str):
+        if self.persistent:
+            del self.chunks[chunk_id]
+            return
+        chunk = self.chunks.pop(chunk_id)
+        ids = self._document_chunks[chunk.document_id]
+        ids.discard(chunk_id)
+        if not ids:
+            del self._document_chunks[chunk.document_id]
+
+    def _tombstone(self, chunk_ids: List[str]):
+        rows = [self._id_to_row.pop(cid) for cid in chunk_ids if cid in self._id_to_row]
+        for row in rows:
+            self._row_ids[row] = None
+        self._matrix.delete(rows)
+        if self._indexes_ready:
+            self._lexical_index.remove(rows)
+
+    def _maybe_schedule_compaction(self):
+        # Called with the lock held. Compaction runs on a background thread so
+        # the request that crossed the threshold doesn't pay for it.
+        matrix = self._matrix
+        if self._compacting or matrix.tombstones == 0:
+            return
+        if matrix.tombstones < matrix.size * self._compaction_ratio:
+            return
+        self._compacting = True
+        threading.Thread(target=self._compact, name="vector-store-compaction", daemon=True).start()
+
+    def _compact(self):
+        # The copy runs without the lock, so ingest and search carry on; the
+        # finish steps replay the appends and deletes made meanwhile and swap.
+        try:
+            with self._lock:
+                matrix_state = self._matrix.compaction_start()
+                chunk_state = self.chunks.compaction_start() if self.persistent else None
+            self._matrix.compaction_copy(matrix_state)
+            if chunk_state is not None:
+                self.chunks.compaction_copy(chunk_state)
+            with self._lock:
+                remap = self._matrix.compaction_finish(matrix_state)
+                keep = np.flatnonzero(remap >= 0)
+                # Rows deleted during the copy are kept (tombstoned) with a None id
+                self._row_ids = [self._row_ids[row] for row in keep]
+                self._id_to_row = {cid: row for row, cid in enumerate(self._row_ids) if cid is not None}
+                # ...and the filter/lexical indexes can forget them now
+                index_remap = remap.copy()
+                index_remap[keep[~self._matrix.alive]] = -1
+                self._metadata_index.remap(index_remap)
+                self._lexical_index.remap(index_remap)
+                if self.persistent:
+                    self.chunks.compaction_finish(chunk_state, remap)
+                    self._matrix.flush()
+        finally:
+            self._compacting = False
+
+    def _snapshot(self, filters: Optional[dict] = None):
+        """Consistent view of the matrix plus the rows eligible for this query."""
+        with self._lock:
+            vectors, row_ids = self._matrix.vectors, self._row_ids
+            mask = self._matrix.alive.copy()
+            if filters:
+                self._ensure_indexes()
+                mask &= self._metadata_index.mask(filters, len(mask))
+            codes = self._matrix.snapshot() if self.quantized else None
+            return vectors, mask, row_ids, codes
 
     async def add_chunks(self, chunks: List[Chunk]):
+        if not chunks:
+            return
+        self._check_writable()
         with self._lock:
-            for chunk in chunks:
-                self.chunks[chunk.id] = chunk
-            self._update_index()
+            # Re-added chunk ids replace their previous row
+            self._tombstone([c.id for c in chunks])
 
-    async def search(self, query_embedding: List[float], limit: int = 5, filters: Optional[dict] = None) -> List[SearchResult]:
-        if self.vectors is None or len(self.ids) == 0:
-            return []
-            
-        # Prepare query
-        q_vec = np.array(query_embedding, dtype=np.float32)
-        q_norm = np.linalg.norm(q_vec)
-        q_vec = q_vec / (q_norm + 1e-10)
-        
-        # Calculate similarity
-        scores = np.dot(self.vectors, q_vec)
-        
-        # Get top k
-        # We start with more candidates to allow for filtering
-        k = min(len(scores), limit * 2 if filters else limit)
-        top_k_indices = np.argsort(scores)[::-1][:k]
-        
+            row_of: Dict[str, int] = {}
+            embedded = [c for c in chunks if c.embedding is not None]
+            if embedded:
+                rows = self._matrix.append(stack_embeddings(embedded))
+                for row, chunk in zip(rows.tolist(), embedded):
+                    self._row_ids.append(chunk.id)
+                    self._id_to_row[chunk.id] = row
+                    if self._indexes_ready:
+                        self._index_row(row, chunk)
+                    row_of[chunk.id] = row
+
+            if self.persistent:
+                self.chunks.put_many(chunks, [row_of.get(c.id, -1) for c in chunks])
+            else:
+                for chunk in chunks:
+                    if chunk.id in self.chunks:
+                        self._drop_record(chunk.id)
+                    self.chunks[chunk.id] = ChunkRecord.from_chunk(chunk)
+                    self._document_chunks[chunk.document_id].add(chunk.id)
+            self._flush()
+            self._bump_generation()
+            self._maybe_schedule_compaction()
+
+    async def search(self, query_embedding: np.ndarray, limit: int = 5, filters: Optional[dict] = None,
+                     with_embeddings: bool = False, **search_params) -> List[SearchResult]:
+        queries = np.asarray(query_embedding, dtype=np.float32)[None, :]
+        return (await self.search_batch(queries, limit, filters, with_embeddings))[0]
+
+    async def search_batch(self, query_embeddings: np.ndarray, limit: int = 5, filters: Optional[dict] = None,
+                           with_embeddings: bool = False, **search_params) -> List[List[SearchResult]]:
+        """
+        All queries are scored in one (Q x dim) . (dim x N) product, so the
+        matrix is read once per batch rather than once per query.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        empty = [[] for _ in range(len(queries))]
+        vectors, mask, row_ids, codes = self._snapshot(filters)
+        if len(vectors) == 0 or len(queries) == 0 or limit <= 0:
+            return empty
+
+        # Prepare queries
+        queries = queries / (np.linalg.norm(queries, axis=1, keepdims=True) + 1e-10)
+
+        # Calculate similarity. Filters are resolved through the metadata
+        # index first so only matching rows are scored.
+        rows = None
+        if filters:
+            rows = np.flatnonzero(mask)
+            if rows.size == 0:
+                return empty
+
+        if codes is not None:
+            hits = [
+                QuantizedVectorMatrix.top_k(q, vectors, *codes, mask, rows, limit, self._rerank_candidates)
+                for q in queries
+            ]
+        else:
+            candidates = vectors[rows] if rows is not None else vectors
+            k = min(len(candidates), limit)
+            # Bound the (queries x rows) score block to ~64 MiB
+            step = max(1, _SCORE_BLOCK_VALUES // len(candidates))
+            hits = []
+            for start in range(0, len(queries), step):
+                scores = queries[start:start + step] @ candidates.T
+                if rows is None:
+                    scores[:, ~mask] = -np.inf
+
+                # Top k without sorting every score
+                top_k = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                top_scores = np.take_along_axis(scores, top_k, axis=1)
+                order = np.argsort(-top_scores, axis=1)
+                top_k = np.take_along_axis(top_k, order, axis=1)
+                top_scores = np.take_along_axis(top_scores, order, axis=1)
+                top_rows = rows[top_k] if rows is not None else top_k
+                hits.extend(zip(top_rows, top_scores))
+
+        return [self._collect(top_rows, top_scores, vectors, row_ids, with_embeddings)
+                for top_rows, top_scores in hits]
+
+    def _collect(self, top_rows: np.ndarray, top_scores: np.ndarray, vectors: np.ndarray,
+                 row_ids: List[Optional[str]], with_embeddings: bool) -> List[SearchResult]:
         results = []
-        count = 0
-        for idx in top_k_indices:
-            chunk_id = self.ids[idx]
-            chunk = self.chunks[chunk_id]
-            
-            # Apply filters if any (simple exact match on metadata)
-            if filters:
-                match = True
-                for key, val in filters.items():
-                    # Check if key exists in extra or is a direct attribute
-                    if hasattr(chunk.metadata, key):
-                         if getattr(chunk.metadata, key) != val:
-                             match = False; break
-                    elif key in chunk.metadata.extra:
-                         if chunk.metadata.extra[key] != val:
-                             match = False; break
-                    else:
-                        match = False; break
-                if not match:
-                    continue
-
-            results.append(SearchResult(
-                chunk_id=chunk.id,
-                document_id=chunk.document_id,
-                text=chunk.text,
-                score=float(scores[idx]),
-                metadata={
-                    "filename": chunk.metadata.filename,
-                    "created_at": chunk.metadata.created_at,
-                    **chunk.metadata.extra
-                }
-            ))
-            count += 1
-            if count >= limit:
+        for row, score in zip(top_rows.tolist(), top_scores.tolist()):
+            if not np.isfinite(score):
                 break
-                
+            chunk = self.chunks.get(row_ids[row])
+            if chunk is None:
+                # Deleted after the snapshot was taken
+                continue
+
+            results.append(self._to_result(chunk, float(score), vectors[row] if with_embeddings else None))
+
+        return results
+
+    async def lexical_search(self, query: str, limit: int = 5, filters: Optional[dict] = None,
+                             with_embeddings: bool = False) -> List[SearchResult]:
+        """BM25 keyword search over chunk text; scores are raw BM25."""
+        terms = tokenize(query)
+        if not terms or limit <= 0:
+            return []
+        with self._lock:
+            self._ensure_indexes()
+            vectors, row_ids = self._matrix.vectors, self._row_ids
+            mask = self._matrix.alive.copy()
+            if filters:
+                mask &= self._metadata_index.mask(filters, len(mask))
+            snapshot = self._lexical_index.snapshot(terms)
+
+        scores = self._lexical_index.score(snapshot, len(mask))
+        if scores is None:
+            return []
+        scores[~mask] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if candidates.size > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+
+        results = []
+        for row in candidates.tolist():
+            chunk = self.chunks.get(row_ids[row])
+            if chunk is not None:
+                results.append(self._to_result(chunk, float(scores[row]), vectors[row] if with_embeddings else None))
         return results
 
-    async def delete_document(self, document_id: str):
+    @staticmethod
+    def _to_result(chunk: ChunkRecord, score: float, embedding: Optional[np.ndarray] = None) -> SearchResult:
+        return SearchResult(
+            chunk_id=chunk.id,
+            document_id=chunk.document_id,
+            text=chunk.text,
+            score=score,
+            token_count=chunk.token_count,
+            # Copied so a cached result doesn't pin a matrix buffer that compaction replaced
+            embedding=embedding.copy() if embedding is not None else None,
+            metadata={
+                "filename": chunk.metadata.filename,
+                "created_at": chunk.metadata.created_at,
+                **chunk.metadata.extra
+            }
+        )
+
+    async def delete_document(self, document_id: str, chunk_ids: Optional[List[str]] = None):
+        self._check_writable()
         with self._lock:
-            keys_to_delete = [k for k, v in self.chunks.items() if v.document_id == document_id]
+            if chunk_ids is not None:
+                keys_to_delete = [k for k in chunk_ids if k in self.chunks]
+            else:
+                keys_to_delete = self._document_chunk_ids(document_id)
             for k in keys_to_delete:
-                del self.chunks[k]
-            self._update_index()
+                self._drop_record(k)
+            self._tombstone(keys_to_delete)
+            self._flush()
+            self._bump_generation()
+            self._maybe_schedule_compaction()
+
+    async def get_chunk_texts(self, chunk_ids: List[str]) -> Dict[str, str]:
+        # Chunk records only; the matrix is never touched
+        texts = {}
+        for chunk_id in chunk_ids:
+            chunk = self.chunks.get(chunk_id)
+            if chunk is not None:
+                texts[chunk_id] = chunk.text
+        return texts
+
+    async def get_embeddings(self, chunk_ids: List[str]) -> Dict[str, np.ndarray]:
+        # Rows are normalized, which is how this store would score them anyway
+        with self._lock:
+            vectors = self._matrix.vectors
+            return {cid: np.array(vectors[self._id_to_row[cid]]) for cid in chunk_ids if cid in self._id_to_row}
 
     async def get_document(self, document_id: str) -> Optional[Document]:
         # reconstruct document from chunks
-        chunks = [v for v in self.chunks.values() if v.document_id == document_id]
+        chunks = [self.chunks[k] for k in self._document_chunk_ids(document_id)]
         if not chunks:
             return None
-            
-        # In a real system, we'd store the full doc separately or have chunk order.
-        # Here we just join them. Assuming simple order isn't guaranteed without an index.
-        # But for this MVP, we join blindly.
+
+        # Without the document registry, chunk_index (set by every chunker) gives the order
+        chunks.sort(key=lambda c: c.metadata.extra.get("chunk_index", 0))
         full_text = "\n\n".join([c.text for c in chunks])
         first_chunk = chunks[0]
         
@@ -2,6 +2,8 @@ from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from .config import get_settings
 from .routers import mcp_router
+from .services.rag_service import warm_up
+from .services.ingest_jobs import get_job_queue
 from .core.security import SecurityMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 import logging
@@ -14,9 +16,25 @@ logger = logging.getLogger("rag_mcp_server")
 async def lifespan(app: FastAPI):
     settings = get_settings()
     logger.info(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
-    # In a real app, initialize DB connections here
+    # Build the selected backend, embedder and tokenizer now instead of on the first request
+    try:
+        report = await warm_up()
+        logger.info("Startup time per component: " + ", ".join(f"{name}={seconds:.3f}s" for name, seconds in report.items()))
+    except Exception as e:
+        # Components are created lazily as well, so a backend that is down only fails its requests
+        logger.warning(f"Warm-up failed: {e}")
+    job_queue = None
+    try:
+        job_queue = get_job_queue()
+        job_queue.start()
+    except Exception as e:
+        # Submitting an ingest_file job retries the start
+        logger.warning(f"Ingestion job queue failed to start: {e}")
     yield
     logger.info("Shutting down")
+    if job_queue is not None:
+        # Jobs cut short here are resumed on the next start
+        await job_queue.stop()
 
 def create_app() -> FastAPI:
     settings = get_settings()
@@ -1,8 +1,8 @@
-from fastapi import APIRouter, HTTPException, Request, UploadFile, File
-from fastapi.responses import JSONResponse
-import os
-import shutil
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from ..services.rag_service import get_rag_service
+from ..services.ingest_jobs import get_job_queue
+from ..services.uploads import UploadTooLarge, get_upload_store, receive_upload
 from ..core.models import Resource, Tool, Prompt, JsonRpcRequest, JsonRpcResponse
 import json
 import logging
@@ -15,8 +15,9 @@ logger = logging.getLogger(__name__)
 @router.get("/resources/list")
 async def list_resources():
     return [
-        Resource(uri="rag://search?q={query}", name="Search RAG Knowledge Base", description="Search the vector database for relevant documentation"),
-        Resource(uri="rag://documents/{id}", name="Get Document", description="Retrieve a full document by ID")
+        Resource(uri="rag://search?q={query}", name="Search RAG Knowledge Base", description="Search the vector database for relevant documentation (add &mode=hybrid for BM25 + vector)"),
+        Resource(uri="rag://documents/{id}", name="Get Document", description="Retrieve a full document by ID"),
+        Resource(uri="rag://jobs/{id}", name="Ingestion Job", description="Status and per-stage progress of an ingest_file job")
     ]
 
 @router.get("/tools/list")
@@ -37,19 +38,46 @@ async def list_tools():
         ),
         Tool(
             name="ingest_file",
-            description="Ingest a local file (PDF or Text) into the RAG system",
+            description="Queue a local file (PDF or Text) for ingestion; poll the returned rag://jobs/{id} resource",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "file_path": {"type": "string", "description": "Absolute path to the file"},
-                    "metadata": {"type": "object", "description": "Optional metadata"}
+                    "metadata": {"type": "object", "description": "Optional metadata"},
+                    "filename": {"type": "string", "description": "Document name (default: the file's name; pass the one /api/upload returns)"},
+                    "wait": {"type": "boolean", "description": "Ingest within this request instead of queueing a job (default false)"}
                 },
                 "required": ["file_path"]
             }
         ),
+        Tool(
+            name="ingest_directory",
+            description="Bulk-ingest all PDF/text files under a local directory (parallel pipeline)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "directory": {"type": "string", "description": "Absolute path to the directory"},
+                    "recursive": {"type": "boolean", "description": "Descend into subdirectories (default true)"},
+                    "metadata": {"type": "object", "description": "Optional metadata applied to every file"}
+                },
+                "required": ["directory"]
+            }
+        ),
+        Tool(
+            name="ingest_archive",
+            description="Bulk-ingest the PDF/text files inside a local .zip or .tar(.gz) archive",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "archive_path": {"type": "string", "description": "Absolute path to the archive"},
+                    "metadata": {"type": "object", "description": "Optional metadata applied to every file"}
+                },
+                "required": ["archive_path"]
+            }
+        ),
         Tool(
             name="ask_question",
-            description="Ask a question to the RAG system and get a generated answer based on documents",
+            description="Ask a question to the RAG system and get a generated answer based on documents (POST /tools/call/stream for an SSE stream)",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -58,6 +86,22 @@ async def list_tools():
                 "required": ["query"]
             }
         ),
+        Tool(
+            name="search_batch",
+            description="Search the knowledge base for many queries at once (one embedding request, one scoring pass)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "queries": {"type": "array", "items": {"type": "string"}, "description": "Queries to search for"},
+                    "limit": {"type": "integer", "description": "Results per query (default 5)"},
+                    "mode": {"type": "string", "enum": ["vector", "hybrid"], "description": "Defaults to the server's SEARCH_MODE"},
+                    "filters": {"type": "object", "description": "Optional metadata equality filters"},
+                    "nprobe": {"type": "integer", "description": "FAISS IVF probes"},
+                    "ef_search": {"type": "integer", "description": "HNSW search depth (FAISS, pgvector)"}
+                },
+                "required": ["queries"]
+            }
+        ),
         Tool(
             name="delete_document",
             description="Delete a document from the RAG system",
@@ -96,11 +140,14 @@ async def read_resource(uri: str):
         qs = parse_qs(parsed.query)
         query = qs.get('q', [''])[0]
         limit = int(qs.get('limit', ['5'])[0])
+        # Optional ANN knobs (FAISS IVF / HNSW, pgvector HNSW ef_search)
+        search_params = {k: int(qs[k][0]) for k in ("nprobe", "ef_search") if k in qs}
+        mode = qs.get('mode', [None])[0]  # vector | hybrid
         
         if not query:
             raise HTTPException(status_code=400, detail="Missing query parameter 'q'")
             
-        results = await service.search(query, limit)
+        results = await service.search(query, limit, search_params=search_params, mode=mode)
         
         # Serialize results to text for the resource content
         content = json.dumps([r.model_dump() for r in results], indent=2)
@@ -112,6 +159,20 @@ async def read_resource(uri: str):
             }]
         }
 
+    # Handle Ingestion Job Resource
+    if uri.startswith("rag://jobs/"):
+        job = await get_job_queue().get(uri.split("/")[-1])
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+
+        return {
+            "contents": [{
+                "uri": uri,
+                "mimeType": "application/json",
+                "text": json.dumps(job)
+            }]
+        }
+
     # Handle Document Resource
     if uri.startswith("rag://documents/"):
         doc_id = uri.split("/")[-1]
@@ -134,26 +195,94 @@ async def read_resource(uri: str):
 # --- UI Helper endpoints ---
 
 @router.post("/api/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(request: Request):
     """
     Helper endpoint to save uploaded files to disk so they can be ingested by path.
+    Files are streamed to content-addressed storage under STORAGE_DIR/uploads;
+    "indexed" names the ingest job if this content is already in the index under this filename.
     """
+    length = request.headers.get("content-length")
     try:
-        # Save to ./data/uploads
-        upload_dir = os.path.join(os.getcwd(), "data", "uploads")
-        if not os.path.exists(upload_dir):
-            os.makedirs(upload_dir)
-            
-        file_path = os.path.join(upload_dir, file.filename)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        return {"file_path": file_path, "filename": file.filename}
+        upload = await receive_upload(
+            request.stream(),
+            request.headers.get("content-type", ""),
+            content_length=int(length) if length and length.isdigit() else None
+        )
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"error": str(e)})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
     except Exception as e:
         logger.error(f"Upload failed: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+    job = await get_job_queue().find_indexed(upload["content_hash"], filename=upload["filename"])
+    upload["indexed"] = {"job_id": job["job_id"], "status": job["status"], "result": job["result"]} if job else None
+    return upload
+
+@router.get("/api/stats")
+async def get_stats():
+    """
+    Helper endpoint exposing cache hit rates and other runtime counters.
+    """
+    stats = get_rag_service().stats()
+    stats["ingest_jobs"] = get_job_queue().stats()
+    stats["uploads"] = get_upload_store().stats()
+    return stats
+
+
+@router.get("/api/ask/stream")
+async def ask_stream(q: str, request: Request):
+    """
+    Server-Sent Events variant of ask_question: a `sources` event, then one
+    `token` event per generated delta, then `done`.
+    """
+    return _sse_response(request, get_rag_service().ask_question_stream(q))
+
+
+# --- Streaming (SSE) ---
+
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _sse_response(request: Request, events) -> StreamingResponse:
+    async def stream():
+        # Flush headers and a first byte before retrieval starts
+        yield ": stream open\n\n"
+        try:
+            async for kind, payload in events:
+                if await request.is_disconnected():
+                    logger.info("SSE client disconnected, cancelling generation")
+                    break
+                if kind == "sources":
+                    payload = [r.model_dump() for r in payload]
+                yield _sse_event(kind, payload)
+            else:
+                yield _sse_event("done", {})
+        except Exception as e:
+            logger.error(f"Streaming error: {e}")
+            yield _sse_event("error", {"message": str(e)})
+        finally:
+            # Closes the upstream completion request if we stopped early
+            await events.aclose()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/tools/call/stream")
+async def call_tool_stream(request: Request):
+    data = await request.json()
+    method = data.get("name")
+    arguments = data.get("arguments", {})
+
+    if method == "ask_question":
+        return _sse_response(request, get_rag_service().ask_question_stream(arguments.get("query")))
+
+    raise HTTPException(status_code=404, detail="Streaming tool not found")
+
 
 # --- Tool handling ---
 
@@ -180,13 +309,46 @@ async def call_tool(request: Request):
 
     elif method == "ingest_file":
         try:
-            result = await service.ingest_file(
-                file_path=arguments.get("file_path"),
+            if arguments.get("wait"):
+                result = await service.ingest_file(
+                    file_path=arguments.get("file_path"),
+                    metadata=arguments.get("metadata", {}),
+                    filename=arguments.get("filename")
+                )
+            else:
+                result = await get_job_queue().submit(
+                    arguments.get("file_path"),
+                    metadata=arguments.get("metadata", {}),
+                    filename=arguments.get("filename")
+                )
+                if "job_id" in result:
+                    result["uri"] = f"rag://jobs/{result['job_id']}"
+            return {"content": [{"type": "text", "text": json.dumps(result)}]}
+        except Exception as e:
+            logger.error(f"Ingest file error: {e}")
+            return {"isError": True, "content": [{"type": "text", "text": str(e)}]}
+
+    elif method == "ingest_directory":
+        try:
+            result = await service.ingest_directory(
+                directory=arguments.get("directory"),
+                metadata=arguments.get("metadata", {}),
+                recursive=arguments.get("recursive", True)
+            )
+            return {"content": [{"type": "text", "text": json.dumps(result)}]}
+        except Exception as e:
+            logger.error(f"Ingest directory error: {e}")
+            return {"isError": True, "content": [{"type": "text", "text": str(e)}]}
+
+    elif method == "ingest_archive":
+        try:
+            result = await service.ingest_archive(
+                archive_path=arguments.get("archive_path"),
                 metadata=arguments.get("metadata", {})
             )
             return {"content": [{"type": "text", "text": json.dumps(result)}]}
         except Exception as e:
-            logger.error(f"Ingest file error: {e}")
+            logger.error(f"Ingest archive error: {e}")
             return {"isError": True, "content": [{"type": "text", "text": str(e)}]}
 
     elif method == "ask_question":
@@ -197,6 +359,26 @@ async def call_tool(request: Request):
             logger.error(f"Ask question error: {e}")
             return {"isError": True, "content": [{"type": "text", "text": str(e)}]}
 
+    elif method == "search_batch":
+        try:
+            queries = arguments.get("queries") or []
+            search_params = {k: int(arguments[k]) for k in ("nprobe", "ef_search") if k in arguments}
+            results = await service.search_many(
+                queries,
+                limit=int(arguments.get("limit", 5)),
+                filters=arguments.get("filters"),
+                search_params=search_params,
+                mode=arguments.get("mode")
+            )
+            payload = [
+                {"query": query, "results": [r.model_dump() for r in hits]}
+                for query, hits in zip(queries, results)
+            ]
+            return {"content": [{"type": "text", "text": json.dumps(payload)}]}
+        except Exception as e:
+            logger.error(f"Search batch error: {e}")
+            return {"isError": True, "content": [{"type": "text", "text": str(e)}]}
+
     elif method == "delete_document":
         try:
             await service.delete_document(arguments.get("document_id"))
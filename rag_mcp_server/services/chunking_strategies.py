@@ -1,5 +1,11 @@
+import asyncio
+import multiprocessing
+import os
 import uuid
-from typing import List
+from bisect import bisect_left
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
 import tiktoken
 import numpy as np
 import re
@@ -7,146 +13,265 @@ from ..core.interfaces import DocumentProcessor, Embedder
 from ..core.models import Chunk, DocumentMetadata
 from ..config import get_settings
 
+SEPARATORS = ["\n\n", "\n", ".", " "]
+
+@lru_cache(maxsize=4)
+def _token_byte_lengths(encoding: tiktoken.Encoding) -> np.ndarray:
+    """Byte length of every token id, so offsets can be computed without decoding."""
+    lengths = np.zeros(encoding.n_vocab, dtype=np.int64)
+    for token in range(encoding.n_vocab):
+        try:
+            lengths[token] = len(encoding.decode_single_token_bytes(token))
+        except KeyError:
+            pass  # unused id
+    return lengths
+
+# Per-process chunker used by RecursiveTokenChunker.process_batch workers
+_worker_chunker = None
+
+def _chunk_in_worker(content: str, filename: str, metadata: dict) -> List[Chunk]:
+    global _worker_chunker
+    if _worker_chunker is None:
+        _worker_chunker = RecursiveTokenChunker()
+    return _worker_chunker.chunk(content, filename, metadata)
+
 class RecursiveTokenChunker(DocumentProcessor):
+    """
+    Splits on a separator hierarchy (paragraph, line, sentence, word, token)
+    so chunks stay under CHUNK_SIZE tokens.
+
+    The document is encoded once; every split is a character span whose
+    token count is read off the token start offsets by bisection, so the
+    cost is linear in document length instead of re-encoding each piece.
+    """
     def __init__(self):
         self.settings = get_settings()
         self.encoding = tiktoken.get_encoding("cl100k_base") # OpenAI Default
         self.chunk_size = self.settings.CHUNK_SIZE
         self.chunk_overlap = self.settings.CHUNK_OVERLAP
 
-    def _split_text(self, text: str, separators: List[str]) -> List[str]:
-        """Recursively split text by separators until chunks represent token limits."""
-        final_chunks = []
+    def _token_starts(self, text: str) -> List[int]:
+        """Character offset of every token, plus len(text) as a sentinel."""
+        tokens = self.encoding.encode_ordinary(text)
+        raw = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        # Byte offset of each token start, then byte -> character index
+        # (a token starting mid-character maps to that character)
+        token_lengths = _token_byte_lengths(self.encoding)[np.asarray(tokens, dtype=np.int64)]
+        byte_starts = np.concatenate(([0], np.cumsum(token_lengths)[:-1])) if len(tokens) else np.zeros(0, dtype=np.int64)
+        char_of_byte = np.cumsum((raw & 0xC0) != 0x80) - 1
+        offsets = char_of_byte[byte_starts].tolist() if len(tokens) else []
+        offsets.append(len(text))
+        return offsets
+
+    def _split_span(self, text: str, starts: List[int], start: int, end: int,
+                    separators: List[str], out: List[Tuple[int, int]]):
+        """
+        Append (start, end) character spans of at most chunk_size tokens to out.
+        Greedy like merging splits one by one, but each chunk jumps straight
+        to its token limit and backs off to the last separator before it.
+        """
         if not separators:
-            # Base case: no more separators, hard split by tokens if needed
-            tokens = self.encoding.encode(text)
-            for i in range(0, len(tokens), self.chunk_size - self.chunk_overlap):
-                chunk_text = self.encoding.decode(tokens[i:i + self.chunk_size])
-                final_chunks.append(chunk_text)
-            return final_chunks
+            # Base case: hard split by tokens with overlap
+            first, last = bisect_left(starts, start), bisect_left(starts, end)
+            step = max(1, self.chunk_size - self.chunk_overlap)
+            for i in range(first, last, step):
+                stop = i + self.chunk_size
+                out.append((starts[i], starts[stop] if stop < last else end))
+                if stop >= last:
+                    break
+            return
 
         separator = separators[0]
-        splits = text.split(separator)
-        
-        current_chunk = []
-        current_len = 0
-        
-        for split in splits:
-            split_len = len(self.encoding.encode(split))
-            
-            if split_len > self.chunk_size:
-                # If a single split is too big, recurse on it with next separator
-                if current_chunk:
-                    final_chunks.append(separator.join(current_chunk))
-                    current_chunk = []
-                    current_len = 0
-                final_chunks.extend(self._split_text(split, separators[1:]))
-                continue
+        pos = start
+        while pos < end:
+            # First character that would push the chunk past chunk_size tokens
+            limit_token = bisect_left(starts, pos) + self.chunk_size
+            limit = starts[limit_token] if limit_token < len(starts) else end
+            if limit >= end:
+                out.append((pos, end))
+                return
 
-            if current_len + split_len > self.chunk_size:
-                final_chunks.append(separator.join(current_chunk))
-                current_chunk = [split]
-                current_len = split_len
+            cut = text.rfind(separator, pos, limit + len(separator))
+            if cut > pos:
+                out.append((pos, cut))
+                pos = cut + len(separator)
+            elif cut == pos:
+                pos += len(separator)
             else:
-                current_chunk.append(split)
-                current_len += split_len
-                
-        if current_chunk:
-            final_chunks.append(separator.join(current_chunk))
-            
-        return final_chunks
+                # The next split alone is too big: recurse with the next separator
+                found = text.find(separator, pos, end)
+                split_end = found if found != -1 else end
+                self._split_span(text, starts, pos, split_end, separators[1:], out)
+                if found == -1:
+                    return
+                pos = found + len(separator)
+
+    def chunk(self, content: str, filename: str, metadata: dict) -> List[Chunk]:
+        """Synchronous chunking; CPU bound."""
+        starts = self._token_starts(content)
+        spans: List[Tuple[int, int]] = []
+        self._split_span(content, starts, 0, len(content), SEPARATORS, spans)
 
-    async def process(self, content: str, filename: str, metadata: dict) -> List[Chunk]:
-        separators = ["\n\n", "\n", ".", " ", ""]
-        text_chunks = self._split_text(content, separators)
-        
         doc_id = str(uuid.uuid4())
         chunks = []
-        for i, text in enumerate(text_chunks):
-            if not text.strip(): continue
-            chunk_id = str(uuid.uuid4())
+        for start, end in spans:
+            raw = content[start:end]
+            text = raw.strip()
+            if not text:
+                continue
+            # Count tokens over the stripped span
+            start += len(raw) - len(raw.lstrip())
+            end = start + len(text)
             chunks.append(Chunk(
-                id=chunk_id,
+                id=str(uuid.uuid4()),
                 document_id=doc_id,
-                text=text.strip(),
+                text=text,
+                token_count=bisect_left(starts, end) - bisect_left(starts, start),
+                char_start=start,
+                char_end=end,
                 metadata=DocumentMetadata(
                     filename=filename,
-                    extra={**metadata, "chunk_index": i}
+                    extra={**metadata, "chunk_index": len(chunks)}
                 )
             ))
         return chunks
 
+    async def process(self, content: str, filename: str, metadata: dict) -> List[Chunk]:
+        return self.chunk(content, filename, metadata)
+
+    def process_batch(self, documents: List[Tuple[str, str, dict]], processes: int = 0) -> List[List[Chunk]]:
+        """
+        Chunk many (content, filename, metadata) documents. With processes > 1
+        (0 = CPU count) they are spread over a process pool.
+        """
+        processes = processes or os.cpu_count() or 1
+        if processes <= 1 or len(documents) <= 1:
+            return [self.chunk(*doc) for doc in documents]
+        with ProcessPoolExecutor(max_workers=min(processes, len(documents)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            return list(pool.map(_chunk_in_worker, *zip(*documents)))
+
 class SemanticChunker(DocumentProcessor):
+    """
+    Breaks between sentences whose embeddings diverge, capped at CHUNK_SIZE
+    tokens per chunk.
+
+    Sentences are embedded in bounded concurrent batches and all neighbour
+    similarities are computed in one vectorized pass. Breakpoints are either
+    a fixed similarity threshold or a percentile of the document's own
+    distance distribution.
+    """
     def __init__(self, embedder: Embedder):
         self.settings = get_settings()
         self.embedder = embedder
         self.threshold = self.settings.SEMANTIC_CHUNK_THRESHOLD
+        self.breakpoint_type = self.settings.SEMANTIC_BREAKPOINT_TYPE.lower()
+        self.percentile = self.settings.SEMANTIC_BREAKPOINT_PERCENTILE
+        self.window = max(1, self.settings.SEMANTIC_WINDOW)
+        self.chunk_size = self.settings.CHUNK_SIZE
+        self.encoding = tiktoken.get_encoding("cl100k_base")
+        self._semaphore = asyncio.Semaphore(max(1, self.settings.SEMANTIC_EMBED_CONCURRENCY))
 
-    async def _embed_sentences(self, sentences: List[str]):
-        return await self.embedder.embed_documents(sentences)
+    async def _embed_batch(self, sentences: List[str]) -> np.ndarray:
+        async with self._semaphore:
+            return await self.embedder.embed_documents(sentences)
 
-    def _split_sentences(self, text: str) -> List[str]:
+    async def _embed_sentences(self, sentences: List[str]) -> np.ndarray:
+        """(n, dim) float32 matrix; rows whose embedding failed are NaN."""
+        size = max(1, self.settings.SEMANTIC_EMBED_BATCH_SIZE)
+        batches = await asyncio.gather(*[
+            self._embed_batch(sentences[i:i + size]) for i in range(0, len(sentences), size)
+        ])
+        dim = max((batch.shape[1] for batch in batches), default=0)
+        matrix = np.full((len(sentences), dim), np.nan, dtype=np.float32)
+        for start, batch in zip(range(0, len(sentences), size), batches):
+            if batch.shape[1] == dim:
+                matrix[start:start + len(batch)] = batch
+        return matrix
+
+    def _split_sentences(self, text: str) -> Tuple[List[str], List[int]]:
+        """Sentences and their token counts; sentences over CHUNK_SIZE are hard split."""
         # Simple regex split for sentences
-        return [s.strip() for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
+        sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
+        out, counts = [], []
+        for sentence, tokens in zip(sentences, self.encoding.encode_ordinary_batch(sentences)):
+            if len(tokens) <= self.chunk_size:
+                out.append(sentence)
+                counts.append(len(tokens))
+                continue
+            for i in range(0, len(tokens), self.chunk_size):
+                piece = tokens[i:i + self.chunk_size]
+                out.append(self.encoding.decode(piece))
+                counts.append(len(piece))
+        return out, counts
+
+    def _similarities(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        Similarity across each sentence gap i|i+1, comparing the mean of the
+        `window` sentences before it with the mean of the `window` after it.
+        Gaps next to a failed embedding come back NaN.
+        """
+        n = len(embeddings)
+        unit = np.nan_to_num(embeddings, nan=0.0)
+        unit /= np.linalg.norm(unit, axis=1, keepdims=True) + 1e-10
+        w = self.window
+        if w > 1:
+            cumsum = np.vstack([np.zeros((1, unit.shape[1]), dtype=np.float32), np.cumsum(unit, axis=0)])
+            gaps = np.arange(1, n)
+            left = cumsum[gaps] - cumsum[np.maximum(gaps - w, 0)]
+            right = cumsum[np.minimum(gaps + w, n)] - cumsum[gaps]
+        else:
+            left, right = unit[:-1], unit[1:]
+        norms = np.linalg.norm(left, axis=1) * np.linalg.norm(right, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # A side with no usable embedding has zero norm -> NaN
+            return np.where(norms > 0, np.einsum("ij,ij->i", left, right) / norms, np.nan)
+
+    def _breakpoints(self, similarities: np.ndarray) -> np.ndarray:
+        """Boolean per gap: start a new chunk after sentence i."""
+        valid = ~np.isnan(similarities)
+        breaks = np.zeros(len(similarities), dtype=bool)
+        if not valid.any():
+            # No usable embeddings: the token cap alone decides
+            return breaks
+        if self.breakpoint_type == "percentile":
+            cutoff = np.percentile(1.0 - similarities[valid], self.percentile)
+            breaks[valid] = (1.0 - similarities[valid]) > cutoff
+        else:
+            breaks[valid] = similarities[valid] <= self.threshold
+        return breaks
 
     async def process_async(self, content: str, filename: str, metadata: dict) -> List[Chunk]:
-        # Semantic chunking requires async embedding, but the interface is sync process()
-        # We will need to adapt or rely on the fact that Embedder is async.
-        # Since standard DocumentProcessor.process is sync, and semantic needs I/O, 
-        # we might violate the interface or need to update the interface to be async.
-        # For now, let's assume we can run loop or we update interface.
-        # Given potential complexity, I will create a helper and run it.
-        sentences = self._split_sentences(content)
+        sentences, token_counts = self._split_sentences(content)
         if not sentences:
             return []
-            
-        embeddings = await self._embed_sentences(sentences)
-        
-        # Calculate cosine similarity between adjacent sentences
-        distances = []
-        for i in range(len(embeddings) - 1):
-            if embeddings[i] is None or embeddings[i+1] is None:
-                distances.append(0)
-                continue
-            
-            v1 = np.array(embeddings[i])
-            v2 = np.array(embeddings[i+1])
-            
-            # cosine sim
-            sim = np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2) + 1e-10)
-            distances.append(sim)
-
-        # Build chunks based on threshold
-        chunks = []
-        current_chunk_sentences = [sentences[0]]
-        
+
+        breaks = np.zeros(0, dtype=bool)
+        if len(sentences) > 1:
+            breaks = self._breakpoints(self._similarities(await self._embed_sentences(sentences)))
+
         doc_id = str(uuid.uuid4())
-        
-        for i, dist in enumerate(distances):
-            if dist > self.threshold:
-                # High similarity, keep together
-                current_chunk_sentences.append(sentences[i+1])
-            else:
-                # Low similarity, break chunk
-                text = " ".join(current_chunk_sentences)
-                chunks.append(Chunk(
-                    id=str(uuid.uuid4()),
-                    document_id=doc_id,
-                    text=text,
-                    metadata=DocumentMetadata(filename=filename, extra=metadata)
-                ))
-                current_chunk_sentences = [sentences[i+1]]
-                
-        # Last chunk
-        if current_chunk_sentences:
-            text = " ".join(current_chunk_sentences)
+        chunks: List[Chunk] = []
+
+        def emit(group: List[str], tokens: int):
             chunks.append(Chunk(
                 id=str(uuid.uuid4()),
                 document_id=doc_id,
-                text=text,
-                metadata=DocumentMetadata(filename=filename, extra=metadata)
+                text=" ".join(group),
+                token_count=tokens,
+                metadata=DocumentMetadata(filename=filename, extra={**metadata, "chunk_index": len(chunks)})
             ))
-            
+
+        # Each sentence is at most CHUNK_SIZE tokens, so a group can always
+        # take at least one; joining spaces are not counted.
+        group, group_tokens = [sentences[0]], token_counts[0]
+        for i in range(1, len(sentences)):
+            if breaks[i - 1] or group_tokens + token_counts[i] > self.chunk_size:
+                emit(group, group_tokens)
+                group, group_tokens = [], 0
+            group.append(sentences[i])
+            group_tokens += token_counts[i]
+        emit(group, group_tokens)
         return chunks
 
     async def process(self, content: str, filename: str, metadata: dict) -> List[Chunk]:
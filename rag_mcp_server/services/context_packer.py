@@ -0,0 +1,153 @@
+import re
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from ..core.models import SearchResult
+from ..infra.lexical_index import tokenize
+from ..services.token_utils import count_scaffold_tokens, get_encoding
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+@dataclass
+class _Option:
+    text: str
+    tokens: int
+    value: float
+
+
+class ContextPacker:
+    """
+    Chooses which retrieved chunks go into the prompt.
+
+    1. MMR over the stored embeddings gives each candidate a marginal value
+       (relevance minus redundancy with what is already chosen); candidates
+       nearly identical to a better one are dropped outright.
+    2. A 0/1 knapsack over (value, tokens) fills MAX_CONTEXT_TOKENS, instead
+       of stopping at the first snippet that does not fit.
+    3. Optionally, long chunks also compete as a trimmed variant holding only
+       the sentences that share terms with the question.
+    """
+    def __init__(self, max_tokens: int, model: str, mmr_lambda: float = 0.7,
+                 dedup_threshold: float = 0.95, trim_sentences: bool = False, trim_min_tokens: int = 200):
+        self.max_tokens = max_tokens
+        self.model = model
+        self.mmr_lambda = mmr_lambda
+        self.dedup_threshold = dedup_threshold
+        self.trim_sentences = trim_sentences
+        self.trim_min_tokens = trim_min_tokens
+
+    @staticmethod
+    def prefix(result: SearchResult) -> str:
+        return f"Source ({result.metadata.get('filename')}): "
+
+    def _tokens(self, result: SearchResult) -> int:
+        if result.token_count is not None:
+            return result.token_count
+        return len(get_encoding(self.model).encode_ordinary(result.text))
+
+    def _relevance(self, results: List[SearchResult]) -> np.ndarray:
+        # Backends score on different scales (cosine, 1/(1+L2), RRF); only order matters
+        scores = np.array([r.score for r in results], dtype=np.float64)
+        spread = scores.max() - scores.min()
+        if spread <= 0:
+            return np.ones(len(results))
+        return (scores - scores.min()) / spread
+
+    def _mmr(self, results: List[SearchResult], relevance: np.ndarray) -> np.ndarray:
+        """Marginal value per candidate; -inf marks near-duplicates."""
+        n = len(results)
+        dim = next((len(r.embedding) for r in results if r.embedding is not None and len(r.embedding)), 0)
+        if dim == 0:
+            return relevance.copy()
+
+        matrix = np.zeros((n, dim), dtype=np.float32)
+        for i, r in enumerate(results):
+            if r.embedding is not None and len(r.embedding) == dim:
+                matrix[i] = r.embedding
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-10
+        similarity = matrix @ matrix.T
+
+        values = np.full(n, -np.inf)
+        max_sim = np.zeros(n)
+        remaining = np.ones(n, dtype=bool)
+        for step in range(n):
+            mmr = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * max_sim
+            mmr[~remaining] = -np.inf
+            best = int(np.argmax(mmr))
+            if not np.isfinite(mmr[best]):
+                break
+            remaining[best] = False
+            values[best] = max(mmr[best], 0.0) + 1e-6  # chosen items always beat empty slots
+            max_sim = np.maximum(max_sim, similarity[best])
+            # Near-duplicates of a chosen chunk never enter the prompt
+            remaining &= ~(similarity[best] >= self.dedup_threshold)
+        return values
+
+    def _trim(self, text: str, query_terms: set) -> Optional[Tuple[str, float]]:
+        """Sentences sharing a term with the query, and the share of term hits kept."""
+        sentences = [s for s in _SENTENCE_RE.split(text) if s.strip()]
+        if len(sentences) < 2:
+            return None
+        hits = [len(query_terms.intersection(tokenize(s))) for s in sentences]
+        total = sum(hits)
+        kept = [s for s, h in zip(sentences, hits) if h]
+        if not total or len(kept) == len(sentences):
+            return None
+        return " ".join(kept), sum(h for h in hits if h) / total
+
+    def _options(self, query: str, results: List[SearchResult], values: np.ndarray) -> List[List[_Option]]:
+        separator = count_scaffold_tokens("\n\n", self.model)
+        query_terms = set(tokenize(query)) if self.trim_sentences else set()
+        groups = []
+        for result, value in zip(results, values):
+            if not np.isfinite(value):
+                groups.append([])
+                continue
+            overhead = count_scaffold_tokens(self.prefix(result), self.model) + separator
+            tokens = self._tokens(result)
+            options = [_Option(result.text, tokens + overhead, float(value))]
+            if query_terms and tokens >= self.trim_min_tokens:
+                trimmed = self._trim(result.text, query_terms)
+                if trimmed is not None:
+                    text, kept_share = trimmed
+                    trimmed_tokens = len(get_encoding(self.model).encode_ordinary(text))
+                    # Slightly below the full chunk so trimming only wins under budget pressure
+                    options.append(_Option(text, trimmed_tokens + overhead, float(value) * kept_share * 0.9))
+            groups.append(options)
+        return groups
+
+    def _knapsack(self, groups: List[List[_Option]]) -> List[Optional[int]]:
+        """Multiple-choice knapsack: at most one option per group, maximizing value."""
+        budget = self.max_tokens
+        best = np.zeros(budget + 1)
+        choice = np.full((len(groups), budget + 1), -1, dtype=np.int8)
+        for g, options in enumerate(groups):
+            current = best.copy()
+            for o, option in enumerate(options):
+                if option.tokens > budget:
+                    continue
+                candidate = np.full(budget + 1, -np.inf)
+                candidate[option.tokens:] = best[:budget + 1 - option.tokens] + option.value
+                better = candidate > current
+                current[better] = candidate[better]
+                choice[g][better] = o
+            best = current
+
+        picks: List[Optional[int]] = [None] * len(groups)
+        remaining = int(np.argmax(best))
+        for g in range(len(groups) - 1, -1, -1):
+            o = int(choice[g][remaining])
+            if o >= 0:
+                picks[g] = o
+                remaining -= groups[g][o].tokens
+        return picks
+
+    def pack(self, query: str, results: List[SearchResult]) -> List[Tuple[SearchResult, str]]:
+        """(result, text to include) for the chosen chunks, in retrieval order."""
+        if not results or self.max_tokens <= 0:
+            return []
+        values = self._mmr(results, self._relevance(results))
+        groups = self._options(query, results, values)
+        picks = self._knapsack(groups)
+        return [(r, groups[i][o].text) for i, (r, o) in enumerate(zip(results, picks)) if o is not None]
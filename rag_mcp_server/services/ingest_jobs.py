@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+from ..config import get_settings
+from ..infra.job_store import JobStore
+from ..services.chunking_strategies import SemanticChunker
+from ..services.ingest_pipeline import _chunk_text, _load_file
+from ..services.rag_service import get_rag_service
+
+logger = logging.getLogger(__name__)
+
+_HASH_BLOCK_BYTES = 1 << 20
+# How often to re-check a running original that this process is not running (e.g. another server)
+_ORIGINAL_POLL_SECONDS = 1.0
+
+_job_queue = None
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_job_queue() -> "IngestJobQueue":
+    global _job_queue
+    if _job_queue is None:
+        settings = get_settings()
+        # Job history follows the index: a job pointing at chunks that were never persisted would lie
+        persistent = get_rag_service().vector_store.persistent
+        _job_queue = IngestJobQueue(
+            JobStore(db_path=os.path.join(settings.STORAGE_DIR, "jobs.sqlite3") if persistent else None),
+            workers=settings.INGEST_JOB_WORKERS,
+            max_queued=settings.INGEST_JOB_MAX_QUEUED,
+            lease_seconds=settings.INGEST_JOB_LEASE_SECONDS
+        )
+    return _job_queue
+
+
+class IngestJobQueue:
+    """
+    ingest_file in the background: submit() only stats the file and records
+    a job, so its latency does not depend on the document. A fixed number of
+    workers then hash the file, extract and chunk it in a process pool, and
+    embed and store it through RAGService, recording each stage in the
+    JobStore for polling (rag://jobs/{id}).
+
+    Content already ingested by an earlier job (same SHA-256, filename and
+    metadata, document still registered) is not processed again; the job ends as "duplicate" and
+    points at the original. If the original is still running, the job waits
+    for it and decides once it has finished, so a failed original does not
+    leave its duplicates without a result.
+
+    Server processes sharing the job database each hold a lease on the jobs
+    they run and renew it while they live; a job is only run again once its
+    lease has expired.
+    """
+    def __init__(self, store: JobStore, workers: int = 2, max_queued: int = 0, lease_seconds: float = 60.0):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.lease_seconds = lease_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._hash_lock: Optional[asyncio.Lock] = None
+        self._finished: Dict[str, asyncio.Event] = {}  # job id -> set when this process finishes running it
+
+    def start(self):
+        """Start the workers and resume queued jobs and those whose process died (idempotent)."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._hash_lock = asyncio.Lock()
+        self._pool = self._new_pool()
+        self.store.requeue_expired()
+        pending = self.store.queued()
+        for job_id in pending:
+            self._queue.put_nowait(job_id)
+        if pending:
+            logger.info(f"Resuming {len(pending)} ingestion job(s)")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self):
+        """Cancel the workers; jobs they were running go back to the queue for the next start()."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._call(self.store.release, self.owner)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: the server process holds threads (compaction, executors) that fork would copy mid-state
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def _call(self, fn, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, fn, *args)
+
+    async def submit(self, file_path: str, metadata: dict = {}, filename: Optional[str] = None) -> dict:
+        """filename, if given, names the document instead of the file's own name (uploads are stored by hash)."""
+        self.start()
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return {"status": "error", "message": f"File not found: {file_path}"}
+        path = os.path.realpath(file_path)
+        filename = os.path.basename(filename or file_path)
+        # Resubmitting the file under another name or metadata is a new job, not a repeat
+        options = hashlib.sha256(json.dumps([filename, metadata], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        job_id = str(uuid.uuid4())
+        job = await self._call(
+            self.store.add, job_id, f"{path}:{stat.st_size}:{stat.st_mtime_ns}:{options}", path,
+            filename, dict(metadata), self.max_queued
+        )
+        if job is None:
+            return {"status": "error", "message": f"Ingestion queue is full ({self.max_queued} jobs waiting)"}
+        if job["job_id"] == job_id:
+            self._queue.put_nowait(job_id)
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self._call(self.store.get, job_id)
+
+    async def find_indexed(self, content_hash: str, exclude_id: str = "", filename: Optional[str] = None,
+                           metadata: Optional[dict] = None) -> Optional[dict]:
+        """
+        The job that ingested this content (under filename and metadata, when
+        given), if its document is still in the index, or the job ingesting
+        it right now.
+        """
+        original = await self._call(self.store.find_by_hash, content_hash, exclude_id, filename, metadata)
+        if original is not None and original["status"] == "succeeded":
+            registry = get_rag_service().document_registry
+            document_id = (original["result"] or {}).get("document_id")
+            if registry is not None and (document_id is None or await self._call(registry.get, document_id) is None):
+                return None  # deleted since; ingest it again
+        return original
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "running": bool(self._tasks), "jobs": self.store.counts()}
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self._call(self.store.renew, self.owner, list(self._finished), self.lease_seconds)
+                # Jobs another process was running when it died
+                expired = await self._call(self.store.requeue_expired)
+            except Exception as e:
+                logger.error(f"Ingestion job lease renewal failed: {e}")
+                continue
+            for job_id in expired:
+                self._queue.put_nowait(job_id)
+            if expired:
+                logger.info(f"Requeued {len(expired)} ingestion job(s) whose lease expired")
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._finished[job_id] = asyncio.Event()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion job {job_id} failed: {e}")
+                if isinstance(e, BrokenProcessPool) and self._pool is not None and self._pool._broken:
+                    # A worker process died (e.g. killed for memory); later jobs get a fresh pool
+                    self._pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = self._new_pool()
+                await self._call(self.store.finish, job_id, "failed", None, str(e))
+            finally:
+                self._finished.pop(job_id).set()
+
+    async def _wait_finished(self, job_id: str):
+        finished = self._finished.get(job_id)
+        if finished is not None:
+            await finished.wait()
+        else:
+            await asyncio.sleep(_ORIGINAL_POLL_SECONDS)
+
+    async def _run(self, job_id: str):
+        job = await self._call(self.store.claim, job_id, self.owner, self.lease_seconds)
+        if job is None:
+            return
+        service = get_rag_service()
+        path, filename, metadata = job["file_path"], job["filename"], job["metadata"]
+
+        content_hash = await self._call(file_sha256, path)
+        while True:
+            # Serialized so two workers hashing the same content cannot both miss each other
+            async with self._hash_lock:
+                original = await self.find_indexed(content_hash, job_id, filename, metadata)
+                if original is None or original["status"] == "succeeded":
+                    await self._call(self.store.set_hash, job_id, content_hash)
+                    break
+            # Still being ingested: its result (or failure) decides whether this job has work to do
+            await self._wait_finished(original["job_id"])
+        if original is not None:
+            await self._call(self.store.finish, job_id, "duplicate", original["result"], None, original["job_id"])
+            return
+
+        loop = asyncio.get_event_loop()
+        await self._call(self.store.set_stage, job_id, "extracting")
+        _, text, metadata = await loop.run_in_executor(self._pool, _load_file, path, filename, metadata, False)
+
+        await self._call(self.store.set_stage, job_id, "chunking")
+        if isinstance(service.text_processor, SemanticChunker):
+            # Needs the embedder, which lives in this process
+            chunks = await service.text_processor.process(text, filename, metadata)
+        else:
+            chunks = await loop.run_in_executor(self._pool, _chunk_text, text, filename, metadata)
+        if not chunks:
+            raise ValueError("No content to process")
+        await self._call(self.store.set_stage, job_id, "chunking", len(chunks))
+
+        result = await service.ingest_chunks(chunks, progress=lambda stage: self._call(self.store.set_stage, job_id, stage))
+        await self._call(self.store.finish, job_id, "succeeded", result)
@@ -0,0 +1,352 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from ..config import get_settings
+from ..core.interfaces import DocumentProcessor, Embedder, VectorStore
+from ..core.models import Chunk
+from ..core.vector_utils import attach_embeddings
+from ..services.chunking_strategies import SemanticChunker
+from ..services.processor_factory import get_document_processor, get_file_processor
+from ..services.token_utils import fill_token_counts
+from ..infra.simhash_index import SimHashIndex
+from ..infra.document_registry import DocumentRegistry
+
+logger = logging.getLogger(__name__)
+
+_MAX_REPORTED_ERRORS = 20
+
+# --- Worker process side ---
+
+_worker_processors: Dict[str, DocumentProcessor] = {}
+
+def _load_file(path: str, filename: str, metadata: dict, chunk: bool) -> Tuple[Optional[List[Chunk]], str, dict]:
+    """
+    Runs in a pool process: extract text and, unless chunking needs the
+    embedder (semantic strategy), chunk it too.
+    Returns (chunks or None, text, metadata).
+    """
+    metadata = dict(metadata)
+    if os.path.splitext(path)[1].lower() == ".pdf":
+        if "pdf" not in _worker_processors:
+            _worker_processors["pdf"] = get_file_processor(".pdf")
+        text = _worker_processors["pdf"].extract(path)
+        metadata["original_format"] = "pdf"
+        metadata["extracted_via"] = "pymupdf4llm"
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+
+    if not chunk:
+        return None, text, metadata
+    return _chunk_text(text, filename, metadata), "", metadata
+
+def _chunk_text(text: str, filename: str, metadata: dict) -> List[Chunk]:
+    """Runs in a pool process: chunk extracted text with the configured (non-semantic) strategy."""
+    if "text" not in _worker_processors:
+        _worker_processors["text"] = get_document_processor()
+    chunks = asyncio.run(_worker_processors["text"].process(text, filename, metadata))
+    fill_token_counts(chunks)
+    return chunks
+
+# --- Near-duplicates ---
+
+async def find_duplicates(dedup_index: SimHashIndex, vector_store: VectorStore,
+                          chunks: List[Chunk]) -> Tuple[List[Chunk], List[Tuple[Chunk, str]], Dict[str, int]]:
+    """
+    Split chunks into (to embed, [(duplicate, canonical chunk id)], fingerprints).
+    Duplicates are still stored under their own document and metadata; they
+    only skip the embedder and take their canonical's vector instead. Those
+    matching a stored chunk get it here; those matching a chunk in the same
+    batch get it from copy_canonical_embeddings() once the batch is embedded.
+    A canonical the store cannot hand a vector for is ignored: the chunk is embedded.
+    """
+    canonical, fingerprints = dedup_index.find(chunks)
+    batch_ids = {c.id for c in chunks}
+    stored_ids = list({match for match in canonical.values() if match not in batch_ids})
+    stored = (await vector_store.get_embeddings(stored_ids) or {}) if stored_ids else {}
+
+    to_embed, duplicates = [], []
+    for chunk in chunks:
+        match = canonical.get(chunk.id)
+        if match is None or (match not in batch_ids and match not in stored):
+            to_embed.append(chunk)
+            continue
+        if match in stored:
+            chunk.embedding = stored[match]
+        duplicates.append((chunk, match))
+    return to_embed, duplicates, fingerprints
+
+def copy_canonical_embeddings(embedded: List[Chunk], duplicates: List[Tuple[Chunk, str]]):
+    """Give duplicates of chunks embedded in the same batch their canonical's vector (None if that failed)."""
+    by_id = {c.id: c for c in embedded}
+    for chunk, match in duplicates:
+        if match in by_id:
+            chunk.embedding = by_id[match].embedding
+
+# --- File discovery ---
+
+def discover_files(directory: str, recursive: bool = True) -> List[str]:
+    extensions = {e.strip().lower() for e in get_settings().INGEST_EXTENSIONS.split(",") if e.strip()}
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in extensions:
+                found.append(os.path.join(root, name))
+        if not recursive:
+            break
+    return found
+
+def extract_archive(archive_path: str, destination: str):
+    """Unpack a .zip or tar archive, skipping links and entries escaping destination."""
+    destination = os.path.realpath(destination)
+
+    def safe_target(name: str) -> Optional[str]:
+        target = os.path.realpath(os.path.join(destination, name))
+        return target if target.startswith(destination + os.sep) else None
+
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for member in archive.infolist():
+                if not member.is_dir() and safe_target(member.filename):
+                    archive.extract(member, destination)
+    elif tarfile.is_tarfile(archive_path):
+        with tarfile.open(archive_path) as archive:
+            members = [m for m in archive.getmembers() if m.isfile() and safe_target(m.name)]
+            archive.extractall(destination, members=members)
+    else:
+        raise ValueError(f"Unsupported archive format: {archive_path}")
+
+# --- Pipeline ---
+
+class _StageStats:
+    def __init__(self):
+        self.documents = 0
+        self.chunks = 0
+        self.busy_seconds = 0.0
+        self._first_start: Optional[float] = None
+        self._last_end: Optional[float] = None
+
+    def record(self, documents: int, chunks: int, started: float):
+        now = time.perf_counter()
+        self.documents += documents
+        self.chunks += chunks
+        self.busy_seconds += now - started
+        if self._first_start is None or started < self._first_start:
+            self._first_start = started
+        self._last_end = now
+
+    def to_dict(self) -> dict:
+        active = (self._last_end - self._first_start) if self._first_start is not None else 0.0
+        return {
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "active_seconds": round(active, 3),
+            "documents_per_second": round(self.documents / active, 2) if active else 0.0,
+            "chunks_per_second": round(self.chunks / active, 2) if active else 0.0,
+        }
+
+
+class IngestPipeline:
+    """
+    Staged bulk ingestion:
+      extract + chunk (process pool) -> embed (concurrent batches) -> store (large batches)
+
+    Stages are joined by bounded asyncio queues, so a slow embedder or store
+    holds back extraction instead of buffering the whole corpus in memory.
+    """
+    def __init__(self, text_processor: DocumentProcessor, embedder: Embedder, vector_store: VectorStore,
+                 dedup_index: Optional[SimHashIndex] = None, document_registry: Optional[DocumentRegistry] = None):
+        self.text_processor = text_processor
+        self.embedder = embedder
+        self.vector_store = vector_store
+        self.dedup_index = dedup_index
+        self.document_registry = document_registry
+        self.duplicates_skipped = 0
+        self.settings = get_settings()
+        self.stats = {"extract": _StageStats(), "embed": _StageStats(), "store": _StageStats()}
+        self.errors: List[Dict[str, str]] = []
+        self.failed = 0
+        self.stored_documents = 0
+
+    def _fail(self, filenames: List[str], error: Exception):
+        self.failed += len(filenames)
+        for filename in filenames:
+            logger.error(f"Bulk ingest failed for {filename}: {error}")
+            if len(self.errors) < _MAX_REPORTED_ERRORS:
+                self.errors.append({"file": filename, "error": str(error)})
+
+    async def run(self, files: List[Tuple[str, str, dict]]) -> dict:
+        """files: (path, filename, metadata) triples."""
+        settings = self.settings
+        started = time.perf_counter()
+        workers = settings.INGEST_WORKERS or os.cpu_count() or 1
+        docs_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+        store_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+
+        # spawn: the server process holds threads (compaction, executors) that fork would copy mid-state
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            extract = asyncio.create_task(self._extract_stage(pool, workers, files, docs_queue))
+            embedders = [
+                asyncio.create_task(self._embed_stage(docs_queue, store_queue))
+                for _ in range(max(1, settings.INGEST_EMBED_CONCURRENCY))
+            ]
+            store = asyncio.create_task(self._store_stage(store_queue))
+            tasks = [extract, *embedders, store]
+            try:
+                await extract
+                for _ in embedders:
+                    await docs_queue.put(None)
+                await asyncio.gather(*embedders)
+                await store_queue.put(None)
+                await store
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
+
+        elapsed = time.perf_counter() - started
+        total_chunks = self.stats["store"].chunks
+        logger.info(
+            f"Bulk ingest: {self.stored_documents}/{len(files)} files, {total_chunks} chunks "
+            f"in {elapsed:.1f}s ({self.failed} failed)"
+        )
+        return {
+            "status": "success" if self.stored_documents else "error",
+            "files_total": len(files),
+            "files_ingested": self.stored_documents,
+            "files_failed": self.failed,
+            "chunks_count": total_chunks,
+            "duplicates_skipped": self.duplicates_skipped,
+            "elapsed_seconds": round(elapsed, 3),
+            "stages": {name: stage.to_dict() for name, stage in self.stats.items()},
+            "errors": self.errors,
+        }
+
+    async def _extract_stage(self, pool: ProcessPoolExecutor, workers: int,
+                             files: List[Tuple[str, str, dict]], docs_queue: asyncio.Queue):
+        loop = asyncio.get_event_loop()
+        chunk_in_worker = not isinstance(self.text_processor, SemanticChunker)
+        in_flight = asyncio.Semaphore(workers * 2)
+
+        async def load(path: str, filename: str, metadata: dict):
+            try:
+                started = time.perf_counter()
+                chunks, text, metadata = await loop.run_in_executor(
+                    pool, _load_file, path, filename, metadata, chunk_in_worker
+                )
+                if chunks is None:
+                    chunks = await self.text_processor.process(text, filename, metadata)
+                    fill_token_counts(chunks)
+                self.stats["extract"].record(1, len(chunks), started)
+                if not chunks:
+                    self._fail([filename], ValueError("No content to process"))
+                    return
+                await docs_queue.put((filename, chunks))
+            except Exception as e:
+                self._fail([filename], e)
+            finally:
+                in_flight.release()
+
+        tasks = []
+        for path, filename, metadata in files:
+            await in_flight.acquire()
+            tasks.append(asyncio.create_task(load(path, filename, metadata)))
+        await asyncio.gather(*tasks)
+
+    async def _embed_stage(self, docs_queue: asyncio.Queue, store_queue: asyncio.Queue):
+        batch_chunks = self.settings.INGEST_EMBED_BATCH_CHUNKS
+        done = False
+        while not done:
+            item = await docs_queue.get()
+            if item is None:
+                return
+            # Group small documents so each embed call is worth a round trip;
+            # the embedder itself packs the call into token-bounded requests.
+            batch = [item]
+            count = len(item[1])
+            while count < batch_chunks and not docs_queue.empty():
+                item = docs_queue.get_nowait()
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+                count += len(item[1])
+
+            started = time.perf_counter()
+            chunks = [chunk for _, doc_chunks in batch for chunk in doc_chunks]
+            dedup = [None] * len(batch)
+            duplicates = []
+            try:
+                if self.dedup_index is not None:
+                    # Near-duplicates reuse their canonical's vector instead of being embedded
+                    chunks, duplicates, fingerprints = await find_duplicates(self.dedup_index, self.vector_store, chunks)
+                    self.duplicates_skipped += len(duplicates)
+                    duplicate_of = {c.id: match for c, match in duplicates}
+                    dedup = [
+                        ({c.id: fingerprints[c.id] for c in doc_chunks if c.id in fingerprints},
+                         [(c, duplicate_of[c.id]) for c in doc_chunks if c.id in duplicate_of])
+                        for _, doc_chunks in batch
+                    ]
+                if chunks:
+                    attach_embeddings(chunks, await self.embedder.embed_documents([c.text for c in chunks]))
+                copy_canonical_embeddings(chunks, duplicates)
+            except Exception as e:
+                self._fail([filename for filename, _ in batch], e)
+                continue
+            self.stats["embed"].record(len(batch), len(chunks), started)
+            for (filename, doc_chunks), doc_dedup in zip(batch, dedup):
+                await store_queue.put((filename, doc_chunks, doc_dedup))
+
+    async def _store_stage(self, store_queue: asyncio.Queue):
+        batch_chunks = self.settings.INGEST_STORE_BATCH_CHUNKS
+        batch: List[Tuple[str, List[Chunk], Optional[tuple]]] = []
+        count = 0
+        done = False
+        while not done:
+            try:
+                # Flush a partial batch if upstream goes quiet
+                item = await asyncio.wait_for(store_queue.get(), timeout=0.5) if batch else await store_queue.get()
+            except asyncio.TimeoutError:
+                item = ()
+            if item is None:
+                done = True
+            elif item:
+                batch.append(item)
+                count += len(item[1])
+                if count < batch_chunks:
+                    continue
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            chunks = [chunk for _, doc_chunks, _ in batch for chunk in doc_chunks]
+            try:
+                if chunks:
+                    await self.vector_store.add_chunks(chunks)
+                self.stored_documents += len(batch)
+                self.stats["store"].record(len(batch), len(chunks), started)
+                if self.dedup_index is not None:
+                    await self._record_dedup(chunks, [d for _, _, d in batch if d is not None])
+                if self.document_registry is not None:
+                    loop = asyncio.get_event_loop()
+                    await loop.run_in_executor(None, self.document_registry.add, chunks)
+            except Exception as e:
+                self._fail([filename for filename, _, _ in batch], e)
+            batch, count = [], 0
+
+    async def _record_dedup(self, stored: List[Chunk], records: List[tuple]):
+        fingerprints = {}
+        duplicates = []
+        for batch_fingerprints, batch_duplicates in records:
+            fingerprints.update(batch_fingerprints)
+            duplicates.extend(batch_duplicates)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.dedup_index.add, stored, fingerprints, duplicates)
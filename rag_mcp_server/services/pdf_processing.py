@@ -11,17 +11,18 @@ class PDFProcessor(DocumentProcessor):
         # We can reuse the default processor's logic for chunking the markdown output
         self.text_processor = DefaultDocumentProcessor()
 
+    def extract(self, path: str) -> str:
+        """Convert a PDF to Markdown (tables preserved). CPU bound and blocking."""
+        if not os.path.exists(path):
+             raise FileNotFoundError(f"PDF file not found: {path}")
+        return pymupdf4llm.to_markdown(path)
+
     async def process(self, content: str, filename: str, metadata: dict) -> List[Chunk]:
         """
         Processes a PDF file path.
         'content' here is expected to be a file path for PDFs.
         """
-        if not os.path.exists(content):
-             raise FileNotFoundError(f"PDF file not found: {content}")
-
-        # Convert PDF to Markdown (tables preserved)
-        # pymupdf4llm.to_markdown returns a string
-        md_text = pymupdf4llm.to_markdown(content)
+        md_text = self.extract(content)
         
         # Now process the markdown text using the standard text chunker
         # We tag it as 'extracted_markdown' in metadata
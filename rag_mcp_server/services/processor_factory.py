@@ -1,26 +1,51 @@
+import importlib
+from typing import Optional
 from ..core.interfaces import DocumentProcessor, Embedder
 from ..config import get_settings
-from ..services.text_processing import DefaultDocumentProcessor
-from ..services.chunking_strategies import RecursiveTokenChunker, SemanticChunker
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Processors are imported on first use: pdf_processing pulls in pymupdf4llm,
+# which alone costs most of a second of startup.
+_CHUNKERS = {
+    "recursive": ("chunking_strategies", "RecursiveTokenChunker"),
+    "semantic": ("chunking_strategies", "SemanticChunker"),
+    "sliding": ("text_processing", "DefaultDocumentProcessor"),
+}
+# File extension -> processor taking a path (formats that need extraction)
+_FILE_PROCESSORS = {
+    ".pdf": ("pdf_processing", "PDFProcessor"),
+}
+
+def _load(module: str, name: str):
+    return getattr(importlib.import_module(f".{module}", __package__), name)
+
 def get_document_processor(embedder: Embedder = None) -> DocumentProcessor:
     settings = get_settings()
     strategy = settings.CHUNKING_STRATEGY.lower()
-    
+
     logger.info(f"Initializing Chunking Strategy: {strategy}")
-    
-    if strategy == "recursive":
-        return RecursiveTokenChunker()
-    elif strategy == "semantic":
+
+    if strategy == "semantic":
         if not embedder:
             logger.warning("Semantic chunking requires embedder, falling back to recursive")
-            return RecursiveTokenChunker()
-        return SemanticChunker(embedder)
-    elif strategy == "sliding":
-        return DefaultDocumentProcessor()
-    else:
+            return _load(*_CHUNKERS["recursive"])()
+        return _load(*_CHUNKERS["semantic"])(embedder)
+    if strategy not in _CHUNKERS:
         logger.warning(f"Unknown chunking strategy '{strategy}', defaulting to sliding window")
-        return DefaultDocumentProcessor()
+        strategy = "sliding"
+    return _load(*_CHUNKERS[strategy])()
+
+def get_file_processor(extension: str, text_processor: Optional[DocumentProcessor] = None) -> Optional[DocumentProcessor]:
+    """
+    Processor for a file format that needs extraction (e.g. ".pdf"), or None
+    for plain text. text_processor, if given, chunks the extracted text.
+    """
+    entry = _FILE_PROCESSORS.get(extension.lower())
+    if entry is None:
+        return None
+    processor = _load(*entry)()
+    if text_processor is not None:
+        processor.text_processor = text_processor
+    return processor
@@ -1,11 +1,24 @@
-from typing import Dict, Optional, List
-from ..core.interfaces import Embedder, VectorStore, Document
-from ..core.models import SearchResult
+import asyncio
+import os
+import tempfile
+import time
+import numpy as np
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional, List, Tuple
+from ..core.interfaces import DocumentProcessor, Embedder, VectorStore, Document
+from ..core.models import Chunk, SearchResult
+from ..core.vector_utils import attach_embeddings, to_matrix, valid_rows
 from ..services.text_processing import DefaultDocumentProcessor
-from ..services.pdf_processing import PDFProcessor
-from ..services.processor_factory import get_document_processor
-from ..services.token_utils import truncate_context
+from ..services.processor_factory import get_document_processor, get_file_processor
+from ..services.token_utils import get_encoding
+from ..services.token_utils import fill_token_counts
+from ..services.context_packer import ContextPacker
+from ..services.search_cache import SearchCache
+from ..services.ingest_pipeline import (
+    IngestPipeline, copy_canonical_embeddings, discover_files, extract_archive, find_duplicates
+)
 from ..infra.llm_client import get_embedder
+from ..infra.simhash_index import SimHashIndex
+from ..infra.document_registry import DocumentRegistry
 from ..infra.llm_generation import get_llm_generator, LLMGenerator
 # from ..infra.vector_store import _vector_store_instance  <-- Removed this invalid import
 from ..config import get_settings
@@ -15,55 +28,119 @@ _vector_store_instance = None
 _embedder_instance = None
 _llm_instance = None
 _text_processor = None
-_pdf_processor = PDFProcessor() 
+_search_cache = None
+_dedup_index = None
+_document_registry = None
+_file_processors: Dict[str, Optional[DocumentProcessor]] = {}  # extension -> processor, created on first file
+_startup_report: Dict[str, float] = {}  # component -> seconds spent creating it
+
+ANSWER_SYSTEM_PROMPT = "You are a helpful RAG assistant. Answer the question based ONLY on the provided context. If the answer is not in the context, say so."
 
 def get_rag_service():
-    global _embedder_instance, _vector_store_instance, _text_processor, _llm_instance
+    global _embedder_instance, _vector_store_instance, _text_processor, _llm_instance, _search_cache, _dedup_index, \
+        _document_registry
+    settings = get_settings()
     
     if _embedder_instance is None:
-        _embedder_instance = get_embedder()
+        _embedder_instance = _timed("embedder", get_embedder)
         
     if _llm_instance is None:
-        _llm_instance = get_llm_generator()
+        _llm_instance = _timed("llm", get_llm_generator)
         
     if _vector_store_instance is None:
         from ..infra.factory import get_vector_store
-        _vector_store_instance = get_vector_store()
+        _vector_store_instance = _timed("vector_store", get_vector_store)
         
     if _text_processor is None:
         # Pass embedder to factory for semantic chunking support
-        _text_processor = get_document_processor(_embedder_instance)
-        # Also need to make sure PDF processor uses the configured text strategy?
-        # Typically PDF extracts text then chunks it. 
-        # Our PDFProcessor currently hardcodes DefaultDocumentProcessor.
-        # Let's inject the dynamic one into PDFProcessor if possible or rely on RAGService to pass it
-        _pdf_processor.text_processor = _text_processor # HACK: Direct injection to reusing simple wrapper
+        _text_processor = _timed("text_processor", lambda: get_document_processor(_embedder_instance))
+
+    if _search_cache is None and settings.SEARCH_CACHE_ENABLED:
+        _search_cache = SearchCache(
+            ttl=settings.SEARCH_CACHE_TTL_SECONDS,
+            max_items=settings.SEARCH_CACHE_MAX_ITEMS
+        )
+
+    if _dedup_index is None and settings.DEDUP_ENABLED:
+        # Fingerprints must not outlive the chunks they point at
+        _dedup_index = _timed("dedup_index", lambda: SimHashIndex(
+            db_path=os.path.join(settings.STORAGE_DIR, "dedup.sqlite3") if _vector_store_instance.persistent else None,
+            max_distance=settings.DEDUP_MAX_HAMMING_DISTANCE,
+            min_tokens=settings.DEDUP_MIN_TOKENS
+        ))
+
+    if _document_registry is None:
+        _document_registry = _timed("document_registry", lambda: DocumentRegistry(
+            db_path=os.path.join(settings.STORAGE_DIR, "documents.sqlite3") if _vector_store_instance.persistent else None
+        ))
 
     return RAGService(
         text_processor=_text_processor,
-        pdf_processor=_pdf_processor,
+        file_processors=_file_processors,
         embedder=_embedder_instance,
         vector_store=_vector_store_instance,
-        llm=_llm_instance
+        llm=_llm_instance,
+        search_cache=_search_cache,
+        dedup_index=_dedup_index,
+        document_registry=_document_registry
     )
 
+def _timed(component: str, factory):
+    started = time.perf_counter()
+    instance = factory()
+    _startup_report[component] = round(time.perf_counter() - started, 4)
+    return instance
+
+async def warm_up() -> Dict[str, float]:
+    """
+    Create the configured components and open backend connections ahead of
+    the first request. Returns seconds spent per component.
+    """
+    service = get_rag_service()
+    if "tokenizer" not in _startup_report:
+        _timed("tokenizer", get_encoding)
+    started = time.perf_counter()
+    await service.vector_store.warm_up()
+    _startup_report["vector_store_connect"] = round(time.perf_counter() - started, 4)
+    return dict(_startup_report)
+
+def reciprocal_rank_fusion(rankings: List[List[SearchResult]], k: int = 60, limit: int = 5) -> List[SearchResult]:
+    """Combine ranked lists by sum(1 / (k + rank)); result scores are the fused scores."""
+    fused: Dict[str, float] = {}
+    by_id: Dict[str, SearchResult] = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, start=1):
+            fused[result.chunk_id] = fused.get(result.chunk_id, 0.0) + 1.0 / (k + rank)
+            by_id.setdefault(result.chunk_id, result)
+    top = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return [by_id[cid].model_copy(update={"score": fused[cid]}) for cid in top]
+
 class RAGService:
-    def __init__(self, text_processor: DefaultDocumentProcessor, pdf_processor: PDFProcessor, embedder: Embedder, vector_store: VectorStore, llm: LLMGenerator):
+    def __init__(self, text_processor: DefaultDocumentProcessor, file_processors: Dict[str, Optional[DocumentProcessor]], embedder: Embedder, vector_store: VectorStore, llm: LLMGenerator, search_cache: Optional[SearchCache] = None,
+                 dedup_index: Optional[SimHashIndex] = None, document_registry: Optional[DocumentRegistry] = None):
         self.text_processor = text_processor
-        self.pdf_processor = pdf_processor
+        self.file_processors = file_processors
         self.embedder = embedder
         self.vector_store = vector_store
         self.llm = llm
+        self.search_cache = search_cache
+        self.dedup_index = dedup_index
+        self.document_registry = document_registry
 
-    async def ingest_file(self, file_path: str, metadata: dict = {}) -> Dict[str, str]:
+    async def ingest_file(self, file_path: str, metadata: dict = {}, filename: Optional[str] = None) -> Dict[str, str]:
         if not os.path.exists(file_path):
              return {"status": "error", "message": f"File not found: {file_path}"}
              
-        filename = os.path.basename(file_path)
-        ext = os.path.splitext(filename)[1].lower()
+        filename = os.path.basename(filename or file_path)
+        ext = os.path.splitext(file_path)[1].lower()
         
-        if ext == ".pdf":
-            chunks = await self.pdf_processor.process(file_path, filename, metadata)
+        if ext not in self.file_processors:
+            # Extraction backends (pymupdf4llm for PDF) load with the first file that needs them
+            self.file_processors[ext] = get_file_processor(ext, self.text_processor)
+        file_processor = self.file_processors[ext]
+
+        if file_processor is not None:
+            chunks = await file_processor.process(file_path, filename, metadata)
         else:
             # Assume text based
             try:
@@ -76,90 +153,344 @@ class RAGService:
         if not chunks:
             return {"status": "error", "message": "No content to process"}
 
-        # 2. Embedding
-        texts = [c.text for c in chunks]
-        embeddings = await self.embedder.embed_documents(texts)
-        
-        for i, chunk in enumerate(chunks):
-            chunk.embedding = embeddings[i]
-
-        # 3. Storage
-        await self.vector_store.add_chunks(chunks)
+        duplicates = await self._embed_and_store(chunks)
         
         return {
             "status": "success",
             "document_id": chunks[0].document_id,
             "chunks_count": str(len(chunks)),
+            "duplicates_skipped": str(duplicates),
             "filename": filename
         }
 
+    async def ingest_directory(self, directory: str, metadata: dict = {}, recursive: bool = True) -> dict:
+        """Bulk-ingest every supported file under a directory through the staged pipeline."""
+        if not os.path.isdir(directory):
+            return {"status": "error", "message": f"Directory not found: {directory}"}
+
+        loop = asyncio.get_event_loop()
+        paths = await loop.run_in_executor(None, discover_files, directory, recursive)
+        if not paths:
+            return {"status": "error", "message": f"No supported files in {directory}"}
+
+        files = [
+            (path, os.path.basename(path), {**metadata, "source_path": os.path.relpath(path, directory)})
+            for path in paths
+        ]
+        pipeline = IngestPipeline(self.text_processor, self.embedder, self.vector_store, self.dedup_index,
+                                  self.document_registry)
+        return await pipeline.run(files)
+
+    async def ingest_archive(self, archive_path: str, metadata: dict = {}) -> dict:
+        """Unpack a .zip/.tar(.gz) archive to a temporary directory and bulk-ingest it."""
+        if not os.path.exists(archive_path):
+            return {"status": "error", "message": f"File not found: {archive_path}"}
+
+        loop = asyncio.get_event_loop()
+        with tempfile.TemporaryDirectory(prefix="rag_ingest_") as workdir:
+            try:
+                await loop.run_in_executor(None, extract_archive, archive_path, workdir)
+            except Exception as e:
+                return {"status": "error", "message": f"Failed to unpack archive: {e}"}
+            return await self.ingest_directory(
+                workdir, {**metadata, "source_archive": os.path.basename(archive_path)}
+            )
+
     async def ingest_document(self, content: str, filename: str, metadata: dict = {}) -> Dict[str, str]:
         # Legacy method for direct text string
         chunks = await self.text_processor.process(content, filename, metadata)
         if not chunks:
             return {"status": "error", "message": "No content to process"}
 
-        # 2. Embedding
-        texts = [c.text for c in chunks]
-        embeddings = await self.embedder.embed_documents(texts)
+        duplicates = await self._embed_and_store(chunks)
         
-        for i, chunk in enumerate(chunks):
-            chunk.embedding = embeddings[i]
+        return {
+            "status": "success",
+            "document_id": chunks[0].document_id,
+            "chunks_count": str(len(chunks)),
+            "duplicates_skipped": str(duplicates)
+        }
 
-        # 3. Storage
-        await self.vector_store.add_chunks(chunks)
-        
+    async def ingest_chunks(self, chunks: List[Chunk],
+                            progress: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict[str, str]:
+        """Embed and store one document chunked elsewhere (ingestion jobs chunk out of process)."""
+        duplicates = await self._embed_and_store(chunks, progress=progress)
         return {
             "status": "success",
             "document_id": chunks[0].document_id,
-            "chunks_count": str(len(chunks))
+            "chunks_count": str(len(chunks)),
+            "duplicates_skipped": str(duplicates),
+            "filename": chunks[0].metadata.filename
         }
 
-    async def search(self, query: str, limit: int = 5) -> List[SearchResult]:
-        query_embedding = await self.embedder.embed_query(query)
-        results = await self.vector_store.search(query_embedding, limit=limit)
-        
-        # Score Thresholding
+    async def _embed_and_store(self, chunks: List[Chunk], register: bool = True,
+                               progress: Optional[Callable[[str], Awaitable[None]]] = None) -> int:
+        """
+        Embed and store freshly chunked text. Near-duplicates of chunks
+        already in the index are stored with their canonical chunk's vector
+        instead of being embedded. Returns the number of embeddings skipped.
+        register=False is for chunks of documents already in the registry.
+        progress, if given, is awaited with "embedding" and "storing".
+        """
+        fill_token_counts(chunks)
+        to_embed = chunks
+
+        duplicates, fingerprints = [], {}
+        if self.dedup_index is not None:
+            to_embed, duplicates, fingerprints = await find_duplicates(self.dedup_index, self.vector_store, chunks)
+
+        if to_embed:
+            # 2. Embedding
+            if progress:
+                await progress("embedding")
+            texts = [c.text for c in to_embed]
+            embeddings = await self.embedder.embed_documents(texts)
+            attach_embeddings(to_embed, embeddings)
+        copy_canonical_embeddings(to_embed, duplicates)
+
+        # 3. Storage
+        if progress:
+            await progress("storing")
+        await self.vector_store.add_chunks(chunks)
+
+        if self.dedup_index is not None:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.dedup_index.add, chunks, fingerprints, duplicates)
+        if register and self.document_registry is not None:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.document_registry.add, chunks)
+        return len(duplicates)
+
+    async def _embed_query(self, query: str) -> np.ndarray:
+        if self.search_cache is None:
+            return await self.embedder.embed_query(query)
+        embedding = self.search_cache.get_embedding(query)
+        if embedding is None:
+            embedding = await self.embedder.embed_query(query)
+            self.search_cache.put_embedding(query, embedding)
+        return embedding
+
+    async def search(self, query: str, limit: int = 5, filters: Optional[dict] = None,
+                     search_params: Optional[dict] = None, mode: Optional[str] = None,
+                     with_embeddings: bool = False) -> List[SearchResult]:
+        """
+        search_params carries backend-specific knobs (e.g. FAISS nprobe/ef_search).
+        mode is "vector" or "hybrid"; defaults to SEARCH_MODE.
+        with_embeddings attaches stored vectors to the results (used by context packing).
+        """
         settings = get_settings()
-        filtered_results = [
-            r for r in results 
-            if r.score >= settings.MIN_SCORE_THRESHOLD
-        ]
+        mode = (mode or settings.SEARCH_MODE).lower()
+        hybrid = mode == "hybrid" and hasattr(self.vector_store, "lexical_search")
+        query_embedding = await self._embed_query(query)
+
+        cache_key = None
+        if self.search_cache is not None:
+            cache_key = self._result_key(query, query_embedding, limit, filters, search_params, hybrid, with_embeddings)
+            cached = self.search_cache.get_results(cache_key)
+            if cached is not None:
+                return cached
+
+        if hybrid:
+            filtered_results = await self._hybrid_search(query, query_embedding, limit, filters, search_params, with_embeddings)
+        else:
+            results = await self.vector_store.search(query_embedding, limit=limit, filters=filters,
+                                                     with_embeddings=with_embeddings, **(search_params or {}))
+
+            # Score Thresholding
+            filtered_results = [
+                r for r in results 
+                if r.score >= settings.MIN_SCORE_THRESHOLD
+            ]
+        if cache_key is not None:
+            self.search_cache.put_results(cache_key, filtered_results)
         return filtered_results
 
+    def _result_key(self, query: str, query_embedding: np.ndarray, limit: int, filters: Optional[dict],
+                    search_params: Optional[dict], hybrid: bool, with_embeddings: bool) -> tuple:
+        key_params = dict(search_params or {})
+        if hybrid:
+            key_params["hybrid_query"] = SearchCache.normalize(query)
+        if with_embeddings:
+            key_params["with_embeddings"] = True
+        return SearchCache.result_key(query_embedding, limit, filters, key_params, self.vector_store.generation)
+
+    async def _hybrid_search(self, query: str, query_embedding: np.ndarray, limit: int,
+                             filters: Optional[dict], search_params: Optional[dict],
+                             with_embeddings: bool = False) -> List[SearchResult]:
+        """
+        Fuse vector and BM25 rankings with reciprocal rank fusion. Both run
+        in-process against the same store, so this costs no extra round trips.
+        """
+        settings = get_settings()
+        candidates = max(limit, settings.HYBRID_CANDIDATES)
+        vector_results = await self.vector_store.search(query_embedding, limit=candidates, filters=filters,
+                                                        with_embeddings=with_embeddings, **(search_params or {}))
+        return await self._fuse_lexical(query, vector_results, limit, filters, with_embeddings)
+
+    async def _fuse_lexical(self, query: str, vector_results: List[SearchResult], limit: int,
+                            filters: Optional[dict], with_embeddings: bool) -> List[SearchResult]:
+        settings = get_settings()
+        candidates = max(limit, settings.HYBRID_CANDIDATES)
+        # The similarity threshold only means something for the vector side
+        vector_results = [r for r in vector_results if r.score >= settings.MIN_SCORE_THRESHOLD]
+        lexical_results = await self.vector_store.lexical_search(query, limit=candidates, filters=filters,
+                                                                 with_embeddings=with_embeddings)
+        return reciprocal_rank_fusion([vector_results, lexical_results], k=settings.RRF_K, limit=limit)
+
+    async def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """(Q, dim) query embeddings; the uncached ones go out in a single embed_documents call."""
+        embeddings: List[Optional[np.ndarray]] = [None] * len(queries)
+        if self.search_cache is not None:
+            embeddings = [self.search_cache.get_embedding(q) for q in queries]
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if missing:
+            fresh = await self.embedder.embed_documents([queries[i] for i in missing])
+            ok = valid_rows(fresh)
+            for j, i in enumerate(missing):
+                if ok[j]:
+                    embeddings[i] = fresh[j]
+                    if self.search_cache is not None:
+                        self.search_cache.put_embedding(queries[i], fresh[j])
+        return to_matrix(embeddings)
+
+    async def search_many(self, queries: List[str], limit: int = 5, filters: Optional[dict] = None,
+                          search_params: Optional[dict] = None, mode: Optional[str] = None,
+                          with_embeddings: bool = False) -> List[List[SearchResult]]:
+        """
+        search() for a batch of queries, results in query order. Queries are
+        embedded together and scored with one vector_store.search_batch call
+        (a single matrix product in the in-memory store). Queries whose
+        embedding failed get no results.
+        """
+        settings = get_settings()
+        mode = (mode or settings.SEARCH_MODE).lower()
+        hybrid = mode == "hybrid" and hasattr(self.vector_store, "lexical_search")
+        query_embeddings = await self._embed_queries(queries)
+        ok = valid_rows(query_embeddings)
+
+        results: List[Optional[List[SearchResult]]] = [None if ok[i] else [] for i in range(len(queries))]
+        cache_keys: List[Optional[tuple]] = [None] * len(queries)
+        if self.search_cache is not None:
+            for i in np.flatnonzero(ok).tolist():
+                cache_keys[i] = self._result_key(queries[i], query_embeddings[i], limit, filters,
+                                                 search_params, hybrid, with_embeddings)
+                results[i] = self.search_cache.get_results(cache_keys[i])
+
+        pending = [i for i, r in enumerate(results) if r is None]
+        if pending:
+            candidates = max(limit, settings.HYBRID_CANDIDATES) if hybrid else limit
+            batches = await self.vector_store.search_batch(query_embeddings[pending], limit=candidates,
+                                                           filters=filters, with_embeddings=with_embeddings,
+                                                           **(search_params or {}))
+            for i, hits in zip(pending, batches):
+                if hybrid:
+                    hits = await self._fuse_lexical(queries[i], hits, limit, filters, with_embeddings)
+                else:
+                    hits = [r for r in hits if r.score >= settings.MIN_SCORE_THRESHOLD]
+                results[i] = hits
+                if cache_keys[i] is not None:
+                    self.search_cache.put_results(cache_keys[i], hits)
+        return results
+
     async def delete_document(self, document_id: str):
-        await self.vector_store.delete_document(document_id)
+        loop = asyncio.get_event_loop()
+        chunk_ids = None
+        if self.document_registry is not None:
+            registered = await loop.run_in_executor(None, self.document_registry.get, document_id)
+            if registered is not None:
+                chunk_ids = [chunk_id for chunk_id, _, _ in registered[1]]
+        await self.vector_store.delete_document(document_id, chunk_ids=chunk_ids)
+        if self.document_registry is not None:
+            await loop.run_in_executor(None, self.document_registry.remove, document_id)
+        if self.dedup_index is not None:
+            orphans = await loop.run_in_executor(None, self.dedup_index.remove_document, document_id)
+            if orphans:
+                # Their canonical copies are gone; the duplicates now stand on their own
+                await self._embed_and_store(orphans, register=False)
+
+    def stats(self) -> dict:
+        """Runtime counters from components that expose them."""
+        stats = {}
+        if hasattr(self.embedder, "stats"):
+            stats["embedding_cache"] = self.embedder.stats()
+        if self.search_cache is not None:
+            stats["search_cache"] = self.search_cache.stats()
+        if self.dedup_index is not None:
+            stats["dedup"] = self.dedup_index.stats()
+        if self.document_registry is not None:
+            stats["documents"] = self.document_registry.count()
+        if _startup_report:
+            stats["startup_seconds"] = dict(_startup_report)
+        return stats
         
     async def get_document(self, document_id: str) -> Optional[Document]:
-        return await self.vector_store.get_document(document_id)
+        registered = None
+        if self.document_registry is not None:
+            loop = asyncio.get_event_loop()
+            registered = await loop.run_in_executor(None, self.document_registry.get, document_id)
+        texts = None
+        if registered is not None:
+            texts = await self.vector_store.get_chunk_texts([chunk_id for chunk_id, _, _ in registered[1]])
+        if texts is None:
+            # Unregistered (ingested before the registry) or no by-id lookup in this store
+            return await self.vector_store.get_document(document_id)
 
-    async def ask_question(self, query: str) -> str:
-        # 1. Search for relevant context
-        results = await self.search(query, limit=10)
-        
-        if not results:
-             return "I couldn't find any relevant information in the documents to answer your question."
-        
-        # 2. Context Construction & Truncation
+        metadata, entries = registered
+        if self.dedup_index is not None and len(texts) < len(entries):
+            texts.update(await loop.run_in_executor(None, self.dedup_index.duplicate_texts, document_id))
+        return Document(id=document_id, content=DocumentRegistry.assemble(entries, texts), metadata=metadata)
+
+    async def _build_prompt(self, query: str) -> Tuple[List[SearchResult], Optional[str], Optional[str]]:
+        """
+        Retrieve context for a question.
+        Returns (sources used, user prompt, None) or ([], None, fallback answer).
+        """
         settings = get_settings()
+
+        # 1. Search for relevant context (more candidates than fit, so the
+        # packer has something to choose from)
+        results = await self.search(query, limit=settings.CONTEXT_CANDIDATES, with_embeddings=True)
         
-        # Extract text snippets
-        snippets = [f"Source ({r.metadata.get('filename')}): {r.text}" for r in results]
+        if not results:
+             return [], None, "I couldn't find any relevant information in the documents to answer your question."
         
-        # Truncate to fit context window
-        valid_snippets = truncate_context(
-            snippets, 
+        # 2. Context assembly: de-duplicate and fill the token budget
+        packer = ContextPacker(
             max_tokens=settings.MAX_CONTEXT_TOKENS,
-            model=settings.LLM_MODEL
+            model=settings.LLM_MODEL,
+            mmr_lambda=settings.CONTEXT_MMR_LAMBDA,
+            dedup_threshold=settings.CONTEXT_DEDUP_THRESHOLD,
+            trim_sentences=settings.CONTEXT_TRIM_SENTENCES,
+            trim_min_tokens=settings.CONTEXT_TRIM_MIN_TOKENS
         )
+        packed = packer.pack(query, results)
         
-        if not valid_snippets:
-             return "I found some documents, but they are too large to process."
+        if not packed:
+             return [], None, "I found some documents, but they are too large to process."
 
+        valid_snippets = [ContextPacker.prefix(r) + text for r, text in packed]
         context_str = "\n\n".join(valid_snippets)
-            
-        system_prompt = "You are a helpful RAG assistant. Answer the question based ONLY on the provided context. If the answer is not in the context, say so."
         user_prompt = f"Context:\n{context_str}\n\nQuestion: {query}"
+        return [r for r, _ in packed], user_prompt, None
+
+    async def ask_question(self, query: str) -> str:
+        _, user_prompt, fallback = await self._build_prompt(query)
+        if user_prompt is None:
+            return fallback
         
         # 3. Generate Answer
-        return await self.llm.generate_response(user_prompt, system_prompt)
+        return await self.llm.generate_response(user_prompt, ANSWER_SYSTEM_PROMPT)
+
+    async def ask_question_stream(self, query: str) -> AsyncGenerator[Tuple[str, Any], None]:
+        """
+        Streaming ask_question. Yields ("sources", [SearchResult]) as soon as
+        retrieval finishes, then ("token", str) per generated delta.
+        """
+        sources, user_prompt, fallback = await self._build_prompt(query)
+        yield "sources", sources
+        if user_prompt is None:
+            yield "token", fallback
+            return
+
+        async for delta in self.llm.generate_stream(user_prompt, ANSWER_SYSTEM_PROMPT):
+            yield "token", delta
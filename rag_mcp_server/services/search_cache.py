@@ -0,0 +1,103 @@
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+import numpy as np
+from ..core.models import SearchResult
+
+class TTLCache:
+    """Small LRU whose entries also expire after ttl seconds."""
+    def __init__(self, ttl: float, max_items: int):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SearchCache:
+    """
+    Two-level cache for RAGService.search:
+      1. normalized query text -> query embedding
+      2. (embedding hash, limit, filters, params, index generation) -> results
+    Results are keyed on the vector store's generation counter, so any
+    add_chunks/delete_document makes earlier entries unreachable.
+    """
+    def __init__(self, ttl: float = 300, max_items: int = 1024):
+        self.embeddings = TTLCache(ttl, max_items)
+        self.results = TTLCache(ttl, max_items)
+        self.embedding_hits = 0
+        self.result_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(unicodedata.normalize("NFKC", query).split())
+
+    @staticmethod
+    def result_key(embedding: np.ndarray, limit: int, filters: Optional[dict],
+                   search_params: Optional[dict], generation: int) -> tuple:
+        digest = hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+        return (
+            digest,
+            limit,
+            json.dumps(filters or {}, sort_keys=True, default=str),
+            json.dumps(search_params or {}, sort_keys=True, default=str),
+            generation,
+        )
+
+    def get_embedding(self, query: str) -> Optional[np.ndarray]:
+        embedding = self.embeddings.get(self.normalize(query))
+        if embedding is not None:
+            self.embedding_hits += 1
+        return embedding
+
+    def put_embedding(self, query: str, embedding: np.ndarray):
+        if len(embedding):
+            self.embeddings.put(self.normalize(query), embedding)
+
+    def get_results(self, key: tuple) -> Optional[List[SearchResult]]:
+        results = self.results.get(key)
+        if results is None:
+            self.misses += 1
+            return None
+        self.result_hits += 1
+        return list(results)
+
+    def put_results(self, key: tuple, results: List[SearchResult]):
+        self.results.put(key, list(results))
+
+    def stats(self) -> dict:
+        lookups = self.result_hits + self.misses
+        return {
+            "embedding_hits": self.embedding_hits,
+            "result_hits": self.result_hits,
+            "misses": self.misses,
+            "hit_rate": self.result_hits / lookups if lookups else 0.0,
+            "embeddings_cached": len(self.embeddings),
+            "results_cached": len(self.results),
+        }
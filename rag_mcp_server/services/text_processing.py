@@ -40,9 +40,11 @@ class DefaultDocumentProcessor(DocumentProcessor):
                 id=chunk_id,
                 document_id=doc_id,
                 text=chunk_text,
+                char_start=start,
+                char_end=start + len(chunk_text),
                 metadata=DocumentMetadata(
                     filename=filename,
-                    extra=metadata
+                    extra={**metadata, "chunk_index": len(chunks)}
                 )
             ))
             
@@ -1,28 +1,27 @@
 import tiktoken
+from functools import lru_cache
 from typing import List
 from ..config import get_settings
+from ..core.models import Chunk
 
-def truncate_context(texts: List[str], max_tokens: int, model: str = "gpt-4") -> List[str]:
-    """
-    Truncates a list of text strings so that their combined token count 
-    does not exceed max_tokens. Preserves the order (assuming ranked by relevance).
-    """
+@lru_cache(maxsize=8)
+def get_encoding(model: str = "gpt-4") -> tiktoken.Encoding:
+    """Encoder for a model, resolved once per process."""
     try:
-        encoding = tiktoken.encoding_for_model(model)
+        return tiktoken.encoding_for_model(model)
     except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
-        
-    current_tokens = 0
-    selected_texts = []
-    
-    for text in texts:
-        tokens = len(encoding.encode(text))
-        if current_tokens + tokens > max_tokens:
-            # We could try to partially take this chunk, but for RAG it's often safer to drop
-            # or we could attempt to split. For simplicity, we stop here.
-            break
-            
-        selected_texts.append(text)
-        current_tokens += tokens
-        
-    return selected_texts
+        return tiktoken.get_encoding("cl100k_base")
+
+@lru_cache(maxsize=4096)
+def count_scaffold_tokens(text: str, model: str = "gpt-4") -> int:
+    """Token count of small, repeated prompt pieces (prefixes, separators)."""
+    return len(get_encoding(model).encode_ordinary(text))
+
+def fill_token_counts(chunks: List[Chunk]):
+    """Set token_count on chunks whose processor did not (cl100k, like the chunkers)."""
+    missing = [c for c in chunks if c.token_count is None]
+    if not missing:
+        return
+    encoding = tiktoken.get_encoding("cl100k_base")
+    for chunk, tokens in zip(missing, encoding.encode_ordinary_batch([c.text for c in missing])):
+        chunk.token_count = len(tokens)
@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import AsyncIterator, Optional
+from ..config import get_settings
+from ..infra.upload_store import UploadStore
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Multipart boundaries and part headers on top of the file itself
+_MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+_upload_store = None
+
+
+def get_upload_store() -> UploadStore:
+    global _upload_store
+    if _upload_store is None:
+        _upload_store = UploadStore(os.path.join(get_settings().STORAGE_DIR, "uploads"))
+    return _upload_store
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class _FilePart:
+    """python-multipart callbacks that keep the single file part's bytes in a buffer the caller drains."""
+    def __init__(self):
+        self.filename: Optional[str] = None
+        self.buffer = bytearray()
+        self.complete = False
+        self._in_file = False
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"filename" not in options:
+            return  # plain form fields are ignored
+        if self.filename is not None:
+            raise ValueError("Only one file per upload")
+        self.filename = options[b"filename"].decode("utf-8", "replace")
+        self._in_file = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self.buffer += data[start:end]
+
+    def on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self.complete = True
+
+
+def _write(f, digest, block: bytes):
+    f.write(block)
+    digest.update(block)
+
+
+async def receive_upload(stream: AsyncIterator[bytes], content_type: str, content_length: Optional[int] = None,
+                         store: Optional[UploadStore] = None) -> dict:
+    """
+    Parse a multipart/form-data body as it arrives and write its file part
+    to the upload store in UPLOAD_CHUNK_BYTES blocks, hashing (SHA-256) as it
+    goes. At most one block is held in memory, and the upload is refused
+    (UploadTooLarge) as soon as it passes UPLOAD_MAX_BYTES, before anything
+    is read if the declared length already does. Returns the store's record.
+    """
+    settings = get_settings()
+    store = store or get_upload_store()
+    max_bytes, block_bytes = settings.UPLOAD_MAX_BYTES, max(1, settings.UPLOAD_CHUNK_BYTES)
+    if max_bytes and content_length is not None and content_length > max_bytes + _MULTIPART_OVERHEAD_BYTES:
+        raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+
+    _, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise ValueError("Expected multipart/form-data with a boundary")
+
+    part = _FilePart()
+    parser = MultipartParser(boundary, part.callbacks())
+    digest = hashlib.sha256()
+    size = 0
+    loop = asyncio.get_event_loop()
+    path = await loop.run_in_executor(None, store.new_file)
+    try:
+        with open(path, "wb") as f:
+            async for data in stream:
+                parser.write(data)
+                if max_bytes and size + len(part.buffer) > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+                while len(part.buffer) >= block_bytes:
+                    block = bytes(part.buffer[:block_bytes])
+                    del part.buffer[:block_bytes]
+                    size += len(block)
+                    await loop.run_in_executor(None, _write, f, digest, block)
+            parser.finalize()
+            if part.filename is None:
+                raise ValueError("No file in upload")
+            if not part.complete:
+                raise ValueError("Upload ended before the file did")
+            if part.buffer:
+                size += len(part.buffer)
+                await loop.run_in_executor(None, _write, f, digest, bytes(part.buffer))
+    except BaseException:
+        os.remove(path)
+        raise
+    return await loop.run_in_executor(None, store.commit, path, part.filename, digest.hexdigest(), size)
@@ -25,9 +25,16 @@ export default function Ingest() {
                 body: formData
             });
 
-            if (!uploadRes.ok) throw new Error("Upload failed");
+            if (!uploadRes.ok) {
+                const { error } = await uploadRes.json().catch(() => ({}));
+                throw new Error(error || "Upload failed");
+            }
 
-            const { file_path } = await uploadRes.json();
+            const { file_path, filename, indexed } = await uploadRes.json();
+            if (indexed && indexed.status === "succeeded") {
+                addLog(`✅ Already indexed: Doc ID ${indexed.result.document_id} (${indexed.result.chunks_count} chunks)`);
+                return;
+            }
             addLog(`File uploaded to ${file_path}. Starting ingestion...`);
 
             // 2. Call Ingest Tool
@@ -38,6 +45,7 @@ export default function Ingest() {
                     name: "ingest_file",
                     arguments: {
                         file_path,
+                        filename,
                         metadata: { source: "web-ui" }
                     }
                 })
@@ -48,8 +56,31 @@ export default function Ingest() {
             if (ingestData.isError) {
                 addLog(`Ingestion Error: ${JSON.stringify(ingestData)}`);
             } else {
-                const result = JSON.parse(ingestData.content[0].text);
-                addLog(`✅ Success! Doc ID: ${result.document_id} (${result.chunks_count} chunks)`);
+                const job = JSON.parse(ingestData.content[0].text);
+                if (job.status === "error") throw new Error(job.message);
+
+                // 3. Poll the job until it finishes
+                let finished = job;
+                let lastStage = null;
+                while (finished.status === "queued" || finished.status === "running") {
+                    if (finished.stage !== lastStage) {
+                        addLog(`Job ${finished.job_id}: ${finished.stage}...`);
+                        lastStage = finished.stage;
+                    }
+                    await new Promise(resolve => setTimeout(resolve, 1000));
+                    const jobRes = await fetch(`${API_BASE}/resources/read?uri=${encodeURIComponent(job.uri)}`);
+                    if (!jobRes.ok) throw new Error("Job status unavailable");
+                    finished = JSON.parse((await jobRes.json()).contents[0].text);
+                }
+
+                if (finished.status === "failed") {
+                    addLog(`Ingestion Error: ${finished.error}`);
+                } else if (finished.status === "duplicate") {
+                    addLog(`✅ Already indexed (job ${finished.duplicate_of})${finished.result ? `: Doc ID ${finished.result.document_id}` : ""}`);
+                } else {
+                    const result = finished.result;
+                    addLog(`✅ Success! Doc ID: ${result.document_id} (${result.chunks_count} chunks)`);
+                }
             }
 
         } catch (err) {